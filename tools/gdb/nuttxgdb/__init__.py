@@ -56,7 +56,7 @@ def register_commands(event):
         for c in module.__dict__.values():
             if isinstance(c, type) and issubclass(c, gdb.Command):
                 try:
-                    c()
+                    utils.g_commands[c] = c()
                 except Exception as e:
                     gdb.write(f"\x1b[31;1mIgnore command: {c}, e: {e}\n\x1b[m")
 
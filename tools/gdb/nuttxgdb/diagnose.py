@@ -19,12 +19,62 @@
 ############################################################################
 
 import argparse
+import time
+from functools import cached_property
 
 import gdb
 
 from . import utils
 
 
+def target_state():
+    """Return the key of the target state the diagnostics are run against, it
+    changes when target runs, memory or registers are written, or another
+    target (core file, connection) is loaded"""
+    return utils.stop_generation(), utils.target_identity()
+
+
+class DiagnoseSnapshot:
+    """Target state shared by all the diagnostics of one report.
+    Each part is read from target on first access, so a diagnostic only pays
+    for what it uses and the others reuse it for free.
+    """
+
+    def __init__(self):
+        self.state = target_state()
+
+    @cached_property
+    def tcbs(self):
+        return utils.get_tcbs()
+
+    @cached_property
+    def heap_nodes(self):
+        from .memdump import mm_foreach
+
+        return list(mm_foreach(utils.parse_and_eval("g_mmheap")))
+
+    @cached_property
+    def inodes(self):
+        from .fs import get_inode_index
+
+        return get_inode_index()
+
+    @cached_property
+    def iob(self):
+        """The IOB semaphore counts, None if not available"""
+        try:
+            nfree = int(utils.parse_and_eval("g_iob_sem")["semcount"])
+            nthrottle = (
+                int(utils.parse_and_eval("g_throttle_sem")["semcount"])
+                if utils.get_symbol_value("CONFIG_IOB_THROTTLE") > 0
+                else 0
+            )
+        except gdb.error:
+            return None
+
+        return {"nfree": nfree, "nthrottle": nthrottle}
+
+
 class DiagnosePrefix(gdb.Command):
     """Diagnostic related commands."""
 
@@ -33,10 +83,35 @@ class DiagnosePrefix(gdb.Command):
 
 
 class DiagnoseReport(gdb.Command):
-    """Run diagnostics to generate reports."""
+    """Run diagnostics to generate reports.
+    Results are reused if the target state has not changed since last report,
+    use -f to rerun. Reuse is for the whole report, not per diagnostic: any
+    change of the target state reruns all of them, since a diagnostic may read
+    any part of the target.
+    """
 
     def __init__(self):
         super().__init__("diagnose report", gdb.COMMAND_USER)
+        self.snapshot = None
+        self.results = {}  # Command name -> (target state, result)
+
+    def run(self, name, command):
+        try:
+            result = command.diagnose(snapshot=self.snapshot)
+        except gdb.error as e:
+            result = {
+                "title": f"Command {name} failed",
+                "summary": "Command execution failed",
+                "result": "info",
+                "command": name,
+                "message": str(e),
+            }
+
+            gdb.write(f"Failed: {e}\n")
+
+        if result is not None:
+            result.setdefault("command", name)
+        return result
 
     def invoke(self, args, from_tty):
         parser = argparse.ArgumentParser(description=self.__doc__)
@@ -46,6 +121,18 @@ class DiagnoseReport(gdb.Command):
             type=str,
             help="report output file name",
         )
+        parser.add_argument(
+            "-c",
+            "--command",
+            action="append",
+            help="only run the specified diagnostic, can be repeated",
+        )
+        parser.add_argument(
+            "-f",
+            "--force",
+            action="store_true",
+            help="rerun all diagnostics even if target state is unchanged",
+        )
 
         try:
             args = parser.parse_args(gdb.string_to_argv(args))
@@ -64,28 +151,35 @@ class DiagnoseReport(gdb.Command):
 
         commands = utils.gather_gdbcommands(modules=modules)
 
+        state = target_state()
+        if args.force or not self.snapshot or self.snapshot.state != state:
+            self.snapshot = DiagnoseSnapshot()
+
         results = []
+        start = time.time()
         for clz in commands:
-            if hasattr(clz, "diagnose"):
-                command = clz()
-                name = clz.__name__.lower()
+            if not hasattr(clz, "diagnose"):
+                continue
+
+            name = clz.__name__.lower()
+            if args.command and name not in args.command:
+                continue
+
+            cached = self.results.get(name)
+            if not args.force and cached and cached[0] == state:
+                gdb.write(f"Reuse result: {name}\n")
+                result = cached[1]
+            else:
                 gdb.write(f"Run command: {name}\n")
-                try:
-                    result = command.diagnose()
-                except gdb.error as e:
-                    result = {
-                        "title": f"Command {name} failed",
-                        "summary": "Command execution failed",
-                        "result": "info",
-                        "command": name,
-                        "message": str(e),
-                    }
-
-                    gdb.write(f"Failed: {e}\n")
-
-                result.setdefault("command", name)
+                last = time.time()
+                result = self.run(name, utils.get_command(clz))
+                gdb.write(f"Done in {(time.time() - last):.2f} seconds\n")
+                self.results[name] = (state, result)
+
+            if result is not None:
                 results.append(result)
 
+        gdb.write(f"Finished in {(time.time() - start):.2f} seconds\n")
         gdb.write(f"Write report to {reportfile}\n")
         with open(reportfile, "w") as f:
             f.write(utils.jsonify(results, indent=4))
@@ -20,7 +20,8 @@
 
 import argparse
 import enum
-from typing import Generator, Tuple
+from collections import Counter
+from typing import Generator, NamedTuple, Tuple
 
 import gdb
 
@@ -39,7 +40,9 @@ CONFIG_NFILE_DESCRIPTORS_PER_BLOCK = int(
 )
 CONFIG_FS_SHMFS = utils.get_symbol_value("CONFIG_FS_SHMFS")
 
-g_special_inodes = {}  # Map of the special inodes including epoll, inotify, etc.
+g_special_inodes = None  # Address of the special inodes including epoll, inotify, etc.
+g_inode_index = utils.stop_cache()
+g_file_table = utils.stop_cache()
 
 
 class InodeType(enum.Enum):
@@ -70,65 +73,138 @@ class InodeType(enum.Enum):
     UNKNOWN = 12
 
 
-def get_inode_name(inode: Inode):
+def get_special_inodes():
+    """Return the map of special inode address to name"""
+    global g_special_inodes
+    if g_special_inodes is None:
+        g_special_inodes = {}
+        for special in (
+            "perf",
+            "timerfd",
+            "signalfd",
+            "dir",
+            "inotify",
+            "epoll",
+            "eventfd",
+            "sock",
+        ):
+            value = utils.gdb_eval_or_none(f"g_{special}_inode")
+            if value:
+                g_special_inodes[int(value.address)] = special
+
+    return g_special_inodes
+
+
+def inode_gettype(inode: Inode) -> InodeType:
     if not inode:
-        return ""
+        return InodeType.UNKNOWN
 
-    def special_inode_name(inode):
-        global g_special_inodes
-        if not g_special_inodes:
-            g_special_inodes = {}
-            for special in (
-                "perf",
-                "timerfd",
-                "signalfd",
-                "dir",
-                "inotify",
-                "epoll",
-                "eventfd",
-                "sock",
-            ):
-                value = utils.gdb_eval_or_none(f"g_{special}_inode")
-                if value:
-                    g_special_inodes[special] = value.address
-
-        for name, value in g_special_inodes.items():
-            if value == inode:
-                return name
+    return get_inode_index().get(int(inode)).type
 
-        return None
 
-    if name := special_inode_name(inode):
-        return name
+def flags_gettype(flags) -> InodeType:
+    try:
+        return InodeType(int(flags & FSNODEFLAG_TYPE_MASK))
+    except ValueError:
+        return InodeType.UNKNOWN
 
-    ptr = inode.i_name.cast(gdb.lookup_type("char").pointer())
-    return ptr.string()
 
+class InodeInfo(NamedTuple):
+    address: int
+    parent: int
+    peer: int
+    child: int
+    crefs: int
+    flags: int
+    ino: int
+    private: int
+    name: str
+    path: str
+    type: InodeType
+
+    @property
+    def value(self) -> Inode:
+        return utils.Value(self.address).cast("struct inode", ptr=True)
+
+
+class InodeIndex:
+    """Inodes read in one pass from the first inode, its peers and all the
+    descendants, indexed by address in tree order. Inodes referenced out of
+    the tree, e.g. by an opened file, are decoded on demand.
+    """
+
+    def __init__(self, first: int):
+        self.view = utils.view_class("struct inode")
+        self.name_offset = utils.offset_of("struct inode", "i_name")
+        self.special = get_special_inodes()
+
+        self.inodes = {}  # Address -> InodeInfo of the walked tree
+        self.others = {}  # Address -> InodeInfo out of the tree
+        stack = [(first, None)]  # (address, parent path)
+        while stack:
+            address, parentpath = stack.pop()
+            if not address or address in self.inodes:
+                continue
 
-def inode_getpath(inode: Inode):
-    """get path fron inode"""
-    if not inode:
-        return ""
+            info = self.decode(address, parentpath)
+            self.inodes[address] = info
+            stack.append((info.peer, parentpath))
+            stack.append((info.child, info.path))
 
-    name = get_inode_name(inode)
+    def decode(self, address, parentpath=None) -> InodeInfo:
+        inode = self.view(address)
+        name = self.special.get(address) or utils.read_cstring(
+            address + self.name_offset
+        )
+        if parentpath is None and inode.i_parent:
+            parentpath = self.get(inode.i_parent).path
+
+        path = name if parentpath is None else parentpath + "/" + name
+        return InodeInfo(
+            address,
+            inode.i_parent,
+            inode.i_peer,
+            inode.i_child,
+            inode.i_crefs,
+            inode.i_flags,
+            inode.i_ino,
+            inode.i_private,
+            name,
+            path,
+            flags_gettype(inode.i_flags),
+        )
 
-    if inode.i_parent:
-        return inode_getpath(inode.i_parent) + "/" + name
+    def get(self, address: int) -> InodeInfo:
+        if address in self.inodes:
+            return self.inodes[address]
 
-    return name
+        if address not in self.others:
+            self.others[address] = self.decode(address)
 
+        return self.others[address]
 
-def inode_gettype(inode: Inode) -> InodeType:
+
+def get_inode_index() -> InodeIndex:
+    """Return the index of the whole inode tree, read once per stop"""
+    if "root" not in g_inode_index:
+        g_inode_index["root"] = InodeIndex(int(utils.parse_and_eval("g_root_inode")))
+
+    return g_inode_index["root"]
+
+
+def get_inode_name(inode: Inode):
     if not inode:
-        return InodeType.UNKNOWN
+        return ""
 
-    type = int(inode.i_flags & FSNODEFLAG_TYPE_MASK)
+    return get_inode_index().get(int(inode)).name
 
-    # check if it's a valid type in InodeType
-    if type in [e.value for e in InodeType]:
-        return InodeType(type)
 
-    return InodeType.UNKNOWN
+def inode_getpath(inode: Inode):
+    """get path fron inode"""
+    if not inode:
+        return ""
+
+    return get_inode_index().get(int(inode)).path
 
 
 def get_file(tcb: Tcb, fd):
@@ -146,14 +222,16 @@ def get_file(tcb: Tcb, fd):
     return fl_files[row][col]
 
 
-def foreach_inode(root=None, path="") -> Generator[Tuple[Inode, str], None, None]:
-    node: Inode = root or utils.parse_and_eval("g_root_inode").i_child
-    while node:
-        newpath = path + "/" + get_inode_name(node)
-        yield node, newpath
-        if node.i_child:
-            yield from foreach_inode(node.i_child, newpath)
-        node = node.i_peer
+def foreach_inode(root=None) -> Generator[Tuple[Inode, str], None, None]:
+    """Iterate over the inodes from root and its peers, g_root_inode by default"""
+    if root:
+        index = InodeIndex(int(root))
+        inodes = index.inodes.values()
+    else:
+        inodes = list(get_inode_index().inodes.values())[1:]  # Skip root itself
+
+    for info in inodes:
+        yield info.value, info.path
 
 
 def foreach_file(tcb: Tcb):
@@ -175,6 +253,114 @@ def foreach_file(tcb: Tcb):
             yield fd, file
 
 
+class OpenFile(NamedTuple):
+    pid: int  # Process ID of the task group
+    fd: int
+    file: int  # Address of struct file
+    inode: int  # Address of struct inode
+
+
+class FileTable:
+    """Opened files of all task groups, decoded from raw filelist blocks"""
+
+    def __init__(self, tcbs):
+        file_type = gdb.lookup_type("struct file")
+        fl_files_type = gdb.lookup_type("struct filelist")["fl_files"].type
+
+        # Blocks of struct file, or blocks of struct file pointers
+        self.inline = (
+            fl_files_type.target().target().strip_typedefs().code != gdb.TYPE_CODE_PTR
+        )
+        self.file_size = file_type.sizeof
+        self.inode_offset = utils.offset_of(file_type, "f_inode")
+        self.ptrsize = utils.get_long_type().sizeof
+
+        self.files = []  # OpenFile of all task groups
+        self.tasks = {}  # pid -> task name
+        groups = set()
+        for tcb in tcbs:
+            group = tcb.group
+            if not group or int(group) in groups:
+                continue
+
+            groups.add(int(group))
+            pid = int(utils.get_tid(tcb) or tcb.pid)
+            self.tasks[pid] = utils.get_task_name(tcb)
+            self.files.extend(self.decode(pid, group.tg_filelist))
+
+        self.inodes = {}  # Inode address -> [(pid, fd)]
+        for file in self.files:
+            self.inodes.setdefault(file.inode, []).append((file.pid, file.fd))
+
+    def decode(self, pid, filelist):
+        rows = int(filelist.fl_rows)
+        fl_files = int(filelist.fl_files)
+        if not rows or not fl_files:
+            return
+
+        blocks = utils.read_cached(fl_files, rows * self.ptrsize)
+        for row in range(rows):
+            block = utils.read_ulong(blocks, row * self.ptrsize)
+            if not block:
+                continue
+
+            for col, (file, inode) in enumerate(self.decode_block(block)):
+                if inode:
+                    fd = row * CONFIG_NFILE_DESCRIPTORS_PER_BLOCK + col
+                    yield OpenFile(pid, fd, file, inode)
+
+    def decode_block(self, block):
+        """Return (file, inode) address of each descriptor in a block"""
+        count = CONFIG_NFILE_DESCRIPTORS_PER_BLOCK
+        if self.inline:
+            size = self.file_size
+            buf = utils.read_cached(block, count * size)
+            return [
+                (block + i * size, utils.read_ulong(buf, i * size + self.inode_offset))
+                for i in range(count)
+            ]
+
+        buf = utils.read_cached(block, count * self.ptrsize)
+        files = (utils.read_ulong(buf, i * self.ptrsize) for i in range(count))
+        return [
+            (file, utils.read_pointer(file + self.inode_offset) if file else 0)
+            for file in files
+        ]
+
+    def counts(self):
+        """Return the number of opened descriptors of each task group"""
+        return Counter(file.pid for file in self.files)
+
+    def unlinked(self):
+        """Return the opened inodes that are no longer in the inode tree"""
+        index = get_inode_index()
+        special = get_special_inodes()
+        return {
+            inode: refs
+            for inode, refs in self.inodes.items()
+            if inode not in index.inodes and inode not in special
+        }
+
+    def drivers(self):
+        """Return the number of opened descriptors of each driver path"""
+        index = get_inode_index()
+        counter = Counter()
+        for inode, refs in self.inodes.items():
+            info = index.get(inode)
+            if info.type in (InodeType.DRIVER, InodeType.BLOCK, InodeType.MTD):
+                counter[info.path] += len(refs)
+
+        return counter
+
+
+def get_file_table() -> FileTable:
+    """Return the opened files of all tasks, read once per stop"""
+    if "all" not in g_file_table:
+        g_file_table["all"] = FileTable(utils.get_tcbs())
+
+    return g_file_table["all"]
+
+
 class Fdinfo(gdb.Command):
     """Dump fd info information of process"""
 
@@ -268,14 +454,83 @@ class Fdinfo(gdb.Command):
             self.print_fdinfo_by_tcb(tcb)
 
 
+class FdStat(gdb.Command):
+    """Show the opened descriptors of all tasks, per driver, and the
+    descriptors still referencing unlinked inodes.
+    """
+
+    def __init__(self):
+        super().__init__("fdstat", gdb.COMMAND_USER)
+
+    def diagnose(self, *args, **kwargs):
+        table = get_file_table()
+        index = get_inode_index()
+        unlinked = table.unlinked()
+
+        return {
+            "title": "Opened files statistics",
+            "summary": f"{len(table.files)} descriptors opened,"
+            f" {len(unlinked)} unlinked inodes",
+            "result": "info",
+            "command": "fdstat",
+            "tasks": {pid: count for pid, count in table.counts().items()},
+            "drivers": dict(table.drivers()),
+            "unlinked": {
+                index.get(inode).path: refs for inode, refs in unlinked.items()
+            },
+        }
+
+    def invoke(self, args, from_tty):
+        table = get_file_table()
+        index = get_inode_index()
+
+        formatter = "{:>5} {:<24} {:>6}\n"
+        gdb.write(formatter.format("PID", "NAME", "FDS"))
+        for pid, count in sorted(table.counts().items()):
+            gdb.write(formatter.format(pid, table.tasks[pid], count))
+        gdb.write(f"Total {len(table.files)} descriptors in {len(table.tasks)} tasks\n")
+
+        if drivers := table.drivers():
+            gdb.write("\nOpened drivers:\n")
+            for path, count in drivers.most_common():
+                gdb.write(f"{count:>6} {path}\n")
+
+        if unlinked := table.unlinked():
+            gdb.write("\nDescriptors referencing unlinked inodes:\n")
+            for inode, refs in unlinked.items():
+                info = index.get(inode)
+                owners = ", ".join(f"{pid}:{fd}" for pid, fd in refs)
+                gdb.write(
+                    f"  {info.path} inode {hex(inode)} i_crefs {info.crefs},"
+                    f" opened by pid:fd {owners}\n"
+                )
+
+
 class Mount(gdb.Command):
     def __init__(self):
         if not utils.get_symbol_value("CONFIG_DISABLE_MOUNTPOINT"):
             super().__init__("mount", gdb.COMMAND_USER)
             self.mount_count = 0
 
-    def diagnose(self, *args, **kwargs):
-        output = gdb.execute("mount", to_string=True)
+    def collect(self, index: InodeIndex):
+        """Return the mount point description lines"""
+        lines = []
+        for info in index.inodes.values():
+            if info.type != InodeType.MOUNTPT:
+                continue
+
+            path = info.path
+            statfs = info.value.u.i_mops.statfs
+            funcname = gdb.block_for_pc(int(statfs)).function.print_name
+            fstype = funcname.split("_")[0]
+            lines.append("  %s type %s\n" % (path, fstype))
+
+        self.mount_count = len(lines)
+        return lines
+
+    def diagnose(self, *args, snapshot=None, **kwargs):
+        index = snapshot.inodes if snapshot else get_inode_index()
+        output = "".join(self.collect(index))
 
         return {
             "title": "File system mount information",
@@ -286,16 +541,7 @@ class Mount(gdb.Command):
         }
 
     def invoke(self, args, from_tty):
-        self.mount_count = 0
-        nodes = filter(
-            lambda x: inode_gettype(x[0]) == InodeType.MOUNTPT, foreach_inode()
-        )
-        for node, path in nodes:
-            statfs = node.u.i_mops.statfs
-            funcname = gdb.block_for_pc(int(statfs)).function.print_name
-            fstype = funcname.split("_")[0]
-            gdb.write("  %s type %s\n" % (path, fstype))
-            self.mount_count += 1
+        gdb.write("".join(self.collect(get_inode_index())))
 
 
 class ForeachInode(gdb.Command):
@@ -342,11 +588,13 @@ class ForeachInode(gdb.Command):
             ),
         }
 
-    def print_inode_info(self, node: Inode, level, prefix):
+    def collect(self, index: InodeIndex, address, level, prefix, lines):
+        """Append the description lines of inode at address, its peers and children"""
         if level > self.level:
             return
-        while node:
-            if node.i_peer:
+        while address:
+            info = index.get(address)
+            if info.peer:
                 initial_indent = prefix + "├── "
                 subsequent_indent = prefix + "│   "
                 newprefix = prefix + "│   "
@@ -354,23 +602,25 @@ class ForeachInode(gdb.Command):
                 initial_indent = prefix + "└── "
                 subsequent_indent = prefix + "    "
                 newprefix = prefix + "    "
-            gdb.write(
+            lines.append(
                 "%s [%s], %s, %s\n"
-                % (initial_indent, get_inode_name(node), node.i_ino, node)
+                % (initial_indent, info.name, info.ino, hex(info.address))
             )
-            gdb.write(
+            lines.append(
                 "%s i_crefs: %s, i_flags: %s, i_private: %s\n"
                 % (
                     subsequent_indent,
-                    node.i_crefs,
-                    node.i_flags,
-                    node.i_private,
+                    info.crefs,
+                    info.flags,
+                    hex(info.private),
                 )
             )
+            if CONFIG_PSEUDOFS_FILE or CONFIG_PSEUDOFS_ATTRIBUTES:
+                node = info.value
             if CONFIG_PSEUDOFS_FILE:
-                gdb.write("%s i_size: %s\n" % (subsequent_indent, node.i_size))
+                lines.append("%s i_size: %s\n" % (subsequent_indent, node.i_size))
             if CONFIG_PSEUDOFS_ATTRIBUTES:
-                gdb.write(
+                lines.append(
                     "%s i_mode: %s, i_owner: %s, i_group: %s\n"
                     % (
                         subsequent_indent,
@@ -379,7 +629,7 @@ class ForeachInode(gdb.Command):
                         node.i_group,
                     )
                 )
-                gdb.write(
+                lines.append(
                     "%s i_atime: %s, i_mtime: %s, i_ctime: %s\n"
                     % (
                         subsequent_indent,
@@ -388,27 +638,38 @@ class ForeachInode(gdb.Command):
                         node.i_ctime,
                     )
                 )
-            if node.i_child:
-                self.print_inode_info(node.i_child, level + 1, newprefix)
-            node = node.i_peer
+            if info.child:
+                self.collect(index, info.child, level + 1, newprefix, lines)
+            address = info.peer
 
-    def diagnose(self, *args, **kwargs):
-        output = gdb.execute("foreach inode", to_string=True)
+    def diagnose(self, *args, snapshot=None, **kwargs):
+        index = snapshot.inodes if snapshot else get_inode_index()
+        lines = []
+        self.level = 4096
+        self.collect(index, int(utils.parse_and_eval("g_root_inode")), 1, "", lines)
 
         return {
             "title": "File node information",
             "summary": "inode formation dump",
             "command": "foreach inode",
             "result": "info",
-            "message": output,
+            "message": "".join(lines),
         }
 
     def invoke(self, args, from_tty):
         arg = self.parse_arguments(args.split(" "))
-        if not arg:
+        if not arg or not arg["root_inode"]:
             return
         self.level = arg["level"]
-        self.print_inode_info(arg["root_inode"], 1, "")
+
+        root = int(arg["root_inode"])
+        index = get_inode_index()
+        if root not in index.inodes:
+            index = InodeIndex(root)
+
+        lines = []
+        self.collect(index, root, 1, "", lines)
+        gdb.write("".join(lines))
 
 
 class InfoShmfs(gdb.Command):
@@ -420,20 +681,29 @@ class InfoShmfs(gdb.Command):
             self.total_size = 0
             self.block_count = 0
 
-    def shm_filter(self, node: Inode, path):
-        if inode_gettype(node) != InodeType.SHM:
-            return
+    def collect(self, index: InodeIndex):
+        """Return the shared memory description lines"""
+        self.total_size = 0
+        lines = []
+        for info in index.inodes.values():
+            if info.type != InodeType.SHM:
+                continue
 
-        obj = node.i_private.cast(gdb.lookup_type("struct shmfs_object_s").pointer())
-        length = obj.length
-        paddr = obj.paddr
-        print(f"  {path} memsize: {length}, paddr: {paddr}")
+            path = info.path
+            obj = utils.Value(info.private).cast("struct shmfs_object_s", ptr=True)
+            length = obj.length
+            paddr = obj.paddr
+            lines.append(f"  {path} memsize: {length}, paddr: {paddr}\n")
+
+            self.total_size += length / 1024
 
-        self.total_size += length / 1024
-        self.block_count += 1
+        self.block_count = len(lines)
+        return lines
 
-    def diagnose(self, *args, **kwargs):
-        output = gdb.execute("info shm", to_string=True)
+    def diagnose(self, *args, snapshot=None, **kwargs):
+        output = "".join(
+            self.collect(snapshot.inodes if snapshot else get_inode_index())
+        )
 
         return {
             "title": "Share memory usage",
@@ -444,16 +714,4 @@ class InfoShmfs(gdb.Command):
         }
 
     def invoke(self, args, from_tty):
-        self.total_size = 0
-        self.block_count = 0
-        nodes = filter(lambda x: inode_gettype(x[0]) == InodeType.SHM, foreach_inode())
-        for node, path in nodes:
-            obj = node.i_private.cast(
-                gdb.lookup_type("struct shmfs_object_s").pointer()
-            )
-            length = obj.length
-            paddr = obj.paddr
-            print(f"  {path} memsize: {length}, paddr: {paddr}")
-
-            self.total_size += length / 1024
-            self.block_count += 1
+        gdb.write("".join(self.collect(get_inode_index())))
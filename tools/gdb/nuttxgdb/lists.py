@@ -19,6 +19,8 @@
 ############################################################################
 
 import argparse
+import time
+from typing import Generator, List, NamedTuple, Tuple
 
 import gdb
 
@@ -28,9 +30,57 @@ list_node_type = utils.lookup_type("struct list_node")
 sq_queue_type = utils.lookup_type("sq_queue_t")
 sq_entry_type = utils.lookup_type("sq_entry_t")
 dq_queue_type = utils.lookup_type("dq_queue_t")
+dq_entry_type = utils.lookup_type("dq_entry_t")
+
+g_queue_kinds = {
+    t.strip_typedefs().tag: kind
+    for t, kind in (
+        (list_node_type, "list"),
+        (sq_queue_type, "sq"),
+        (dq_queue_type, "dq"),
+    )
+    if t
+}
+g_queue_layouts = {}  # Struct type name -> queues inside it
+
+
+class ListEntry(NamedTuple):
+    node: int  # Address of the link node
+    entry: int  # Address of the container, same as node if no container
+
+
+def walk_links(
+    first: int, offset: int, end: int = 0, member_offset: int = 0, back: int = None
+) -> Generator[ListEntry, None, None]:
+    """Walk a linked list by raw address, starting from node first.
+    The link to next node is read at offset of each node through the page
+    cache, walking stops at NULL or when it comes back to end.
+    If back is the offset of the link to previous node, check every node links
+    back to the node walked before it, or to end for the first node.
+    """
+    visited = set()
+    prev, node = end, first
+    while node and node != end:
+        if node in visited:
+            raise gdb.GdbError(f"List is circular at {hex(node)}")
+
+        visited.add(node)
+        try:
+            if back is not None and (p := utils.read_pointer(node + back)) != prev:
+                raise gdb.GdbError(
+                    f"Node {hex(node)} links back to {hex(p)}, not {hex(prev)}"
+                )
+
+            yield ListEntry(node, node - member_offset)
+            prev, node = node, utils.read_pointer(node + offset)
+        except gdb.MemoryError:
+            raise gdb.MemoryError(f"Node {hex(node)} is not accessible") from None
 
 
 class NxList:
+    next_field = "next"
+    prev_field = "prev"
+
     def __init__(self, list, container_type=None, member=None, reverse=False):
         """Initialize the list iterator. Optionally specify the container type and member name."""
 
@@ -47,7 +97,7 @@ class NxList:
         self.reverse = reverse
         self.container_type = container_type
         self.member = member
-        self.current = self._get_first()
+        self.entries = self._walk()
 
     def _get_first(self):
         """Get the initial node based on the direction of traversal."""
@@ -58,31 +108,46 @@ class NxList:
         first = prev if self.reverse else next
         return first if first and first != self.list else None
 
-    def _get_next(self, node):
+    def _get_end(self):
         #   for(node = (list)->next; node != (list); node = node->next)
-        return node["next"] if node["next"] != self.list else None
+        return int(self.list)
 
-    def _get_prev(self, node):
-        #   for(node = (list)->next; node != (list); node = node->prev)
-        return node["prev"] if node["prev"] != self.list else None
+    def _walk(self):
+        """Start the raw walk and decide the type each entry is cast to"""
+        first = self._get_first()
+        if first is None:
+            self.entry_type = None
+            return iter(())
+
+        node_type = first.type
+        field = self.prev_field if self.reverse else self.next_field
+        offset = utils.offset_of(node_type.strip_typedefs().target(), field)
+
+        member_offset = 0
+        self.entry_type = node_type
+        if self.container_type:
+            container_type = self.container_type
+            if isinstance(container_type, str):
+                container_type = gdb.lookup_type(container_type)
+            if container_type.code is not gdb.TYPE_CODE_PTR:
+                container_type = container_type.pointer()
+
+            member_offset = utils.offset_of(container_type, self.member)
+            self.entry_type = container_type
+
+        return walk_links(int(first), offset, self._get_end(), member_offset)
 
     def __iter__(self):
         return self
 
     def __next__(self):
-        if self.current is None:
-            raise StopIteration
-
-        node = self.current
-        self.current = self._get_prev(node) if self.reverse else self._get_next(node)
-        return (
-            utils.container_of(node, self.container_type, self.member)
-            if self.container_type
-            else node
-        )
+        entry = next(self.entries)
+        return gdb.Value(entry.entry).cast(self.entry_type)
 
 
 class NxSQueue(NxList):
+    next_field = "flink"
+
     def __init__(self, list, container_type=None, member=None, reverse=False):
         """Initialize the singly linked list iterator. Optionally specify the container type and member name."""
         if reverse:
@@ -95,12 +160,15 @@ class NxSQueue(NxList):
         #   for ((p) = (q)->head; (p) != NULL; (p) = (p)->flink)
         return self.list["head"] or None
 
-    def _get_next(self, node):
-        # if not node["flink"], then return None, to indicate end of list
-        return node["flink"] or None
+    def _get_end(self):
+        # NULL flink indicates the end of list
+        return 0
 
 
 class NxDQueue(NxList):
+    next_field = "flink"
+    prev_field = "blink"
+
     def __init__(self, list, container_type=None, member=None, reverse=False):
         """Initialize the doubly linked list iterator. Optionally specify the container type and member name."""
         super().__init__(list, container_type, member, reverse)
@@ -112,13 +180,10 @@ class NxDQueue(NxList):
         first = head if not self.reverse else tail
         return first or None
 
-    def _get_next(self, node):
+    def _get_end(self):
         #   for ((p) = (q)->head; (p) != NULL; (p) = (p)->flink)
-        return node["flink"] or None
-
-    def _get_prev(self, node):
         #   for ((p) = (q)->tail; (p) != NULL; (p) = (p)->blink)
-        return node["blink"] or None
+        return 0
 
 
 def list_check(head):
@@ -301,18 +366,206 @@ def dq_check(dq):
     gdb.write("dq_queue is consistent: {} node(s)\n".format(nb))
 
 
+def check_list_raw(head: int) -> Tuple[int, str]:
+    """Check a struct list_node by raw address, return node count and error"""
+    next_offset = utils.offset_of(list_node_type, "next")
+    prev_offset = utils.offset_of(list_node_type, "prev")
+
+    first = utils.read_pointer(head + next_offset)
+    if not first and not utils.read_pointer(head + prev_offset):
+        return 0, None  # Not initialized yet
+
+    nb = 0
+    prev = head
+    try:
+        for entry in walk_links(first, next_offset, head, back=prev_offset):
+            nb += 1
+            prev = entry.node
+    except (gdb.GdbError, gdb.MemoryError) as e:
+        return nb, str(e)
+
+    if not utils.read_pointer(prev + next_offset):
+        return nb, f"next is NULL after node {hex(prev)}"
+
+    if (p := utils.read_pointer(head + prev_offset)) != prev:
+        return nb, f"head prev {hex(p)} != last node {hex(prev)}"
+
+    return nb, None
+
+
+def check_queue_raw(queue: int, doubly=False) -> Tuple[int, str]:
+    """Check a sq_queue_t or dq_queue_t by raw address, return node count and error"""
+    queue_type = dq_queue_type if doubly else sq_queue_type
+    head = utils.read_pointer(queue + utils.offset_of(queue_type, "head"))
+    tail = utils.read_pointer(queue + utils.offset_of(queue_type, "tail"))
+    flink = utils.offset_of(dq_entry_type if doubly else sq_entry_type, "flink")
+    blink = utils.offset_of(dq_entry_type, "blink") if doubly else None
+
+    if not head:
+        return 0, f"empty queue has tail {hex(tail)}" if tail else None
+
+    nb = 0
+    prev = 0
+    try:
+        for entry in walk_links(head, flink, back=blink):
+            nb += 1
+            prev = entry.node
+    except (gdb.GdbError, gdb.MemoryError) as e:
+        return nb, str(e)
+
+    if tail != prev:
+        return nb, f"tail {hex(tail)} is not the last node {hex(prev)}"
+
+    return nb, None
+
+
+def queue_layout(t: gdb.Type) -> List[Tuple[int, str, str]]:
+    """Return (offset, path, kind) of every queue embedded in a type"""
+    t = t.strip_typedefs()
+    if t.code == gdb.TYPE_CODE_STRUCT:
+        if t.tag in g_queue_kinds:
+            return [(0, "", g_queue_kinds[t.tag])]
+
+        key = t.tag or None
+        if key in g_queue_layouts:
+            return g_queue_layouts[key]
+
+        layout = []
+        for field in t.fields():
+            if field.bitpos is None or field.bitsize:
+                continue
+
+            offset = field.bitpos // 8
+            name = f".{field.name}" if field.name else ""
+            layout.extend(
+                (offset + o, name + path, kind)
+                for o, path, kind in queue_layout(field.type)
+            )
+
+        if key:
+            g_queue_layouts[key] = layout
+        return layout
+
+    if t.code == gdb.TYPE_CODE_ARRAY and t.target().sizeof:
+        target = t.target()
+        layout = queue_layout(target)
+        if not layout:
+            return []  # Don't iterate the elements of large arrays for nothing
+
+        return [
+            (i * target.sizeof + o, f"[{i}]{path}", kind)
+            for i in range(t.sizeof // target.sizeof)
+            for o, path, kind in layout
+        ]
+
+    # Unions may overlay queues with other data, skip them as well as scalars
+    return []
+
+
+def lookup_object_symbol(name, address):
+    """Find the global or static symbol of the object at address"""
+    candidates = [gdb.lookup_global_symbol(name)]
+    if hasattr(gdb, "lookup_static_symbols"):
+        candidates.extend(gdb.lookup_static_symbols(name))
+    else:
+        candidates.append(gdb.lookup_static_symbol(name))
+
+    for symbol in candidates:
+        try:
+            if symbol and int(symbol.value().address) == address:
+                return symbol
+        except gdb.error:
+            continue
+
+    return None
+
+
+def foreach_global_queue() -> Generator[Tuple[str, int, str], None, None]:
+    """Yield (path, address, kind) of all the queues in global variables"""
+    minsize = min(t.sizeof for t in (list_node_type, sq_queue_type, dq_queue_type) if t)
+
+    for name, address, size in utils.get_global_objects():
+        if size < minsize:
+            continue
+
+        symbol = lookup_object_symbol(name, address)
+        if not symbol:
+            continue
+
+        for offset, path, kind in queue_layout(symbol.type):
+            yield name + path, address + offset, kind
+
+
+def check_all_queues():
+    """Check all the global queues, return the number of queues, nodes and errors"""
+    nqueue = nnode = 0
+    errors = []
+    for path, address, kind in foreach_global_queue():
+        try:
+            if kind == "list":
+                nb, error = check_list_raw(address)
+            else:
+                nb, error = check_queue_raw(address, doubly=kind == "dq")
+        except gdb.MemoryError:
+            nb, error = 0, "queue head is not accessible"
+
+        nqueue += 1
+        nnode += nb
+        if error:
+            errors.append(f"{path}@{hex(address)}: {error}")
+
+    return nqueue, nnode, errors
+
+
 class ListCheck(gdb.Command):
-    """Verify a list consistency"""
+    """Verify a list consistency
+    Usage: list_check <expr> | list_check -a
+
+    With -a, check every struct list_node, sq_queue_t and dq_queue_t
+    found in global variables, including the ones inside structs and arrays.
+    """
 
     def __init__(self):
         super().__init__("list_check", gdb.COMMAND_DATA, gdb.COMPLETE_EXPRESSION)
 
+    def diagnose(self, *args, **kwargs):
+        nqueue, nnode, errors = check_all_queues()
+        return {
+            "title": "List Integrity Report",
+            "summary": f"{len(errors)} of {nqueue} lists corrupted",
+            "result": "fail" if errors else "pass",
+            "command": "list_check -a",
+            "data": errors,
+        }
+
     def invoke(self, arg, from_tty):
-        argv = gdb.string_to_argv(arg)
-        if len(argv) != 1:
+        parser = argparse.ArgumentParser(description=self.__doc__)
+        parser.add_argument("expr", nargs="?", help="The list to check")
+        parser.add_argument(
+            "-a", "--all", action="store_true", help="Check all global lists"
+        )
+
+        try:
+            args = parser.parse_args(gdb.string_to_argv(arg))
+        except SystemExit:
+            return
+
+        if args.all:
+            start = time.time()
+            nqueue, nnode, errors = check_all_queues()
+            for error in errors:
+                gdb.write(f"{error}\n")
+
+            gdb.write(
+                f"Checked {nqueue} lists, {nnode} nodes, {len(errors)} corrupted"
+                f" in {(time.time() - start):.2f} seconds\n"
+            )
+            return
+
+        if not args.expr:
             raise gdb.GdbError("nx-list-check takes one argument")
 
-        obj = gdb.parse_and_eval(argv[0])
+        obj = gdb.parse_and_eval(args.expr)
         if obj.type == list_node_type.pointer():
             list_check(obj)
         elif obj.type == sq_queue_type.pointer():
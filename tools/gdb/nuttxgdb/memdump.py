@@ -21,12 +21,13 @@
 import argparse
 import bisect
 import time
+from typing import List, NamedTuple, Optional, Tuple
 
 import gdb
 
 from . import utils
 from .lists import NxSQueue, sq_count
-from .utils import get_long_type, get_symbol_value, get_tcb, lookup_type, read_ulong
+from .utils import get_long_type, get_symbol_value, get_tcb, lookup_type
 
 MM_ALLOC_BIT = 0x1
 MM_PREVFREE_BIT = 0x2
@@ -91,6 +92,24 @@ def mm_foreach(heap):
             node = next
 
 
+def mm_foreach_raw(heap):
+    """Iterate over a heap from raw memory, yielding (node address, size field)"""
+    nregions = get_symbol_value("CONFIG_MM_REGIONS")
+    offset, size_type = utils.field_info(mm_allocnode_type, "size")
+    size = size_type.sizeof
+
+    for region in range(0, nregions):
+        node = int(heap["mm_heapstart"][region])
+        end = int(heap["mm_heapend"][region])
+        while node <= end:
+            record = utils.read_uint(utils.read_cached(node + offset, size), 0, size)
+            yield node, record
+            if not mm_nodesize(record):
+                gdb.write(f"Error: maybe have memory fault on {hex(node)}\n")
+                break
+            node += mm_nodesize(record)
+
+
 def mm_dumpnode(node, count, align, simple, detail, alive):
     if node["size"] & MM_ALLOC_BIT != 0:
         charnode = int(node)
@@ -302,6 +321,223 @@ def check_node_alive(node) -> bool:
         return tcb is not None
 
 
+SEARCH_CHUNK = 0x10000
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+
+def search_memory(start, end, pattern: bytes, align=1):
+    """Yield the address of every match of pattern in [start, end).
+    Memory is read in big chunks overlapping by the pattern length, so matches
+    across two chunks are found exactly once. Unreadable chunks are skipped.
+    """
+    inf = gdb.selected_inferior()
+    overlap = len(pattern) - 1
+    addr = start
+    while addr < end:
+        try:
+            data = inf.read_memory(addr, min(SEARCH_CHUNK + overlap, end - addr))
+            data = data.tobytes()
+        except gdb.MemoryError:
+            addr += SEARCH_CHUNK
+            continue
+
+        pos = data.find(pattern)
+        while 0 <= pos < SEARCH_CHUNK:
+            if (addr + pos) % align == 0:
+                yield addr + pos
+            pos = data.find(pattern, pos + 1)
+        addr += SEARCH_CHUNK
+
+
+def search_pointers(start, end, ranges):
+    """Yield (address, value) of every aligned word in [start, end) whose value
+    falls in one of the [low, high) ranges. Words are compared with NumPy when
+    it is available.
+    """
+    inf = gdb.selected_inferior()
+    size = get_long_type().sizeof
+    little = utils.get_target_endianness() == utils.LITTLE_ENDIAN
+    addr = align_up(start, size)
+    end = end & ~(size - 1)
+    while addr < end:
+        try:
+            data = inf.read_memory(addr, min(SEARCH_CHUNK, end - addr)).tobytes()
+        except gdb.MemoryError:
+            addr += SEARCH_CHUNK
+            continue
+
+        if np is not None:
+            words = np.frombuffer(data, dtype=f"{'<' if little else '>'}u{size}")
+            mask = np.zeros(len(words), dtype=bool)
+            for low, high in ranges:
+                mask |= (words >= low) & (words < high)
+            for i in np.flatnonzero(mask):
+                yield addr + int(i) * size, int(words[i])
+        else:
+            order = "little" if little else "big"
+            for i in range(0, len(data), size):
+                value = int.from_bytes(data[i : i + size], order)
+                for low, high in ranges:
+                    if low <= value < high:
+                        yield addr + i, value
+                        break
+        addr += SEARCH_CHUNK
+
+
+def get_heap_regions() -> List[Tuple[int, int]]:
+    """Return [start, end) of every heap region"""
+    heap = gdb.parse_and_eval("g_mmheap")
+    return [
+        (
+            int(heap["mm_heapstart"][i]),
+            int(heap["mm_heapend"][i]) + mm_allocnode_type.sizeof,
+        )
+        for i in range(0, get_symbol_value("CONFIG_MM_REGIONS"))
+    ]
+
+
+class MemoryOwner(NamedTuple):
+    kind: str  # "global", "stack", "heap" or "free"
+    base: int
+    size: int
+    name: str
+    pid: Optional[int] = None
+    backtrace: Tuple[int] = ()
+
+    def describe(self, address) -> str:
+        offset = address - self.base
+        return f"{self.name}+{hex(offset)}" if offset else self.name
+
+
+class MemoryMap:
+    """Map an address to the global, task stack or heap node owning it"""
+
+    def __init__(self):
+        self.globals = sorted(
+            (address, size, name) for name, address, size in utils.get_global_objects()
+        )
+        self.stacks = sorted(
+            (
+                int(tcb["stack_alloc_ptr"]),
+                int(tcb["stack_base_ptr"]) + int(tcb["adj_stack_size"]),
+                int(tcb["pid"]),
+                utils.get_task_name(tcb),
+            )
+            for tcb in utils.get_tcbs()
+            if tcb["stack_alloc_ptr"]
+        )
+        heap = gdb.parse_and_eval("g_mmheap")
+        self.heap = list(mm_foreach_raw(heap))  # Sorted by address per region
+        self.heap.sort()
+
+    @staticmethod
+    def find(ranges, address):
+        """Find the sorted range containing address, ranges are (start, ...)"""
+        i = bisect.bisect_right(ranges, (address, float("inf"))) - 1
+        return ranges[i] if i >= 0 else None
+
+    def lookup(self, address) -> MemoryOwner:
+        """Return the owner of address, or None if not known"""
+        stack = self.find(self.stacks, address)
+        if stack and address < stack[1]:
+            return MemoryOwner(
+                "stack", stack[0], stack[1] - stack[0], f"stack@{stack[3]}", stack[2]
+            )
+
+        node = self.find(self.heap, address)
+        if node and address < node[0] + mm_nodesize(node[1]):
+            return self.heap_owner(*node)
+
+        symbol = self.find(self.globals, address)
+        if symbol and address < symbol[0] + symbol[1]:
+            return MemoryOwner("global", symbol[0], symbol[1], symbol[2])
+
+        return None
+
+    @staticmethod
+    def heap_owner(address, record) -> MemoryOwner:
+        size = mm_nodesize(record)
+        if not mm_node_is_alloc(record):
+            return MemoryOwner("free", address, size, f"free@{hex(address)}")
+
+        node = gdb.Value(address).cast(mm_allocnode_type.pointer())
+        pid = utils.get_layout(mm_allocnode_type).read(address).get("pid")
+        backtrace = (
+            get_backtrace(node) if node.type.target().has_key("backtrace") else ()
+        )
+        return MemoryOwner(
+            "heap", address, size, f"heap@{hex(address)}", pid, backtrace
+        )
+
+
+g_memory_map = utils.stop_cache()
+
+
+def get_memory_map() -> MemoryMap:
+    """Return the memory map of current stop, built on first use"""
+    if "map" not in g_memory_map:
+        g_memory_map["map"] = MemoryMap()
+    return g_memory_map["map"]
+
+
+def merge_areas(areas) -> List[Tuple[int, int]]:
+    """Merge overlapping [start, end) areas"""
+    merged = []
+    for start, end in sorted(areas):
+        if merged and start <= merged[-1][1]:
+            merged[-1] = (merged[-1][0], max(merged[-1][1], end))
+        else:
+            merged.append((start, end))
+    return merged
+
+
+class ReferenceMap:
+    """Reverse reference map from heap node to the addresses pointing into it.
+    Heap regions, writable ELF sections and task stacks are scanned once for
+    aligned words pointing into heap, then every query is a dict lookup.
+    """
+
+    def __init__(self, memmap: MemoryMap):
+        self.memmap = memmap
+        self.refs = {}  # Heap node address -> [(referrer address, value)]
+
+        regions = get_heap_regions()
+        areas = list(regions)
+        areas.extend(
+            (address, address + size) for _, address, size in utils.get_data_sections()
+        )
+        areas.extend((start, end) for start, end, _, _ in memmap.stacks)
+
+        for start, end in merge_areas(areas):
+            for address, value in search_pointers(start, end, regions):
+                node = memmap.find(memmap.heap, value)
+                if not node or value >= node[0] + mm_nodesize(node[1]):
+                    continue
+
+                if node[0] <= address < node[0] + mm_allocnode_type.sizeof:
+                    continue  # Skip the node header
+
+                self.refs.setdefault(node[0], []).append((address, value))
+
+    def references(self, address) -> Tuple[MemoryOwner, List[Tuple[int, int]]]:
+        """Return the heap node owning address and the references to it"""
+        node = self.memmap.find(self.memmap.heap, address)
+        if not node or address >= node[0] + mm_nodesize(node[1]):
+            return None, []
+        return MemoryMap.heap_owner(*node), self.refs.get(node[0], [])
+
+
+def get_reference_map() -> ReferenceMap:
+    """Return the reverse reference map of current stop, built on first use"""
+    if "refs" not in g_memory_map:
+        g_memory_map["refs"] = ReferenceMap(get_memory_map())
+    return g_memory_map["refs"]
+
+
 class HeapNode:
     def __init__(self, gdb_node, nextfree=False):
         self.gdb_node = gdb_node
@@ -655,6 +891,7 @@ class Memleak(gdb.Command):
     """Memleak check"""
 
     def __init__(self):
+        self.heap_nodes = None  # Heap nodes shared by diagnose report
         self.elf = utils.import_check(
             "elftools.elf.elffile", "ELFFile", "Plase pip install pyelftools\n"
         )
@@ -664,51 +901,29 @@ class Memleak(gdb.Command):
         super().__init__("memleak", gdb.COMMAND_USER)
 
     def next_ptr(self):
-        inf = gdb.selected_inferior()
         heap = gdb.parse_and_eval("g_mmheap")
         longsize = get_long_type().sizeof
         region = get_symbol_value("CONFIG_MM_REGIONS")
-        regions = []
-
-        for i in range(0, region):
-            start = int(heap["mm_heapstart"][i])
-            end = int(heap["mm_heapend"][i])
-            regions.append({"start": start, "end": end})
+        regions = [
+            (int(heap["mm_heapstart"][i]), int(heap["mm_heapend"][i]))
+            for i in range(0, region)
+        ]
 
         # Search global variables
-        for objfile in gdb.objfiles():
-            gdb.write(f"Searching global symbol in: {objfile.filename}\n")
-            elf = self.elf.load_from_path(objfile.filename)
-            symtab = elf.get_section_by_name(".symtab")
-            for symbol in symtab.iter_symbols():
-                if symbol["st_info"]["type"] != "STT_OBJECT":
-                    continue
-
-                if symbol["st_size"] < longsize:
-                    continue
+        gdb.write("Searching global symbols\n")
+        for _, address, size in utils.get_global_objects():
+            if size < longsize:
+                continue
 
-                global_size = symbol["st_size"] // longsize * longsize
-                global_mem = inf.read_memory(symbol["st_value"], global_size)
-                while global_size:
-                    global_size = global_size - longsize
-                    ptr = read_ulong(global_mem, global_size)
-                    for region in regions:
-                        if ptr >= region["start"] and ptr < region["end"]:
-                            yield ptr
-                            break
+            size = size // longsize * longsize
+            for _, ptr in search_pointers(address, address + size, regions):
+                yield ptr
 
         gdb.write("Searching in grey memory\n")
         for node in self.grey_list:
             addr = node["addr"]
-            mem = inf.read_memory(addr, node["size"])
-            i = 0
-            while i < node["size"]:
-                ptr = read_ulong(mem, i)
-                for region in regions:
-                    if ptr >= region["start"] and ptr < region["end"]:
-                        yield ptr
-                        break
-                i = i + longsize
+            for _, ptr in search_pointers(addr, addr + node["size"], regions):
+                yield ptr
 
     def collect_white_dict(self):
         white_dict = {}
@@ -717,7 +932,7 @@ class Memleak(gdb.Command):
         # collect all user malloc ptr
 
         heap = gdb.parse_and_eval("g_mmheap")
-        for node in mm_foreach(heap):
+        for node in self.heap_nodes or mm_foreach(heap):
             if node["size"] & MM_ALLOC_BIT != 0 and node["pid"] != PID_MM_MEMPOOL:
                 addr = int(node) + allocnode_size
 
@@ -767,8 +982,12 @@ class Memleak(gdb.Command):
 
         return {"simple": args.simple, "detail": args.detail}
 
-    def diagnose(self, *args, **kwargs):
-        output = gdb.execute("memleak", to_string=True)
+    def diagnose(self, *args, snapshot=None, **kwargs):
+        self.heap_nodes = snapshot.heap_nodes if snapshot else None
+        try:
+            output = gdb.execute("memleak", to_string=True)
+        finally:
+            self.heap_nodes = None
         return {
             "title": "Memory Leak Report",
             "command": "memleak",
@@ -1027,6 +1246,210 @@ class Memfrag(gdb.Command):
         )
 
 
+class MemFind(gdb.Command):
+    """Search target memory for a byte pattern, a pointer value or pointer range.
+    Every hit is reported with the global, task stack or heap node owning it.
+    Heap regions and writable ELF sections are searched if no area is given.
+
+    Usage:
+        memfind -s "hello"                 # Search a string
+        memfind -b deadbeef                # Search raw bytes in hex
+        memfind -p 0x20001000              # Aligned pointers equal to value
+        memfind -r 0x20001000 0x20001100   # Aligned pointers in [low, high)
+        memfind -a 0x20000000 0x1000 -p g_mmheap -d 32
+    """
+
+    def __init__(self):
+        super().__init__("memfind", gdb.COMMAND_USER)
+
+    def parse_arguments(self, argv):
+        parser = argparse.ArgumentParser(description="memfind command")
+        group = parser.add_mutually_exclusive_group(required=True)
+        group.add_argument("-s", "--string", type=str, help="String to search")
+        group.add_argument("-b", "--bytes", type=str, help="Hex bytes to search")
+        group.add_argument("-p", "--pointer", type=str, help="Pointer value to search")
+        group.add_argument(
+            "-r",
+            "--range",
+            nargs=2,
+            type=str,
+            metavar=("LOW", "HIGH"),
+            help="Search pointers in range [LOW, HIGH)",
+        )
+        parser.add_argument(
+            "-a",
+            "--area",
+            nargs=2,
+            type=str,
+            action="append",
+            metavar=("START", "SIZE"),
+            help="Memory area to search, can be repeated",
+        )
+        parser.add_argument(
+            "-m", "--max", type=int, default=1000, help="Max hits to report"
+        )
+        parser.add_argument(
+            "-d", "--dump", type=int, default=0, help="Hexdump N bytes of each hit"
+        )
+
+        try:
+            return parser.parse_args(argv)
+        except SystemExit:
+            return None
+
+    @staticmethod
+    def value_of(arg) -> int:
+        value = utils.parse_arg(arg)
+        if value is None:
+            raise gdb.GdbError(f"Invalid value: {arg}")
+        return int(value)
+
+    def areas(self, args) -> List[Tuple[int, int]]:
+        if args.area:
+            return [
+                (self.value_of(start), self.value_of(start) + self.value_of(size))
+                for start, size in args.area
+            ]
+
+        areas = get_heap_regions()
+        for _, address, size in utils.get_data_sections():
+            areas.append((address, address + size))
+        return areas
+
+    def search(self, args, start, end):
+        """Yield (address, pointer value or None) of hits in [start, end)"""
+        if args.range:
+            low, high = map(self.value_of, args.range)
+            yield from search_pointers(start, end, [(low, high)])
+            return
+
+        if args.pointer:
+            size = get_long_type().sizeof
+            value = self.value_of(args.pointer) & ((1 << (size * 8)) - 1)
+            order = (
+                "little"
+                if utils.get_target_endianness() == utils.LITTLE_ENDIAN
+                else "big"
+            )
+            pattern, align = value.to_bytes(size, order), size
+        elif args.bytes:
+            pattern, align = bytes.fromhex(args.bytes), 1
+        else:
+            pattern, align = args.string.encode(), 1
+
+        for address in search_memory(start, end, pattern, align):
+            yield address, None
+
+    def invoke(self, args, from_tty):
+        args = self.parse_arguments(gdb.string_to_argv(args))
+        if not args:
+            return
+
+        memmap = get_memory_map()
+        inf = gdb.selected_inferior()
+        output = []
+        hits = 0
+        for start, end in self.areas(args):
+            for address, value in self.search(args, start, end):
+                owner = memmap.lookup(address)
+                line = f"{hex(address)}"
+                if value is not None:
+                    line += f" -> {hex(value)}"
+                line += f"  {owner.describe(address) if owner else '<unknown>'}"
+                if owner and owner.pid is not None:
+                    line += f" pid:{owner.pid}"
+                output.append(line + "\n")
+
+                if args.dump:
+                    try:
+                        data = inf.read_memory(address, args.dump).tobytes()
+                        output.append(utils.format_hexdump(address, data))
+                    except gdb.MemoryError:
+                        pass
+
+                hits += 1
+                if hits >= args.max:
+                    break
+            if hits >= args.max:
+                output.append(f"Stopped at {args.max} hits, use -m to show more\n")
+                break
+
+        output.append(f"Found {hits} hits\n")
+        gdb.write("".join(output))
+
+
+class MemRef(gdb.Command):
+    """Show every location referencing the heap node that contains an address.
+    Globals, heap nodes and task stacks are scanned once per stop, so repeated
+    queries until the target resumes are served from the cached map.
+
+    Usage: memref <address> [-b]
+    """
+
+    def __init__(self):
+        super().__init__("memref", gdb.COMMAND_USER)
+
+    def parse_arguments(self, argv):
+        parser = argparse.ArgumentParser(description="memref command")
+        parser.add_argument("address", type=str, help="Address or expression")
+        parser.add_argument(
+            "-b",
+            "--backtrace",
+            action="store_true",
+            help="Show backtrace of the heap nodes",
+        )
+
+        try:
+            return parser.parse_args(argv)
+        except SystemExit:
+            return None
+
+    @staticmethod
+    def format_owner(owner: MemoryOwner, address, backtrace) -> List[str]:
+        line = f"{hex(address)}  {owner.describe(address) if owner else '<unknown>'}"
+        if owner and owner.pid is not None:
+            line += f" pid:{owner.pid}"
+
+        output = [line + "\n"]
+        if backtrace and owner and owner.backtrace:
+            output.extend(
+                "    " + line for line in utils.Backtrace(owner.backtrace).formatted
+            )
+        return output
+
+    def invoke(self, args, from_tty):
+        args = self.parse_arguments(gdb.string_to_argv(args))
+        if not args:
+            return
+
+        address = utils.parse_arg(args.address)
+        if address is None:
+            gdb.write(f"Invalid address: {args.address}\n")
+            return
+
+        address = int(address)
+        memmap = get_memory_map()
+        target, refs = get_reference_map().references(address)
+        if not target:
+            gdb.write(f"{hex(address)} is not in heap, try memfind -p instead\n")
+            return
+
+        output = [f"Target {target.name} size:{target.size}"]
+        if target.pid is not None:
+            output.append(f" pid:{target.pid}")
+        output.append("\n")
+        if target.backtrace:
+            output.extend(utils.Backtrace(target.backtrace).formatted)
+
+        output.append(f"{len(refs)} references:\n")
+        for referrer, value in refs:
+            owner = memmap.lookup(referrer)
+            output.append(f"{hex(value)} <- ")
+            output.extend(self.format_owner(owner, referrer, args.backtrace))
+
+        gdb.write("".join(output))
+
+
 class MempoolProc:
     def __init__(self, entry):
         pool = utils.container_of(entry, mempool_s_type, "procfs")
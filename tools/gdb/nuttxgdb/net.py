@@ -18,12 +18,15 @@
 #
 ############################################################################
 
+import argparse
+from collections import Counter
 from enum import Enum
+from typing import List, NamedTuple
 
 import gdb
 
 from . import utils
-from .lists import NxDQueue, NxSQueue
+from .lists import NxDQueue, walk_links
 
 socket = utils.import_check(
     "socket", errmsg="No socket module found, please try gdb-multiarch instead.\n"
@@ -35,37 +38,19 @@ NET_IPv6 = utils.get_symbol_value("CONFIG_NET_IPv6")
 AF_INET = utils.get_symbol_value("AF_INET")
 AF_INET6 = utils.get_symbol_value("AF_INET6")
 
+g_net_snapshot = utils.stop_cache()
+g_iob_pool = utils.stop_cache()
 
-def ntohs(val):
-    """Convert a 16-bit value from network byte order to host byte order"""
 
-    if utils.get_target_endianness() == utils.BIG_ENDIAN:
-        return val
-    return utils.swap16(val)
+def inet_ntop(domain, data):
+    """Convert a network address in bytes to a string"""
 
-
-def get_ip_port(conn):
-    """Get the IP address and port of a network connection"""
-
-    domain = utils.get_field(conn, "domain", AF_INET if NET_IPv4 else AF_INET6)
-    ip_binding = conn["u"]["ipv4" if domain == AF_INET else "ipv6"]
-    lport = ntohs(conn["lport"])
-    rport = ntohs(conn["rport"])
-    laddr = inet_ntop(domain, ip_binding["laddr"])
-    raddr = inet_ntop(domain, ip_binding["raddr"])
-    return laddr, lport, raddr, rport
-
-
-def inet_ntop(domain, addr):
-    """Convert a network address to a string"""
-
-    addr_len = 16 if domain == AF_INET6 else 4
     if socket:
-        return socket.inet_ntop(domain, utils.get_bytes(addr, addr_len))
+        return socket.inet_ntop(domain, data)
     else:
         separator = "." if domain == AF_INET else ""
         fmt = "%d" if domain == AF_INET else "%02x"
-        return separator.join([fmt % byte for byte in utils.get_bytes(addr, addr_len)])
+        return separator.join([fmt % byte for byte in data])
 
 
 def socket_for_each_entry(proto):
@@ -84,37 +69,376 @@ def socket_for_each_entry(proto):
         )
 
 
-def wrbuffer_inqueue_size(queue=None, protocol="tcp"):
-    """Calculate the total size of all iob in the write queue of a udp connection"""
+def iob_pktlen(iob: int) -> int:
+    """Read io_pktlen of an IOB by raw address"""
+    return utils.get_view(iob, "struct iob_s").io_pktlen
+
+
+def iob_chain(iob: int) -> List[int]:
+    """Return the address of each IOB in the chain starting from iob"""
+    offset = utils.offset_of("struct iob_s", "io_flink")
+    return [entry.node for entry in walk_links(iob, offset)]
+
+
+class ConnInfo(NamedTuple):
+    proto: str
+    index: int
+    address: int
+    flags: int = 0
+    crefs: int = 0
+    laddr: str = ""
+    lport: int = 0
+    raddr: str = ""
+    rport: int = 0
+    txsz: int = 0
+    txbuf: int = -1
+    rxsz: int = 0
+    rxbuf: int = -1
+    rxiobs: int = 0
+    ofosz: int = 0
+    state: int = 0
+    timer: int = 0
+    unacked: int = 0
+    nrtx: int = 0
+    chains: tuple = ()  # (owner, first IOB address) of the IOB chains held
+
+    def toJSON(self):
+        info = self._asdict()
+        info["address"] = hex(self.address)
+        info.pop("chains")
+        return info
+
+
+class ConnDecoder:
+    """Decode the active connections of a protocol from raw memory"""
+
+    FIELDS = {
+        "tcp": {
+            "flags": "sconn.s_flags",
+            "crefs": "crefs",
+            "domain": "domain",
+            "lport": "lport",
+            "rport": "rport",
+            "ipv4": "u.ipv4",
+            "ipv6": "u.ipv6",
+            "txbuf": "snd_bufs",
+            "rxbuf": "rcv_bufs",
+            "readahead": "readahead",
+            "write_q": "write_q",
+            "unacked_q": "unacked_q",
+            "state": "tcpstateflags",
+            "timer": "timer",
+            "unacked": "tx_unacked",
+            "nrtx": "nrtx",
+            "ofosegs": "ofosegs",
+            "nofosegs": "nofosegs",
+        },
+        "udp": {
+            "flags": "sconn.s_flags",
+            "crefs": "crefs",
+            "domain": "domain",
+            "lport": "lport",
+            "rport": "rport",
+            "ipv4": "u.ipv4",
+            "ipv6": "u.ipv6",
+            "txbuf": "sndbufs",
+            "rxbuf": "rcvbufs",
+            "readahead": "readahead",
+            "write_q": "write_q",
+        },
+        "icmp": {
+            "flags": "sconn.s_flags",
+            "crefs": "crefs",
+            "readahead": "readahead",
+        },
+    }
+
+    def __init__(self, proto):
+        self.proto = proto
+        conn_type = gdb.lookup_type(f"struct {proto}_conn_s")
+        self.size = conn_type.sizeof
+        self.fields = {}
+        for name, path in self.FIELDS[proto].items():
+            try:
+                self.fields[name] = utils.field_info(conn_type, path)
+            except gdb.GdbError:
+                continue  # Not enabled in this configuration
+
+        self.node_offset = utils.offset_of(conn_type, "sconn") + utils.offset_of(
+            "struct socket_conn_s", "node"
+        )
 
-    if not queue:
-        return 0
+    def value(self, buf, name, default=0):
+        if name not in self.fields:
+            return default
+
+        offset, t = self.fields[name]
+        return utils.read_int(buf, offset, t)
+
+    def port(self, buf, name):
+        if name not in self.fields:
+            return 0
+
+        # Ports are in network byte order
+        offset = self.fields[name][0]
+        return int.from_bytes(buf[offset : offset + 2], "big")
+
+    def pointer(self, buf, name):
+        if name not in self.fields:
+            return 0
+
+        return utils.read_ulong(buf, self.fields[name][0])
+
+    def address(self, buf, domain):
+        """Return the local and remote address in string"""
+        name = "ipv4" if domain == AF_INET else "ipv6"
+        if name not in self.fields:
+            return "", ""
+
+        offset, t = self.fields[name]
+        size = 16 if domain == AF_INET6 else 4
+        result = []
+        for field in ("laddr", "raddr"):
+            start = offset + utils.offset_of(t, field)
+            result.append(inet_ntop(domain, bytes(buf[start : start + size])))
+
+        return result
+
+    def wrbuffer_queue(self, conn, name, chains):
+        """Return the total packet length in a write queue of wrbuffers"""
+        if name not in self.fields:
+            return 0
+
+        wrbuffer = f"struct {self.proto}_wrbuffer_s"
+        node = utils.offset_of(wrbuffer, "wb_node")
+        wb_iob = utils.offset_of(wrbuffer, "wb_iob")
+        head = utils.read_pointer(conn + self.fields[name][0])
+
+        total = 0
+        for entry in walk_links(head, 0, member_offset=node):
+            iob = utils.read_pointer(entry.entry + wb_iob)
+            if iob:
+                chains.append((name, iob))
+                total += iob_pktlen(iob)
+
+        return total
+
+    def ofosegs(self, conn, buf, chains):
+        """Return the total packet length of out-of-order segments"""
+        if "ofosegs" not in self.fields:
+            return 0
+
+        offset, t = self.fields["ofosegs"]
+        segsize = t.target().sizeof
+        data = utils.offset_of(t.target(), "data")
+        total = 0
+        for i in range(self.value(buf, "nofosegs")):
+            iob = utils.read_pointer(conn + offset + i * segsize + data)
+            if iob:
+                chains.append(("ofosegs", iob))
+                total += iob_pktlen(iob)
+
+        return total
+
+    def readahead(self, conn, buf, chains):
+        """Return the total length and IOB count of the readahead data"""
+        if "readahead" not in self.fields:
+            return 0, 0
+
+        if self.proto != "icmp":
+            heads = [self.pointer(buf, "readahead")]
+        else:
+            # struct iob_queue_s of struct iob_qentry_s
+            offset = self.fields["readahead"][0]
+            qe_head = utils.offset_of("struct iob_qentry_s", "qe_head")
+            first = utils.read_pointer(conn + offset)
+            heads = [
+                utils.read_pointer(entry.node + qe_head)
+                for entry in walk_links(first, 0)
+            ]
+
+        total = count = 0
+        for iob in filter(None, heads):
+            chains.append(("readahead", iob))
+            total += iob_pktlen(iob)
+            count += len(iob_chain(iob))
+
+        return total, count
+
+    def decode(self, index, conn) -> ConnInfo:
+        buf = utils.read_cached(conn, self.size)
+        domain = self.value(buf, "domain", AF_INET if NET_IPv4 else AF_INET6)
+        laddr, raddr = self.address(buf, domain)
+
+        chains = []
+        txsz = self.wrbuffer_queue(conn, "unacked_q", chains)
+        txsz += self.wrbuffer_queue(conn, "write_q", chains)
+        rxsz, rxiobs = self.readahead(conn, buf, chains)
+        ofosz = self.ofosegs(conn, buf, chains)
+
+        return ConnInfo(
+            self.proto,
+            index,
+            conn,
+            flags=self.value(buf, "flags"),
+            crefs=self.value(buf, "crefs"),
+            laddr=laddr,
+            lport=self.port(buf, "lport"),
+            raddr=raddr,
+            rport=self.port(buf, "rport"),
+            txsz=txsz,
+            txbuf=self.value(buf, "txbuf", -1),
+            rxsz=rxsz,
+            rxbuf=self.value(buf, "rxbuf", -1),
+            rxiobs=rxiobs,
+            ofosz=ofosz,
+            state=self.value(buf, "state"),
+            timer=self.value(buf, "timer"),
+            unacked=self.value(buf, "unacked"),
+            nrtx=self.value(buf, "nrtx"),
+            chains=tuple(chains),
+        )
 
-    type = "struct %s_wrbuffer_s" % protocol
-    node = "wb_node"
-    return sum(entry["wb_iob"]["io_pktlen"] for entry in NxSQueue(queue, type, node))
+    def connections(self) -> List[ConnInfo]:
+        head = gdb.parse_and_eval(f"g_active_{self.proto}_connections")
+        first = int(head["head"])
+        return [
+            self.decode(index, entry.entry)
+            for index, entry in enumerate(
+                walk_links(first, 0, member_offset=self.node_offset)
+            )
+        ]
 
 
-def tcp_ofoseg_bufsize(conn):
-    """Calculate the pending size of out-of-order buffer of a tcp connection"""
+def get_connections(proto) -> List[ConnInfo]:
+    """Return the decoded active connections of a protocol, read once per stop"""
+    if proto not in g_net_snapshot:
+        g_net_snapshot[proto] = ConnDecoder(proto).connections()
 
-    total = 0
-    if utils.get_symbol_value("CONFIG_NET_TCP_OUT_OF_ORDER"):
-        total = sum(
-            seg["data"]["io_pktlen"]
-            for seg in utils.ArrayIterator(conn["ofosegs"], conn["nofosegs"])
-        )
-    return total
+    return g_net_snapshot[proto]
+
+
+class IobPool:
+    """All the IOBs in g_iob_buffer decoded from one read, with their owners"""
+
+    def __init__(self):
+        iob_type = gdb.lookup_type("struct iob_s")
+        align = utils.get_symbol_value("CONFIG_IOB_ALIGNMENT") or 1
+        nbuffers = utils.get_symbol_value("CONFIG_IOB_NBUFFERS")
+        data = utils.offset_of(iob_type, "io_data")
+        size = iob_type.sizeof
+        if utils.get_symbol_value("CONFIG_IOB_ALLOC"):
+            size += utils.get_symbol_value("CONFIG_IOB_BUFSIZE")
+
+        # The same layout as iob_initialize() creates
+        stride = (size + align - 1) // align * align
+        buffer = int(gdb.parse_and_eval("g_iob_buffer").address)
+        base = (buffer + data + align - 1) // align * align - data
+
+        self.flink = utils.offset_of(iob_type, "io_flink")
+        mem = utils.read_memoryview(gdb.selected_inferior(), base, stride * nbuffers)
+        self.iobs = {}  # IOB address -> next IOB address
+        for i in range(nbuffers):
+            self.iobs[base + i * stride] = utils.read_ulong(
+                mem, i * stride + self.flink
+            )
+
+        self.free = self.chain(int(gdb.parse_and_eval("g_iob_freelist")))
+        self.committed = self.chain(int(gdb.parse_and_eval("g_iob_committed")))
+        unused = set(self.free) | set(self.committed)
+        self.inuse = [iob for iob in self.iobs if iob not in unused]
+
+        self.owners = {}  # IOB address -> owner description
+        self.attribute()
+
+        # The first IOB of each chain in use is not linked by any other
+        linked = {self.iobs[iob] for iob in self.inuse}
+        self.heads = [iob for iob in self.inuse if iob not in linked]
+
+    def chain(self, iob) -> List[int]:
+        """Return the IOBs in chain from iob, IOBs out of pool are read from target"""
+        result = []
+        visited = set()
+        while iob and iob not in visited:
+            visited.add(iob)
+            result.append(iob)
+            iob = (
+                self.iobs[iob]
+                if iob in self.iobs
+                else utils.read_pointer(iob + self.flink)
+            )
+
+        return result
+
+    def hold(self, head, owner):
+        for iob in self.chain(head):
+            self.owners.setdefault(iob, owner)
+
+    def attribute(self):
+        """Find the owners of IOBs from connections and network devices"""
+        for proto, config in (
+            ("tcp", "CONFIG_NET_TCP"),
+            ("udp", "CONFIG_NET_UDP"),
+            ("icmp", "CONFIG_NET_ICMP_SOCKET"),
+        ):
+            if not utils.get_symbol_value(config):
+                continue
+
+            for conn in get_connections(proto):
+                for kind, head in conn.chains:
+                    self.hold(head, f"{proto} {kind}")
+
+        dev_type = gdb.lookup_type("struct net_driver_s")
+        name = utils.offset_of(dev_type, "d_ifname")
+        d_iob = utils.offset_of(dev_type, "d_iob")
+        fragout = None
+        if dev_type.has_key("d_fragout"):
+            fragout = utils.offset_of(dev_type, "d_fragout")
+            qe_head = utils.offset_of("struct iob_qentry_s", "qe_head")
+
+        first = int(gdb.parse_and_eval("g_netdevices"))
+        for entry in walk_links(first, utils.offset_of(dev_type, "flink")):
+            ifname = utils.read_cstring(entry.node + name)
+            self.hold(utils.read_pointer(entry.node + d_iob), f"{ifname} d_iob")
+            if fragout is None:
+                continue
+
+            qentry = utils.read_pointer(entry.node + fragout)
+            for qe in walk_links(qentry, 0):
+                head = utils.read_pointer(qe.node + qe_head)
+                self.hold(head, f"{ifname} d_fragout")
+
+    def histogram(self) -> Counter:
+        """Return the number of chains in use of each length"""
+        return Counter(len(self.chain(head)) for head in self.heads)
+
+    def usage(self) -> Counter:
+        """Return the number of IOBs held by each owner"""
+        return Counter(self.owners.get(iob, "unknown") for iob in self.inuse)
+
+    def leaked(self) -> List[int]:
+        """Return the first IOB of the chains in use without a known owner"""
+        return [head for head in self.heads if head not in self.owners]
+
+
+def get_iob_pool() -> IobPool:
+    """Return the decoded IOB pool, read once per stop"""
+    if "pool" not in g_iob_pool:
+        g_iob_pool["pool"] = IobPool()
+
+    return g_iob_pool["pool"]
 
 
 class NetStats(gdb.Command):
     """Network statistics
-    Usage: netstats [iob|pkt|tcp|udp|all]
+    Usage: netstats [-s KEY] [-n TOP] [-j] [iob|pkt|tcp|udp|icmp|all]
 
     Examples: netstats - Show all stats
               netstats all - Show all stats
               netstats iob - Show IOB stats
               netstats tcp udp - Show both TCP and UDP stats
+              netstats -s rxsz -n 10 tcp - Show 10 TCP conns with most rx backlog
+              netstats -j tcp udp - Dump TCP and UDP conns in JSON
     """
 
     def __init__(self):
@@ -176,8 +500,29 @@ class NetStats(gdb.Command):
         except gdb.error as e:
             gdb.write("Failed to get Net Stats: %s\n" % e)
 
-    def tcp_stats(self):
+    def select(self, conns, args):
+        """Sort and keep the top connections as requested"""
+        if args.sort:
+            conns = sorted(
+                conns, key=lambda conn: getattr(conn, args.sort), reverse=True
+            )
+        return conns[: args.top] if args.top else conns
+
+    def total_line(self, conns):
+        gdb.write(
+            "Total: %d conns, tx %d, rx %d in %d IOBs, ofo %d\n"
+            % (
+                len(conns),
+                sum(conn.txsz for conn in conns),
+                sum(conn.rxsz for conn in conns),
+                sum(conn.rxiobs for conn in conns),
+                sum(conn.ofosz for conn in conns),
+            )
+        )
+
+    def tcp_stats(self, args):
         try:
+            conns = get_connections("tcp")
             gdb.write(
                 "TCP Conn: %3s %3s %3s %3s %4s %3s"
                 % ("st", "flg", "ref", "tmr", "uack", "nrt")
@@ -186,73 +531,138 @@ class NetStats(gdb.Command):
                 " %11s %11s+%-5s %21s %21s\n"
                 % ("txbuf", "rxbuf", "ofo", "local_address", "remote_address")
             )
-            for idx, conn in enumerate(socket_for_each_entry("tcp")):
-                state = conn["tcpstateflags"]
-                flags = conn["sconn"]["s_flags"]
-                ref = conn["crefs"]
-                timer = conn["timer"]
-                unacked = conn["tx_unacked"]
-                nrtx = conn["nrtx"]
-
-                txbuf = utils.get_field(conn, "snd_bufs", -1)
-                rxbuf = utils.get_field(conn, "rcv_bufs", -1)
-                txsz = wrbuffer_inqueue_size(
-                    utils.get_field(conn, "unacked_q"), "tcp"
-                ) + wrbuffer_inqueue_size(utils.get_field(conn, "write_q"), "tcp")
-                rxsz = conn["readahead"]["io_pktlen"] if conn["readahead"] else 0
-                ofosz = tcp_ofoseg_bufsize(conn)
-                laddr, lport, raddr, rport = get_ip_port(conn)
-
+            for conn in self.select(conns, args):
                 gdb.write(
                     "%-4d      %3x %3x %3d %3d %4d %3d"
-                    % (idx, state, flags, ref, timer, unacked, nrtx)
+                    % (
+                        conn.index,
+                        conn.state,
+                        conn.flags,
+                        conn.crefs,
+                        conn.timer,
+                        conn.unacked,
+                        conn.nrtx,
+                    )
                 )
                 gdb.write(
                     " %5d/%-5d %5d/%-5d+%-5d %15s:%-5d %15s:%-5d\n"
-                    % (txsz, txbuf, rxsz, rxbuf, ofosz, laddr, lport, raddr, rport)
+                    % (
+                        conn.txsz,
+                        conn.txbuf,
+                        conn.rxsz,
+                        conn.rxbuf,
+                        conn.ofosz,
+                        conn.laddr,
+                        conn.lport,
+                        conn.raddr,
+                        conn.rport,
+                    )
                 )
+            self.total_line(conns)
         except gdb.error as e:
             gdb.write("Failed to get TCP stats: %s\n" % e)
 
-    def udp_stats(self):
+    def udp_stats(self, args):
         try:
+            conns = get_connections("udp")
             gdb.write(
                 "UDP Conn: %4s %11s %11s %21s %21s\n"
                 % ("flg", "txbuf", "rxbuf", "local_address", "remote_address")
             )
-            for idx, conn in enumerate(socket_for_each_entry("udp")):
-                flags = conn["sconn"]["s_flags"]
-                txbuf = utils.get_field(conn, "sndbufs", -1)
-                rxbuf = utils.get_field(conn, "rcvbufs", -1)
-                txsz = wrbuffer_inqueue_size(utils.get_field(conn, "write_q"), "udp")
-                rxsz = conn["readahead"]["io_pktlen"] if conn["readahead"] else 0
-                laddr, lport, raddr, rport = get_ip_port(conn)
-
+            for conn in self.select(conns, args):
                 gdb.write(
                     "%-4d      %4x %5d/%-5d %5d/%-5d %15s:%-5d %15s:%-5d\n"
-                    % (idx, flags, txsz, txbuf, rxsz, rxbuf, laddr, lport, raddr, rport)
+                    % (
+                        conn.index,
+                        conn.flags,
+                        conn.txsz,
+                        conn.txbuf,
+                        conn.rxsz,
+                        conn.rxbuf,
+                        conn.laddr,
+                        conn.lport,
+                        conn.raddr,
+                        conn.rport,
+                    )
                 )
+            self.total_line(conns)
         except gdb.error as e:
             gdb.write("Failed to get UDP stats: %s\n" % e)
 
+    def icmp_stats(self, args):
+        try:
+            conns = get_connections("icmp")
+            gdb.write("ICMP Conn: %4s %3s %11s\n" % ("flg", "ref", "rxbuf"))
+            for conn in self.select(conns, args):
+                gdb.write(
+                    "%-4d       %4x %3d %5d/%-5d\n"
+                    % (conn.index, conn.flags, conn.crefs, conn.rxsz, conn.rxiobs)
+                )
+            self.total_line(conns)
+        except gdb.error as e:
+            gdb.write("Failed to get ICMP stats: %s\n" % e)
+
     def invoke(self, args, from_tty):
-        # Parse the arguments in a simple way
-        if not args or "all" in args:
-            args = "iob pkt tcp udp"
+        parser = argparse.ArgumentParser(description=self.__doc__)
+        parser.add_argument(
+            "sections",
+            nargs="*",
+            choices=["iob", "pkt", "tcp", "udp", "icmp", "all"],
+            default="all",
+            help="The stats to show, default to all",
+        )
+        parser.add_argument(
+            "-s",
+            "--sort",
+            choices=["txsz", "rxsz", "rxiobs", "ofosz", "unacked", "crefs"],
+            help="Sort connections by this field in descending order",
+        )
+        parser.add_argument(
+            "-n", "--top", type=int, help="Only show the first TOP connections"
+        )
+        parser.add_argument(
+            "-j", "--json", action="store_true", help="Dump connections in JSON"
+        )
+
+        try:
+            args = parser.parse_args(gdb.string_to_argv(args))
+        except SystemExit:
+            return
+
+        if "all" in args.sections:
+            args.sections = ["iob", "pkt", "tcp", "udp", "icmp"]
+
+        protocols = {
+            "tcp": (utils.get_symbol_value("CONFIG_NET_TCP"), self.tcp_stats),
+            "udp": (utils.get_symbol_value("CONFIG_NET_UDP"), self.udp_stats),
+            "icmp": (
+                utils.get_symbol_value("CONFIG_NET_ICMP_SOCKET"),
+                self.icmp_stats,
+            ),
+        }
+
+        if args.json:
+            result = {
+                proto: [
+                    conn.toJSON() for conn in self.select(get_connections(proto), args)
+                ]
+                for proto, (enabled, _) in protocols.items()
+                if enabled and proto in args.sections
+            }
+            gdb.write(utils.jsonify(result, indent=4) + "\n")
+            return
 
         # Call the corresponding function
-        if utils.get_symbol_value("CONFIG_MM_IOB") and "iob" in args:
+        if utils.get_symbol_value("CONFIG_MM_IOB") and "iob" in args.sections:
             self.iob_stats()
             gdb.write("\n")
-        if utils.get_symbol_value("CONFIG_NET_STATISTICS") and "pkt" in args:
+        if utils.get_symbol_value("CONFIG_NET_STATISTICS") and "pkt" in args.sections:
             self.pkt_stats()
             gdb.write("\n")
-        if utils.get_symbol_value("CONFIG_NET_TCP") and "tcp" in args:
-            self.tcp_stats()
-            gdb.write("\n")
-        if utils.get_symbol_value("CONFIG_NET_UDP") and "udp" in args:
-            self.udp_stats()
-            gdb.write("\n")
+        for proto, (enabled, stats) in protocols.items():
+            if enabled and proto in args.sections:
+                stats(args)
+                gdb.write("\n")
 
 
 class NetCheckResult(Enum):
@@ -271,11 +681,15 @@ class NetCheck(gdb.Command):
         if utils.get_symbol_value("CONFIG_NET"):
             super().__init__("netcheck", gdb.COMMAND_USER)
 
-    def diagnose(self, *args, **kwargs):
+    def diagnose(self, *args, snapshot=None, **kwargs):
         result, message = NetCheckResult.PASS, []
 
         if utils.get_symbol_value("CONFIG_MM_IOB"):
-            ret, msg = self.check_iob()
+            ret, msg = self.check_iob(snapshot.iob if snapshot else None)
+            result = max(result, ret)
+            message.extend(msg)
+
+            ret, msg = self.check_iob_pool()
             result = max(result, ret)
             message.extend(msg)
 
@@ -287,16 +701,19 @@ class NetCheck(gdb.Command):
                 "data": message,
             }
 
-    def check_iob(self):
+    def check_iob(self, iob=None):
         result = NetCheckResult.PASS
         message = []
         try:
-            nfree = gdb.parse_and_eval("g_iob_sem")["semcount"]
-            nthrottle = (
-                gdb.parse_and_eval("g_throttle_sem")["semcount"]
-                if utils.get_symbol_value("CONFIG_IOB_THROTTLE") > 0
-                else 0
-            )
+            if iob:
+                nfree, nthrottle = iob["nfree"], iob["nthrottle"]
+            else:
+                nfree = gdb.parse_and_eval("g_iob_sem")["semcount"]
+                nthrottle = (
+                    gdb.parse_and_eval("g_throttle_sem")["semcount"]
+                    if utils.get_symbol_value("CONFIG_IOB_THROTTLE") > 0
+                    else 0
+                )
 
             if nfree < 0 or nthrottle < 0:
                 result = max(result, NetCheckResult.WARN)
@@ -311,8 +728,55 @@ class NetCheck(gdb.Command):
         finally:
             return result, message
 
+    def check_iob_pool(self):
+        """Check who holds the IOBs and report the chains without owner"""
+        result = NetCheckResult.PASS
+        message = []
+        try:
+            pool = get_iob_pool()
+        except gdb.error as e:
+            return NetCheckResult.FAILED, ["[FAILED] Failed to analyze IOB: %s" % e]
+
+        message.append(
+            "[INFO] IOB total %d free %d committed %d inuse %d"
+            % (len(pool.iobs), len(pool.free), len(pool.committed), len(pool.inuse))
+        )
+        if usage := pool.usage():
+            message.append(
+                "[INFO] IOB owners: "
+                + ", ".join(f"{owner} {count}" for owner, count in usage.most_common())
+            )
+        if histogram := pool.histogram():
+            message.append(
+                "[INFO] IOB chain length: "
+                + ", ".join(f"{n}x{count}" for n, count in sorted(histogram.items()))
+            )
+
+        if leaked := pool.leaked():
+            # Driver private queues are not visible here, only warn if used up
+            level = "INFO"
+            if not pool.free:
+                result, level = NetCheckResult.WARN, "WARNING"
+
+            niob = sum(len(pool.chain(head)) for head in leaked)
+            message.append(
+                "[%s] %d IOBs in %d chains have no known owner: %s"
+                % (
+                    level,
+                    niob,
+                    len(leaked),
+                    " ".join(hex(head) for head in leaked[:16]),
+                )
+            )
+
+        return result, message
+
     def invoke(self, args, from_tty):
         if utils.get_symbol_value("CONFIG_MM_IOB"):
             result, message = self.check_iob()
+            ret, msg = self.check_iob_pool()
+            result = max(result, ret)
+            message.extend(msg)
+
             gdb.write("IOB check: %s\n" % result.name)
-            gdb.write("\n".join(message))
+            gdb.write("\n".join(message) + "\n")
@@ -28,6 +28,31 @@ STACK_COLORATION_PATTERN = utils.get_symbol_value(
     "STACK_COLOR", locspec="up_create_stack"
 )
 
+# Coalesce stacks closer than this into one memory read when scanning in batch
+STACK_SCAN_GAP = 4096
+STACK_SCAN_MAX = 1024 * 1024
+
+g_max_usage_cache = utils.stop_cache()  # (base, size) -> max usage
+
+
+def stack_spare(buf, pattern: bytes, chunk=4096) -> int:
+    """Return the offset of the first word in buf not matching the pattern, 0 if all match"""
+    word = len(pattern)
+    size = len(buf) // word * word
+    colored = pattern * (chunk // word)
+
+    # Compare a whole chunk at once, only scan word by word in the first dirty chunk
+    for offset in range(0, size, chunk):
+        block = bytes(buf[offset : min(offset + chunk, size)])
+        if block == colored[: len(block)]:
+            continue
+
+        for i in range(0, len(block), word):
+            if block[i : i + word] != pattern:
+                return offset + i
+
+    return 0
+
 
 class Stack(object):
     def __init__(self, name, entry, base, alloc, size, cursp, align):
@@ -90,18 +115,24 @@ class Stack(object):
 
         return usage
 
-    def check_max_usage(self):
-        ptr_4bytes = gdb.Value(self._stack_base).cast(
-            utils.lookup_type("unsigned int").pointer()
-        )
+    def check_max_usage(self, buf=None):
+        """Scan the stack in one read, buf is the stack memory if already fetched"""
+        key = (self._stack_base, self._stack_size)
+        if key in g_max_usage_cache:
+            return g_max_usage_cache[key]
 
-        spare = 0
+        if buf is None:
+            buf = utils.read_memoryview(
+                gdb.selected_inferior(), self._stack_base, self._stack_size
+            )
 
-        for i in range(0, self._stack_size // 4):
-            if int(ptr_4bytes[i]) != self._pattern:
-                spare = i * 4
-                break
-        return self._stack_size - spare
+        byteorder = (
+            "little" if utils.get_target_endianness() == utils.LITTLE_ENDIAN else "big"
+        )
+        pattern = int(self._pattern).to_bytes(4, byteorder)
+        usage = self._stack_size - stack_spare(buf, pattern)
+        g_max_usage_cache[key] = usage
+        return usage
 
     def max_usage(self):
         if not utils.get_symbol_value("CONFIG_STACK_COLORATION"):
@@ -129,6 +160,48 @@ class Stack(object):
         return max_usage >= self._stack_size
 
 
+def scan_max_usages(stacks):
+    """Check max usage of all stacks, adjacent stacks are fetched in one read"""
+    if not utils.get_symbol_value("CONFIG_STACK_COLORATION"):
+        return
+
+    pending = sorted(
+        (
+            stack
+            for stack in stacks
+            if (stack._stack_base, stack._stack_size) not in g_max_usage_cache
+        ),
+        key=lambda stack: stack._stack_base,
+    )
+
+    inf = gdb.selected_inferior()
+    i = 0
+    while i < len(pending):
+        start = pending[i]._stack_base
+        end = pending[i]._stack_top
+        j = i + 1
+        while (
+            j < len(pending)
+            and pending[j]._stack_base - end <= STACK_SCAN_GAP
+            and pending[j]._stack_top - start <= STACK_SCAN_MAX
+        ):
+            end = max(end, pending[j]._stack_top)
+            j += 1
+
+        try:
+            mem = utils.read_memoryview(inf, start, end - start)
+        except gdb.MemoryError:
+            mem = None  # Fallback to read stacks one by one
+
+        for stack in pending[i:j]:
+            offset = stack._stack_base - start
+            stack.check_max_usage(
+                mem[offset : offset + stack._stack_size] if mem else None
+            )
+
+        i = j
+
+
 # Always refetch the stack infos, never cached as we may have threads created/destroyed
 # dynamically!
 def fetch_stacks():
@@ -200,6 +273,7 @@ class StackUsage(gdb.Command):
         args = [int(arg) for arg in args.split()]
 
         pids = stacks.keys() if len(args) == 0 else args
+        scan_max_usages(stacks[pid] for pid in pids if pid in stacks)
 
         gdb.write(
             self._fmt.format(
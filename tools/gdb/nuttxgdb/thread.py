@@ -20,19 +20,27 @@
 
 import argparse
 import re
+from collections import Counter
 from enum import Enum, auto
 
 import gdb
 
 from . import utils
-from .stack import Stack
+from .stack import Stack, scan_max_usages
 
 UINT16_MAX = 0xFFFF
 SEM_TYPE_MUTEX = 4
 TSTATE_TASK_RUNNING = utils.get_symbol_value("TSTATE_TASK_RUNNING")
+TSTATE_WAIT_SEM = utils.get_symbol_value("TSTATE_WAIT_SEM")
+CONFIG_PRIORITY_INHERITANCE = utils.get_symbol_value("CONFIG_PRIORITY_INHERITANCE")
+CONFIG_SEM_PREALLOCHOLDERS = utils.get_symbol_value("CONFIG_SEM_PREALLOCHOLDERS")
 CONFIG_SMP_NCPUS = utils.get_symbol_value("CONFIG_SMP_NCPUS") or 1
 
 
+g_context_cache = utils.stop_cache()  # Context address -> decoded registers
+g_unwind_cache = utils.stop_cache()  # (tcb, depth) -> tuple of frame pc
+
+
 def is_thread_command_supported():
     # Check if the native thread command is available by compare the number of threads.
     # It should have at least CONFIG_SMP_NCPUS of idle threads.
@@ -42,6 +50,7 @@ def is_thread_command_supported():
 class Registers:
     saved_regs = None
     reginfo = None
+    context_size = 0  # Bytes to read to cover all saved registers in context
 
     def __init__(self):
         if not Registers.reginfo:
@@ -95,21 +104,66 @@ class Registers:
                 }
 
             Registers.reginfo = reginfo
+            Registers.context_size = (
+                max((info["tcb_reg_off"] for info in reginfo.values()), default=0)
+                + utils.lookup_type("uintptr_t").sizeof
+            )
             utils.switch_inferior(1)  # Switch back
             utils.suppress_cli_notifications(state)
 
-    def load(self, regs):
-        """Load registers from context register address"""
+    def decode(self, regs):
+        """Decode registers from context register address, the whole context is read once"""
         regs = int(regs)
-        for name, info in Registers.reginfo.items():
-            addr = regs + info["tcb_reg_off"]
-            # value = *(uintptr_t *)addr
-            value = (
-                gdb.Value(addr)
-                .cast(utils.lookup_type("uintptr_t").pointer())
-                .dereference()
-            )
-            gdb.execute(f"set ${name}={int(value)}")
+        if regs in g_context_cache:
+            return g_context_cache[regs]
+
+        mem = utils.read_memoryview(
+            gdb.selected_inferior(), regs, Registers.context_size
+        )
+        read = (
+            utils.read_u64
+            if utils.lookup_type("uintptr_t").sizeof == 8
+            else utils.read_u32
+        )
+
+        registers = {
+            name: read(mem, info["tcb_reg_off"])
+            for name, info in Registers.reginfo.items()
+        }
+        g_context_cache[regs] = registers
+        return registers
+
+    def apply(self, registers):
+        """Set all registers with a single command"""
+        if not registers:
+            return
+
+        # Switching to another task's context doesn't change the target state
+        with utils.keep_stop_caches():
+            try:
+                # GDB evaluates the comma separated assignments in order
+                gdb.execute(
+                    "set "
+                    + ",".join(
+                        f"${name}={int(value)}" for name, value in registers.items()
+                    )
+                )
+            except gdb.error:
+                # Some register failed, set them one by one to skip the bad one
+                for name, value in registers.items():
+                    try:
+                        gdb.execute(f"set ${name}={int(value)}")
+                    except gdb.error as e:
+                        gdb.write(f"Failed to set register {name}: {e}\n")
+
+    def load(self, regs):
+        """Load registers from context register address, return False if it's NULL"""
+        if int(regs) == 0:
+            gdb.write("regs is NULL\n")
+            return False
+
+        self.apply(self.decode(regs))
+        return True
 
     def switch(self, pid):
         """Switch to the specified thread"""
@@ -147,9 +201,7 @@ class Registers:
         if not Registers.saved_regs:
             return
 
-        for name, value in Registers.saved_regs.items():
-            gdb.execute(f"set ${name}={int(value)}")
-
+        self.apply(Registers.saved_regs)
         Registers.saved_regs = None
 
 
@@ -304,6 +356,16 @@ class Nxthread(gdb.Command):
         else:
             super().__init__("nxthread", gdb.COMMAND_USER)
 
+    @staticmethod
+    def apply_command(tcb, command):
+        """Execute command with the registers of tcb, then restore the current ones"""
+        g_registers.save()
+        try:
+            g_registers.load(tcb["xcp"]["regs"])
+            gdb.execute(f"{command}\n")
+        finally:
+            g_registers.restore()
+
     def invoke(self, args, from_tty):
         npidhash = gdb.parse_and_eval("g_npidhash")
         pidhash = gdb.parse_and_eval("g_pidhash")
@@ -327,13 +389,11 @@ class Nxthread(gdb.Command):
                     except gdb.error and UnicodeDecodeError:
                         gdb.write(f"Thread {i}\n")
 
-                    gdb.execute(f"setregs g_pidhash[{i}]->xcp.regs")
                     cmd_arg = ""
                     for cmd in arg[2:]:
                         cmd_arg += cmd + " "
 
-                    gdb.execute(f"{cmd_arg}\n")
-                    g_registers.restore()
+                    self.apply_command(tcb, cmd_arg)
             else:
                 threadlist = []
                 i = 0
@@ -359,9 +419,7 @@ class Nxthread(gdb.Command):
                         except gdb.error and UnicodeDecodeError:
                             gdb.write(f"Thread {i}\n")
 
-                        gdb.execute(f"setregs g_pidhash[{i}]->xcp.regs")
-                        gdb.execute(f"{cmd}\n")
-                        g_registers.restore()
+                        self.apply_command(pidhash[i], cmd)
 
         else:
             if (
@@ -374,11 +432,163 @@ class Nxthread(gdb.Command):
                 ):
                     g_registers.restore()
                 else:
-                    gdb.execute("setregs g_pidhash[%s]->xcp.regs" % arg[0])
+                    g_registers.save()
+                    g_registers.load(pidhash[int(arg[0])]["xcp"]["regs"])
             else:
                 gdb.write(f"Invalid thread id {arg[0]}\n")
 
 
+class NxBacktraceAll(gdb.Command):
+    """Collect backtraces of all tasks and group tasks with identical backtrace
+    Usage: nxbt-all [-d DEPTH] [-f FOLDED]
+
+    Etc: nxbt-all
+         nxbt-all -d 16
+         nxbt-all -f nuttx.folded
+
+    The folded stack file can be fed to flame graph tools directly.
+    """
+
+    def __init__(self):
+        super().__init__("nxbt-all", gdb.COMMAND_USER)
+
+    def unwind(self, depth):
+        """Unwind the current registers and return the frame pc tuple"""
+        pcs = []
+        try:
+            frame = gdb.newest_frame()
+            while frame and len(pcs) < depth:
+                pcs.append(int(frame.pc()))
+                frame = frame.older()
+        except gdb.error:
+            pass  # Stop at the frame we can't unwind
+
+        return tuple(pcs)
+
+    def cpu_thread(self, cpu):
+        """Return the gdb thread of cpu, if the target exposes CPUs as threads"""
+        if is_thread_command_supported():
+            return None  # Threads are tasks, not CPUs
+
+        for thread in gdb.selected_inferior().threads():
+            if thread.num == cpu + 1:
+                return thread
+        return None
+
+    def unwind_running(self, tcb, depth):
+        """Unwind a running task with the registers of its CPU, return None if
+        they are not available"""
+        if not utils.is_target_smp():
+            g_registers.apply(Registers.saved_regs)
+            return self.unwind(depth)
+
+        thread = self.cpu_thread(int(tcb["cpu"]))
+        if thread is None:
+            return None  # Can't tell which CPU the saved registers belong to
+
+        selected = gdb.selected_thread()
+        if thread == selected:
+            g_registers.apply(Registers.saved_regs)
+            return self.unwind(depth)
+
+        # Registers of other CPUs are untouched, unwind in their own thread
+        thread.switch()
+        try:
+            return self.unwind(depth)
+        finally:
+            selected.switch()
+
+    def collect(self, tcbs, depth):
+        """Return backtrace signature to list of tcb, tasks that can't be
+        unwound are listed under signature None"""
+        signatures = {}
+
+        g_registers.save()
+        try:
+            for tcb in tcbs:
+                key = (int(tcb), depth)
+                if key not in g_unwind_cache:
+                    if tcb["task_state"] == TSTATE_TASK_RUNNING:
+                        g_unwind_cache[key] = self.unwind_running(tcb, depth)
+                    elif not tcb["xcp"]["regs"]:
+                        g_unwind_cache[key] = None
+                    else:
+                        g_registers.load(tcb["xcp"]["regs"])
+                        g_unwind_cache[key] = self.unwind(depth)
+
+                signatures.setdefault(g_unwind_cache[key], []).append(tcb)
+        finally:
+            g_registers.restore()
+
+        return signatures
+
+    def write_folded(self, signatures, filename):
+        def frame_name(addr, func):
+            # Strip the "<func+offset>" decoration from the symbol
+            return func.strip("<>").split("+")[0] or hex(addr)
+
+        folded = Counter()
+        for pcs, tcbs in signatures.items():
+            if pcs is None:
+                continue
+
+            backtrace = utils.Backtrace(pcs)
+            frames = ";".join(
+                frame_name(addr, func) for addr, func, _ in reversed(backtrace)
+            )
+            for tcb in tcbs:
+                folded[f"{utils.get_task_name(tcb)};{frames}"] += 1
+
+        with open(filename, "w") as f:
+            f.write("".join(f"{stack} {count}\n" for stack, count in folded.items()))
+
+        gdb.write(f"Write folded stacks to {filename}\n")
+
+    def invoke(self, args, from_tty):
+        parser = argparse.ArgumentParser(description=self.__doc__)
+        parser.add_argument(
+            "-d", "--depth", type=int, default=64, help="Max frames to unwind"
+        )
+        parser.add_argument(
+            "-f", "--folded", type=str, help="Write folded stacks to file"
+        )
+
+        try:
+            args = parser.parse_args(gdb.string_to_argv(args))
+        except SystemExit:
+            return
+
+        signatures = self.collect(utils.get_tcbs(), args.depth)
+        unavailable = signatures.pop(None, [])
+
+        output = []
+        ordered = sorted(signatures.items(), key=lambda x: len(x[1]), reverse=True)
+        for i, (pcs, tcbs) in enumerate(ordered):
+            tasks = " ".join(
+                f"{int(tcb['pid'])}({utils.get_task_name(tcb)})" for tcb in tcbs
+            )
+            output.append(f"Backtrace #{i}, {len(tcbs)} task(s): {tasks}\n")
+            output.append(str(utils.Backtrace(pcs)))
+            output.append("\n")
+
+        if unavailable:
+            tasks = " ".join(
+                f"{int(tcb['pid'])}({utils.get_task_name(tcb)})" for tcb in unavailable
+            )
+            output.append(
+                f"No registers to unwind, {len(unavailable)} task(s): {tasks}\n\n"
+            )
+
+        gdb.write("".join(output))
+        gdb.write(
+            f"{sum(len(t) for t in signatures.values()) + len(unavailable)} tasks, "
+            f"{len(signatures)} unique backtraces\n"
+        )
+
+        if args.folded:
+            self.write_folded(signatures, args.folded)
+
+
 class Nxcontinue(gdb.Command):
     """Restore the registers and continue the execution"""
 
@@ -451,6 +661,18 @@ class Ps(gdb.Command):
         # By default we align to the right, whcih respects the nuttx foramt
         self._fmt_wx = "{0: >{width}}"
 
+    def get_stack(self, tcb):
+        view = utils.get_view(tcb, "struct tcb_s")
+        return Stack(
+            utils.get_task_name(tcb),
+            hex(tcb["entry"]["pthread"]),  # should use main?
+            view.stack_base_ptr,
+            view.stack_alloc_ptr,
+            view.adj_stack_size,
+            utils.get_sp(tcb),
+            4,
+        )
+
     def parse_and_show_info(self, tcb):
         def get_macro(x):
             return utils.get_symbol_value(x)
@@ -461,23 +683,24 @@ class Ps(gdb.Command):
         def cast2ptr(x, t):
             return x.cast(utils.lookup_type(t).pointer())
 
-        pid = int(tcb["pid"])
-        group = int(tcb["group"]["tg_pid"])
-        priority = int(tcb["sched_priority"])
+        view = utils.get_view(tcb, "struct tcb_s")
+        pid = view.pid
+        group = utils.get_view(view.group, "struct task_group_s").tg_pid
+        priority = view.sched_priority
 
         policy = eval2str(
             TaskSchedPolicy,
-            (tcb["flags"] & get_macro("TCB_FLAG_POLICY_MASK"))
+            (view.flags & get_macro("TCB_FLAG_POLICY_MASK"))
             >> get_macro("TCB_FLAG_POLICY_SHIFT"),
         )
 
         task_type = eval2str(
             TaskType,
-            (tcb["flags"] & get_macro("TCB_FLAG_TTYPE_MASK"))
+            (view.flags & get_macro("TCB_FLAG_TTYPE_MASK"))
             >> get_macro("TCB_FLAG_TTYPE_SHIFT"),
         )
 
-        npx = "P" if (tcb["flags"] & get_macro("TCB_FLAG_EXIT_PROCESSING")) else "-"
+        npx = "P" if (view.flags & get_macro("TCB_FLAG_EXIT_PROCESSING")) else "-"
 
         waiter = (
             str(int(cast2ptr(tcb["waitobj"], "mutex_t")["holder"]))
@@ -485,7 +708,7 @@ class Ps(gdb.Command):
             and cast2ptr(tcb["waitobj"], "sem_t")["flags"] & get_macro("SEM_TYPE_MUTEX")
             else ""
         )
-        state_and_event = eval2str(TaskState, (tcb["task_state"])) + (
+        state_and_event = eval2str(TaskState, view.task_state) + (
             "@Mutex_Holder: " + waiter if waiter else ""
         )
         state_and_event = state_and_event.split("_")
@@ -506,35 +729,27 @@ class Ps(gdb.Command):
             2:
         ]  # exclude "0x"
 
-        st = Stack(
-            utils.get_task_name(tcb),
-            hex(tcb["entry"]["pthread"]),  # should use main?
-            int(tcb["stack_base_ptr"]),
-            int(tcb["stack_alloc_ptr"]),
-            int(tcb["adj_stack_size"]),
-            utils.get_sp(tcb),
-            4,
-        )
+        st = self.get_stack(tcb)
 
         stacksz = st._stack_size
         used = st.max_usage()
-        filled = "{0:.2%}".format(st.max_usage() / st._stack_size)
+        filled = "{0:.2%}".format(used / st._stack_size)
 
-        cpu = int(tcb["cpu"]) if get_macro("CONFIG_SMP") else 0
+        cpu = view.cpu if get_macro("CONFIG_SMP") else 0
 
         # For a task we need to display its cmdline arguments, while for a thread we display
         # pointers to its entry and argument
         cmd = ""
         name = utils.get_task_name(tcb)
 
-        if int(tcb["flags"] & get_macro("TCB_FLAG_TTYPE_MASK")) == int(
+        if view.flags & get_macro("TCB_FLAG_TTYPE_MASK") == int(
             get_macro("TCB_FLAG_TTYPE_PTHREAD")
         ):
             entry = tcb["entry"]["main"]
             ptcb = cast2ptr(tcb, "struct pthread_tcb_s")
             arg = ptcb["arg"]
             cmd = " ".join((name, hex(entry), hex(arg)))
-        elif tcb["pid"] < get_macro("CONFIG_SMP_NCPUS"):
+        elif pid < get_macro("CONFIG_SMP_NCPUS"):
             # This must be the Idle Tasks, hence we just get its name
             cmd = name
         else:
@@ -554,7 +769,7 @@ class Ps(gdb.Command):
 
         if not utils.get_symbol_value("CONFIG_SCHED_CPULOAD_NONE"):
             load = "{0:.1%}".format(
-                int(tcb["ticks"]) / int(gdb.parse_and_eval("g_cpuload_total"))
+                view.ticks / int(gdb.parse_and_eval("g_cpuload_total"))
             )
         else:
             load = "Dis."
@@ -608,71 +823,284 @@ class Ps(gdb.Command):
         )
         gdb.write("\n")
 
-        for tcb in utils.get_tcbs():
+        tcbs = utils.get_tcbs()
+
+        # Scan all stacks in batch, the result is cached for each task
+        stacks = []
+        for tcb in tcbs:
+            try:
+                stacks.append(self.get_stack(tcb))
+            except gdb.GdbError:
+                pass  # Reported when showing this task
+
+        scan_max_usages(stacks)
+
+        for tcb in tcbs:
             self.parse_and_show_info(tcb)
 
 
-class DeadLock(gdb.Command):
-    """Detect and report if threads have deadlock."""
+class WaitGraph:
+    """Wait-for graph of all tasks, built from a single TCB snapshot.
+    Waiting for a mutex or a semaphore held by a single task is a hard edge.
+    A semaphore with several holders is granted when any of them posts, so
+    the waiter only possibly depends on each of them, these soft edges are
+    reported apart and never form a deadlock cycle.
+    """
 
-    def __init__(self):
-        super().__init__("deadlock", gdb.COMMAND_USER)
+    def __init__(self, tcbs):
+        self.tasks = {}  # pid -> (name, priority)
+        self.edges = {}  # waiter pid -> holder pids
+        self.soft = {}  # waiter pid -> holder pids of a multi-holder semaphore
+        self.cyclic = set()  # pids in any deadlock cycle
 
-    def has_deadlock(self, pid):
-        """Check if the thread has a deadlock"""
-        tcb = utils.get_tcb(pid)
-        if not tcb or not tcb["waitobj"]:
-            return False
+        for tcb in tcbs:
+            view = utils.get_view(tcb, "struct tcb_s")
+            pid = view.pid
+            self.tasks[pid] = (utils.get_task_name(tcb), view.sched_priority)
+            if view.task_state != TSTATE_WAIT_SEM or not view.waitobj:
+                continue
 
-        sem = tcb["waitobj"].cast(utils.lookup_type("sem_t").pointer())
-        if not sem["flags"] & SEM_TYPE_MUTEX:
-            return False
+            holders = self.get_holders(tcb["waitobj"])
+            if len(holders) == 1:
+                self.edges[pid] = holders
+            elif holders:
+                self.soft[pid] = holders
+
+    @staticmethod
+    def get_holders(waitobj):
+        """Return the pid list of tasks holding the mutex or semaphore"""
+        if not waitobj:
+            return []
+
+        sem = waitobj.cast(utils.lookup_type("sem_t").pointer())
+        if sem["flags"] & SEM_TYPE_MUTEX:
+            mutex = waitobj.cast(utils.lookup_type("mutex_t").pointer())
+            holder = int(mutex["holder"])
+            return [holder] if holder >= 0 else []
+
+        if not CONFIG_PRIORITY_INHERITANCE:
+            return []  # Semaphore holders are not tracked
+
+        holders = []
+        if CONFIG_SEM_PREALLOCHOLDERS:
+            visited = set()
+            holder = sem["hhead"]
+            while holder and int(holder) not in visited:
+                visited.add(int(holder))
+                if holder["htcb"]:
+                    holders.append(int(holder["htcb"]["pid"]))
+                holder = holder["flink"]
+        elif sem["holder"]["htcb"]:
+            holders.append(int(sem["holder"]["htcb"]["pid"]))
+
+        return holders
+
+    def strongly_connected(self):
+        """Tarjan's algorithm without recursion, return the list of SCC"""
+        index = {}
+        lowlink = {}
+        stack = []
+        onstack = set()
+        result = []
+
+        for root in self.edges:
+            if root in index:
+                continue
 
-        # It's waiting on a mutex
-        mutex = tcb["waitobj"].cast(utils.lookup_type("mutex_t").pointer())
-        holder = mutex["holder"]
-        if holder in self.holders:
-            return True
+            index[root] = lowlink[root] = len(index)
+            stack.append(root)
+            onstack.add(root)
+            work = [(root, iter(self.edges.get(root, ())))]
+
+            while work:
+                node, successors = work[-1]
+                for succ in successors:
+                    if succ not in index:
+                        index[succ] = lowlink[succ] = len(index)
+                        stack.append(succ)
+                        onstack.add(succ)
+                        work.append((succ, iter(self.edges.get(succ, ()))))
+                        break
+                    elif succ in onstack:
+                        lowlink[node] = min(lowlink[node], index[succ])
+                else:
+                    work.pop()
+                    if work:
+                        parent = work[-1][0]
+                        lowlink[parent] = min(lowlink[parent], lowlink[node])
+
+                    if lowlink[node] == index[node]:
+                        scc = []
+                        while True:
+                            member = stack.pop()
+                            onstack.discard(member)
+                            scc.append(member)
+                            if member == node:
+                                break
+                        result.append(scc)
+
+        return result
+
+    def cycles(self):
+        """Return the list of (pid, holders) for each deadlock cycle"""
+        cycles = []
+        for scc in self.strongly_connected():
+            start = min(scc)
+            if len(scc) == 1 and start not in self.edges.get(start, ()):
+                continue
 
-        self.holders.append(holder)
-        return self.has_deadlock(holder)
+            self.cyclic.update(scc)
 
-    def collect(self, tcbs):
-        """Collect the deadlock information"""
+            # Follow the wait-for edges inside the SCC to print the cycle
+            members = set(scc)
+            path = [start]
+            while True:
+                node = next(h for h in self.edges[path[-1]] if h in members)
+                if node in path:
+                    break
+                path.append(node)
 
-        detected = []
-        collected = []
-        for tcb in tcbs:
-            self.holders = []  # Holders for this tcb
-            pid = tcb["pid"]
-            if pid in detected or not self.has_deadlock(tcb["pid"]):
+            cycles.append((start, path[1:] + [node]))
+
+        return cycles
+
+    def chains(self, minlen):
+        """Return the wait chains with at least minlen tasks, call cycles() firstly.
+        A chain waiting for a deadlocked task ends at the first task in cycle.
+        """
+        longest = {pid: (1, None) for pid in self.cyclic}  # pid -> (length, next)
+
+        for root in self.edges:
+            if root in longest:
                 continue
 
-            # Deadlock detected
-            detected.append(pid)
-            detected.extend(self.holders)
-            collected.append((pid, self.holders))
+            work = [root]
+            while work:
+                node = work[-1]
+                successors = self.edges.get(node, ())
+                pending = [h for h in successors if h not in longest]
+                if pending:
+                    work.extend(pending)
+                    continue
 
-        return collected
+                work.pop()
+                if node not in longest:
+                    succ = max(successors, key=lambda h: longest[h][0], default=None)
+                    length = longest[succ][0] + 1 if succ is not None else 1
+                    longest[node] = (length, succ)
 
-    def diagnose(self, *args, **kwargs):
-        collected = self.collect(utils.get_tcbs())
+        waited = {h for pid, holders in self.edges.items() for h in holders}
+        chains = []
+        for head in self.edges:
+            if head in self.cyclic or head in waited or longest[head][0] < minlen:
+                continue
+
+            chain = [head]
+            while (succ := longest[chain[-1]][1]) is not None:
+                chain.append(succ)
+            chains.append(chain)
+
+        return sorted(chains, key=len, reverse=True)
+
+    def inversions(self):
+        """Return (waiter, holder) where holder runs at lower priority than waiter"""
+        return [
+            (waiter, holder)
+            for waiter, holders in self.edges.items()
+            for holder in holders
+            if holder in self.tasks and self.tasks[holder][1] < self.tasks[waiter][1]
+        ]
+
+    def possible(self):
+        """Return (waiter, holders) for the waiters of a multi-holder semaphore"""
+        return list(self.soft.items())
+
+    def orphans(self):
+        """Return (waiter, holder) where holder task no longer exists"""
+        return [
+            (waiter, holder)
+            for edges in (self.edges, self.soft)
+            for waiter, holders in edges.items()
+            for holder in holders
+            if holder not in self.tasks
+        ]
+
+
+class DeadLock(gdb.Command):
+    """Detect and report if threads have deadlock.
+    Usage: deadlock [-c CHAIN]
+
+    Also report wait chains longer than CHAIN(default 3) tasks, priority
+    inversions between waiters and mutex holders, and possible dependencies
+    on semaphores with several holders, which are not counted as deadlock.
+    """
+
+    def __init__(self):
+        super().__init__("deadlock", gdb.COMMAND_USER)
+
+    def collect(self, tcbs):
+        """Collect the deadlock information"""
+        self.graph = WaitGraph(tcbs)
+        return self.graph.cycles()
+
+    def diagnose(self, *args, snapshot=None, **kwargs):
+        collected = self.collect(snapshot.tcbs if snapshot else utils.get_tcbs())
 
         return {
             "title": "Deadlock Report",
             "summary": f"{'No' if not collected else len(collected)} deadlocks",
             "command": "deadlock",
             "deadlocks": {int(pid): [i for i in h] for pid, h in collected},
+            "chains": self.graph.chains(3),
+            "inversions": self.graph.inversions(),
+            "possible": {int(pid): h for pid, h in self.graph.possible()},
         }
 
+    def format_task(self, pid):
+        name, priority = self.graph.tasks.get(pid, ("<exited>", -1))
+        return f'{pid}("{name}", pri {priority})'
+
     def invoke(self, args, from_tty):
+        parser = argparse.ArgumentParser(description=self.__doc__)
+        parser.add_argument(
+            "-c", "--chain", type=int, default=3, help="Min tasks of a wait chain"
+        )
+
+        try:
+            args = parser.parse_args(gdb.string_to_argv(args))
+        except SystemExit:
+            return
+
         collected = self.collect(utils.get_tcbs())
         if not collected:
-            gdb.write("No deadlock detected.")
-            return
+            gdb.write("No deadlock detected.\n")
 
         for pid, holders in collected:
-            gdb.write(f'Thread {pid} "{utils.get_task_name(pid)}" has deadlocked!\n')
+            name = self.graph.tasks[pid][0]
+            gdb.write(f'Thread {pid} "{name}" has deadlocked!\n')
             gdb.write(f"  holders: {pid}->")
             gdb.write("->".join(str(pid) for pid in holders))
             gdb.write("\n")
+
+        for chain in self.graph.chains(args.chain):
+            gdb.write(f"Wait chain of {len(chain)} tasks:\n  ")
+            gdb.write(" waits ".join(self.format_task(pid) for pid in chain))
+            gdb.write("\n")
+
+        for waiter, holder in self.graph.inversions():
+            gdb.write(
+                f"Priority inversion: {self.format_task(waiter)} "
+                f"waits for {self.format_task(holder)}\n"
+            )
+
+        for waiter, holders in self.graph.possible():
+            gdb.write(
+                f"Thread {self.format_task(waiter)} possibly waits for any of "
+                + ", ".join(self.format_task(pid) for pid in holders)
+                + "\n"
+            )
+
+        for waiter, holder in self.graph.orphans():
+            gdb.write(
+                f"Thread {self.format_task(waiter)} waits for exited task {holder}\n"
+            )
@@ -24,6 +24,7 @@ import json
 import os
 import re
 import shlex
+from contextlib import contextmanager
 from enum import Enum
 from typing import List, Optional, Tuple, Union
 
@@ -35,14 +36,23 @@ from .protocols.thread import Tcb
 g_symbol_cache = {}
 g_type_cache = {}
 g_macro_ctx = None
+g_stop_caches = []  # Caches only valid while the target stays stopped
+g_pc_cache = {}  # Address -> (function, source), symbols never change
+g_stop_generation = 0  # Bumped every time the stop caches are invalidated
+g_target_identity = None  # Target the stop caches were filled from
+g_keep_stop_caches = 0  # Register changes made by ourselves don't invalidate
+g_commands = {}  # Command class -> the instance registered to gdb
+g_layout_cache = {}  # (type name, field) -> (offset, type), valid per objfile
 
 
 class Value(gdb.Value):
+    attributes = frozenset(dir(gdb.Value))
+
     def __init__(self, obj: gdb.Value):
         super().__init__(obj)
 
     def __getattr__(self, key):
-        if hasattr(super(), key):
+        if key in Value.attributes:
             return Value(super().__getattribute__(key))
         else:
             return Value(super().__getitem__(key))
@@ -52,7 +62,9 @@ class Value(gdb.Value):
 
     def cast(self, type: str | gdb.Type, ptr: bool = False) -> Optional["Value"]:
         try:
-            gdb_type = gdb.lookup_type(type) if isinstance(type, str) else type
+            gdb_type = lookup_type(type) if isinstance(type, str) else type
+            if gdb_type is None:
+                return None
             if ptr:
                 gdb_type = gdb_type.pointer()
             return Value(super().cast(gdb_type))
@@ -107,6 +119,10 @@ class Backtrace:
         if not addr:
             return
 
+        pc = int(addr)
+        if pc in g_pc_cache:
+            return (pc, *g_pc_cache[pc])
+
         if type(addr) is int:
             addr = gdb.Value(addr)
 
@@ -114,9 +130,10 @@ class Backtrace:
             addr = addr.cast(gdb.lookup_type("void").pointer())
 
         func = addr.format_string(symbols=True, address=False)
-        sym = gdb.find_pc_line(int(addr))
+        sym = gdb.find_pc_line(pc)
         source = str(sym.symtab) + ":" + str(sym.line)
-        return (int(addr), func, source)
+        g_pc_cache[pc] = (func, source)
+        return (pc, func, source)
 
     @property
     def formatted(self):
@@ -161,6 +178,96 @@ def lookup_type(name, block=None) -> gdb.Type:
 
 long_type = lookup_type("long")
 
+
+def stop_cache() -> dict:
+    """Return a dict cache which is cleared once the target may have changed:
+    it resumes or stops, memory or registers are written, objfiles change, or
+    another inferior, connection or core file is being debugged"""
+    cache = {}
+    g_stop_caches.append(cache)
+    return cache
+
+
+def invalidate_stop_caches(event=None):
+    """Clear all the caches created by stop_cache()"""
+    global g_stop_generation
+    g_stop_generation += 1
+    for cache in g_stop_caches:
+        cache.clear()
+
+
+def target_identity():
+    """Return what identifies the target being debugged, it changes when
+    another core file is loaded or the target is connected again"""
+    inferior = gdb.selected_inferior()
+    return (
+        inferior.num,
+        inferior.pid,
+        getattr(inferior, "connection_num", None),
+        inferior.progspace.filename,
+    )
+
+
+def check_target_identity(event=None):
+    """Invalidate the stop caches if they were filled from another target"""
+    global g_target_identity
+    try:
+        identity = target_identity()
+    except gdb.error:
+        identity = None
+
+    if identity != g_target_identity:
+        g_target_identity = identity
+        invalidate_stop_caches()
+
+
+def stop_generation() -> int:
+    """Return a number that changes whenever the target state may have changed"""
+    check_target_identity()
+    return g_stop_generation
+
+
+@contextmanager
+def keep_stop_caches():
+    """Keep stop caches on register changes made inside, which only switch
+    the task being inspected, not the target state"""
+    global g_keep_stop_caches
+    g_keep_stop_caches += 1
+    try:
+        yield
+    finally:
+        g_keep_stop_caches -= 1
+
+
+def on_register_changed(event):
+    if not g_keep_stop_caches:
+        invalidate_stop_caches()
+
+
+def invalidate_type_caches(event=None):
+    """Clear the type and layout caches once objfiles are loaded or removed"""
+    g_type_cache.clear()
+    g_layout_cache.clear()
+
+
+for name, handler in (
+    ("cont", invalidate_stop_caches),
+    ("stop", invalidate_stop_caches),
+    ("memory_changed", invalidate_stop_caches),
+    ("register_changed", on_register_changed),
+    ("new_objfile", invalidate_stop_caches),
+    ("clear_objfiles", invalidate_stop_caches),
+    ("new_inferior", invalidate_stop_caches),
+    ("inferior_deleted", invalidate_stop_caches),
+    ("connection_removed", invalidate_stop_caches),  # GDB 13+
+    ("executable_changed", invalidate_stop_caches),  # GDB 14+
+    ("before_prompt", check_target_identity),  # Catches core-file and reconnects
+    ("new_objfile", invalidate_type_caches),
+    ("clear_objfiles", invalidate_type_caches),
+):
+    if hasattr(gdb.events, name):
+        getattr(gdb.events, name).connect(handler)
+
 # Common Helper Functions
 
 
@@ -170,8 +277,18 @@ def get_long_type():
     return long_type
 
 
+def layout_key(typeobj: Union[gdb.Type, str]) -> Optional[str]:
+    """Return the layout cache key of a type, None for anonymous types"""
+    name = typeobj if type(typeobj) is str else str(typeobj)
+    return None if "{...}" in name else name
+
+
 def offset_of(typeobj: Union[gdb.Type, str], field: str) -> Union[int, None]:
     """Return the offset of a field in a structure"""
+    key = layout_key(typeobj)
+    if (key, field) in g_layout_cache:
+        return g_layout_cache[(key, field)][0]
+
     if type(typeobj) is str:
         typeobj = gdb.lookup_type(typeobj)
 
@@ -182,11 +299,33 @@ def offset_of(typeobj: Union[gdb.Type, str], field: str) -> Union[int, None]:
         if f.name == field:
             if f.bitpos is None:
                 break
+            if key:
+                g_layout_cache[(key, field)] = (f.bitpos // 8, f.type)
             return f.bitpos // 8
 
     raise gdb.GdbError(f"Field {field} not found in type {typeobj}")
 
 
+def field_info(typeobj: Union[gdb.Type, str], path: str) -> Tuple[int, gdb.Type]:
+    """Return the offset and type of a nested field like "sconn.s_flags" """
+    key = layout_key(typeobj)
+    if (key, path) in g_layout_cache:
+        return g_layout_cache[(key, path)]
+
+    if type(typeobj) is str:
+        typeobj = gdb.lookup_type(typeobj)
+
+    offset = 0
+    for field in path.split("."):
+        typeobj = typeobj.strip_typedefs()
+        offset += offset_of(typeobj, field)
+        typeobj = typeobj[field].type
+
+    if key:
+        g_layout_cache[(key, path)] = (offset, typeobj)
+    return offset, typeobj
+
+
 def container_of(
     ptr: Union[gdb.Value, int], typeobj: Union[gdb.Type, str], member: str
 ) -> gdb.Value:
@@ -210,13 +349,16 @@ def container_of(
     """
 
     if isinstance(typeobj, str):
-        typeobj = gdb.lookup_type(typeobj).pointer()
+        name = typeobj
+        typeobj = lookup_type(name)
+        if typeobj is None:
+            raise gdb.error(f"No type named {name}.")
 
     if typeobj.code is not gdb.TYPE_CODE_PTR:
         typeobj = typeobj.pointer()
 
-    addr = gdb.Value(ptr).cast(long_type)
-    return gdb.Value(addr - offset_of(typeobj, member)).cast(typeobj)
+    addr = int(ptr)
+    return gdb.Value(addr - offset_of(typeobj.target(), member)).cast(typeobj)
 
 
 class ContainerOf(gdb.Function):
@@ -380,21 +522,30 @@ def import_check(module, name="", errmsg=""):
     return getattr(module, name) if name else module
 
 
+HEXDUMP_CHUNK = 0x10000
+HEXDUMP_ASCII = bytes(c if 32 <= c <= 126 else ord(".") for c in range(256))
+
+
+def format_hexdump(address: int, data: bytes) -> str:
+    """Format data read from address as hexdump lines of 16 bytes"""
+    text = data.translate(HEXDUMP_ASCII).decode()
+    lines = []
+    for i in range(0, len(data), 16):
+        hex_values = data[i : i + 16].hex(" ")
+        lines.append(f"{i + address:08x}  {hex_values:<47}  {text[i : i + 16]} \n")
+    return "".join(lines)
+
+
 def hexdump(address, size):
+    """Dump target memory, read in big chunks and written to console at once"""
     address = int(address)
     inf = gdb.inferiors()[0]
-    mem = inf.read_memory(address, size)
-    bytes = mem.tobytes()
-    for i in range(0, len(bytes), 16):
-        chunk = bytes[i : i + 16]
-        gdb.write(f"{i + address:08x}  ")
-        hex_values = " ".join(f"{byte:02x}" for byte in chunk)
-        hex_display = f"{hex_values:<47}"
-        gdb.write(hex_display)
-        ascii_values = "".join(
-            chr(byte) if 32 <= byte <= 126 else "." for byte in chunk
-        )
-        gdb.write(f"  {ascii_values} \n")
+    output = []
+    for offset in range(0, size, HEXDUMP_CHUNK):
+        length = min(HEXDUMP_CHUNK, size - offset)
+        data = inf.read_memory(address + offset, length).tobytes()
+        output.append(format_hexdump(address + offset, data))
+    gdb.write("".join(output))
 
 
 def is_decimal(s):
@@ -491,6 +642,7 @@ try:
             return struct.unpack_from(">Q", buffer, offset)[0]
 
 except ModuleNotFoundError:
+    struct = None
 
     def read_u16(buffer, offset):
         """Read a 16-bit unsigned integer from a buffer"""
@@ -532,6 +684,257 @@ def read_ulong(buffer, offset):
         return read_u32(buffer, offset)
 
 
+PAGE_SIZE = 4096
+g_page_cache = stop_cache()  # Page address -> bytes, None if not readable
+
+
+def read_cached(addr: int, size: int) -> memoryview:
+    """Read memory through a page cache valid until the target resumes.
+    Walking many small objects that sit close together only reads each
+    page from target once.
+    """
+    inf = gdb.selected_inferior()
+    chunks = []
+    page = addr & ~(PAGE_SIZE - 1)
+    while page < addr + size:
+        if page not in g_page_cache:
+            try:
+                g_page_cache[page] = bytes(inf.read_memory(page, PAGE_SIZE))
+            except gdb.MemoryError:
+                g_page_cache[page] = None
+
+        if g_page_cache[page] is None:
+            # Part of the page is not accessible, read the exact range
+            return read_memoryview(inf, addr, size)
+
+        chunks.append(g_page_cache[page])
+        page += PAGE_SIZE
+
+    offset = addr & (PAGE_SIZE - 1)
+    data = chunks[0] if len(chunks) == 1 else b"".join(chunks)
+    return memoryview(data)[offset : offset + size]
+
+
+def read_pointer(addr: int) -> int:
+    """Read a pointer value from target through the page cache"""
+    return read_ulong(read_cached(addr, get_long_type().sizeof), 0)
+
+
+def read_uint(buffer, offset, size):
+    """Read an unsigned integer of any size from a buffer"""
+    order = "little" if get_target_endianness() == LITTLE_ENDIAN else "big"
+    return int.from_bytes(buffer[offset : offset + size], order)
+
+
+def read_int(buffer, offset, typeobj: gdb.Type):
+    """Read an integer of typeobj from a buffer, sign extended if needed"""
+    size = typeobj.sizeof
+    value = read_uint(buffer, offset, size)
+    typeobj = typeobj.strip_typedefs()
+    signed = getattr(typeobj, "is_signed", None)
+    if signed is None:
+        signed = typeobj.code == gdb.TYPE_CODE_INT and not str(typeobj).startswith(
+            "unsigned"
+        )
+
+    if signed and value >= 1 << (size * 8 - 1):
+        value -= 1 << (size * 8)
+    return value
+
+
+def read_cstring(addr: int, maxlen=256) -> str:
+    """Read a NUL terminated string from target through the page cache"""
+    length = min(maxlen, PAGE_SIZE - (addr & (PAGE_SIZE - 1)))
+    data = bytes(read_cached(addr, length))
+    if b"\0" not in data and length < maxlen:
+        data += bytes(read_cached(addr + length, maxlen - length))
+
+    return data.split(b"\0", 1)[0].decode(errors="replace")
+
+
+class StructLayout:
+    """Precomputed layout of a structure to decode its scalar members from raw
+    bytes in one struct.unpack_from call, instead of a gdb.Value access per
+    member. Bitfields, arrays, nested structures and members overlapping in
+    unions are left in `others` for the caller to read through gdb.Value.
+
+    Usage:
+        layout = get_layout("struct mm_allocnode_s")
+        fields = layout.read(address)  # {"preceding": 0, "size": 0x41, ...}
+    """
+
+    FORMATS = {1: "B", 2: "H", 4: "I", 8: "Q"}
+    SCALARS = (
+        gdb.TYPE_CODE_INT,
+        gdb.TYPE_CODE_PTR,
+        gdb.TYPE_CODE_ENUM,
+        gdb.TYPE_CODE_BOOL,
+        gdb.TYPE_CODE_CHAR,
+    )
+
+    def __init__(self, typeobj: Union[gdb.Type, str]):
+        if type(typeobj) is str:
+            typeobj = gdb.lookup_type(typeobj)
+
+        self.type = typeobj.strip_typedefs()
+        self.size = self.type.sizeof
+        self.fields = {}  # Name -> (offset, gdb.Type) of every member
+        self.names = []  # Names of the members decoded by format, in order
+        self.others = []  # Names of the members need gdb.Value to access
+
+        fmt = ">" if get_target_endianness() == BIG_ENDIAN else "<"
+        end = 0
+        for field in self.type.fields():
+            if not field.name or field.bitpos is None:
+                continue
+
+            offset = field.bitpos // 8
+            fieldtype = field.type.strip_typedefs()
+            self.fields[field.name] = (offset, field.type)
+
+            size = fieldtype.sizeof
+            if (
+                field.bitsize
+                or fieldtype.code not in self.SCALARS
+                or size not in self.FORMATS
+                or offset < end
+            ):
+                self.others.append(field.name)
+                continue
+
+            char = self.FORMATS[size]
+            if fieldtype.code == gdb.TYPE_CODE_INT and (
+                getattr(fieldtype, "is_signed", None)
+                or (
+                    not hasattr(fieldtype, "is_signed")
+                    and not str(fieldtype).startswith("unsigned")
+                )
+            ):
+                char = char.lower()
+
+            fmt += f"{offset - end}x{char}" if offset > end else char
+            self.names.append(field.name)
+            end = offset + size
+
+        self.format = struct.Struct(fmt) if struct else None
+
+    def unpack(self, buffer, offset=0) -> dict:
+        """Decode the scalar members of the structure at offset of buffer"""
+        if self.format:
+            return dict(zip(self.names, self.format.unpack_from(buffer, offset)))
+
+        return {
+            name: read_int(buffer, offset + self.fields[name][0], self.fields[name][1])
+            for name in self.names
+        }
+
+    def read(self, address: int) -> dict:
+        """Read the structure from target through the page cache and decode it"""
+        return self.unpack(read_cached(address, self.size))
+
+
+def get_layout(typeobj: Union[gdb.Type, str]) -> StructLayout:
+    """Return the memoized StructLayout of a type, commonly walked kernel
+    structures like tcb_s, mm_allocnode_s, inode and file are computed once
+    per objfile.
+    """
+    key = layout_key(typeobj)
+    if not key:
+        return StructLayout(typeobj)
+
+    if (key, None) not in g_layout_cache:
+        g_layout_cache[(key, None)] = StructLayout(typeobj)
+    return g_layout_cache[(key, None)]
+
+
+class StructView:
+    """Compact view of a structure over a raw read of the object. Members are
+    exposed with the same names as gdb.Value, both view.pid and view["pid"].
+    Scalar members are decoded from the raw bytes all at once on first access
+    and returned as int; other members fall back to gdb.Value of the object.
+    Decoded members are kept in __slots__ generated from the DWARF layout.
+
+    Usage:
+        tcb = get_view(tcb, "struct tcb_s")
+        tcb.pid, tcb["sched_priority"]  # int, from one unpack of the buffer
+        tcb.xcp  # gdb.Value
+    """
+
+    __slots__ = ("_address", "_buffer", "_value")
+    layout: StructLayout = None
+
+    def __init__(self, address: Union[gdb.Value, int], buffer=None):
+        self._address = int(address)
+        self._buffer = buffer
+        self._value = None
+
+    def __getattr__(self, name):
+        layout = type(self).layout
+        if name not in layout.fields:
+            raise AttributeError(f"{layout.type} has no member {name}")
+
+        if name in layout.names:
+            if self._buffer is None:
+                self._buffer = read_cached(self._address, layout.size)
+            decoded = layout.unpack(self._buffer)
+            for key, value in decoded.items():
+                if key in self.__slots__:
+                    object.__setattr__(self, key, value)
+            return decoded[name]
+
+        value = self.gdb_value[name]
+        if name in self.__slots__:
+            object.__setattr__(self, name, value)
+        return value
+
+    def __getitem__(self, name):
+        if name in self.__slots__:
+            return getattr(self, name)
+        return self.__getattr__(name)  # Members shadowed by the view itself
+
+    def __int__(self):
+        return self._address
+
+    def __index__(self):
+        return self._address
+
+    def __repr__(self):
+        return f"<{type(self).layout.type} view at {hex(self._address)}>"
+
+    @property
+    def address(self) -> int:
+        return self._address
+
+    @property
+    def gdb_value(self) -> gdb.Value:
+        """The object as gdb.Value, for members not decoded from raw bytes"""
+        if self._value is None:
+            pointer = type(self).layout.type.pointer()
+            self._value = gdb.Value(self._address).cast(pointer).dereference()
+        return self._value
+
+
+def view_class(typeobj: Union[gdb.Type, str]) -> type:
+    """Return the memoized StructView subclass of a type"""
+    key = layout_key(typeobj)
+    if key and (key, StructView) in g_layout_cache:
+        return g_layout_cache[(key, StructView)]
+
+    layout = get_layout(typeobj)
+    reserved = set(dir(StructView))
+    slots = tuple(name for name in layout.fields if name not in reserved)
+    name = re.sub(r"\W", "_", str(layout.type))
+    cls = type(f"{name}_view", (StructView,), {"__slots__": slots, "layout": layout})
+    if key:
+        g_layout_cache[(key, StructView)] = cls
+    return cls
+
+
+def get_view(address: Union[gdb.Value, int], typeobj: Union[gdb.Type, str]):
+    """Return a StructView of the object of typeobj at address"""
+    return view_class(typeobj)(address)
+
+
 def bswap(val, size):
     """Reverses the byte order in a gdb.Value or int value of size bytes"""
     return int.from_bytes(int(val).to_bytes(size, byteorder="little"), byteorder="big")
@@ -769,6 +1172,87 @@ def gather_gdbcommands(modules=None, path=None) -> List[gdb.Command]:
     return commands
 
 
+SHF_WRITE = 0x1
+SHF_ALLOC = 0x2
+
+g_global_objects = {}  # ELF file name -> [(name, address, size)]
+
+
+def get_global_objects() -> List[Tuple[str, int, int]]:
+    """Return (name, address, size) of the data objects in .symtab of loaded ELFs"""
+    ELFFile = import_check(
+        "elftools.elf.elffile", "ELFFile", "Please pip install pyelftools\n"
+    )
+    if not ELFFile:
+        return []
+
+    objects = []
+    for objfile in gdb.objfiles():
+        filename = objfile.filename
+        if filename not in g_global_objects:
+            symbols = []
+            try:
+                symtab = ELFFile.load_from_path(filename).get_section_by_name(".symtab")
+            except Exception:
+                symtab = None
+
+            for symbol in symtab.iter_symbols() if symtab else ():
+                if symbol["st_info"]["type"] == "STT_OBJECT" and symbol["st_size"]:
+                    symbols.append((symbol.name, symbol["st_value"], symbol["st_size"]))
+
+            g_global_objects[filename] = symbols
+
+        objects.extend(g_global_objects[filename])
+
+    return objects
+
+
+g_data_sections = {}  # ELF file name -> [(name, address, size)]
+
+
+def get_data_sections() -> List[Tuple[str, int, int]]:
+    """Return (name, address, size) of the writable sections of loaded ELFs"""
+    ELFFile = import_check(
+        "elftools.elf.elffile", "ELFFile", "Please pip install pyelftools\n"
+    )
+    if not ELFFile:
+        return []
+
+    sections = []
+    for objfile in gdb.objfiles():
+        filename = objfile.filename
+        if filename not in g_data_sections:
+            found = []
+            try:
+                elf = ELFFile.load_from_path(filename)
+                for section in elf.iter_sections():
+                    flags = section["sh_flags"]
+                    if (
+                        flags & SHF_ALLOC
+                        and flags & SHF_WRITE
+                        and section["sh_addr"]
+                        and section["sh_size"]
+                    ):
+                        found.append(
+                            (section.name, section["sh_addr"], section["sh_size"])
+                        )
+            except Exception:
+                pass
+
+            g_data_sections[filename] = found
+
+        sections.extend(g_data_sections[filename])
+
+    return sections
+
+
+def get_command(clz) -> gdb.Command:
+    """Return the registered instance of a command class, create one if not found"""
+    if clz not in g_commands:
+        g_commands[clz] = clz()
+    return g_commands[clz]
+
+
 def jsonify(obj, indent=None):
     if not obj:
         return "{}"
@@ -0,0 +1,98 @@
+############################################################################
+# tools/gdb/tests/test_mock_lists.py
+#
+# Licensed to the Apache Software Foundation (ASF) under one or more
+# contributor license agreements.  See the NOTICE file distributed with
+# this work for additional information regarding copyright ownership.  The
+# ASF licenses this file to you under the Apache License, Version 2.0 (the
+# "License"); you may not use this file except in compliance with the
+# License.  You may obtain a copy of the License at
+#
+#   http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+# WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.  See the
+# License for the specific language governing permissions and limitations
+# under the License.
+#
+############################################################################
+
+import unittest
+from unittest.mock import patch
+
+import gdb
+from nuttxgdb.lists import ListEntry, check_list_raw, check_queue_raw, walk_links
+
+
+class TestWalkLinks(unittest.TestCase):
+    # node address -> next pointer, link field at offset 4
+    memory = {0x1004: 0x2000, 0x2004: 0x3000, 0x3004: 0x1000}
+
+    def read_pointer(self, addr):
+        return self.memory[addr]
+
+    def test_walk_until_end(self):
+        with patch("nuttxgdb.utils.read_pointer", side_effect=self.read_pointer):
+            entries = list(walk_links(0x1000, 4, end=0x3000, member_offset=0x10))
+
+        self.assertEqual(entries, [ListEntry(0x1000, 0xFF0), ListEntry(0x2000, 0x1FF0)])
+
+    def test_walk_circular(self):
+        with patch("nuttxgdb.utils.read_pointer", side_effect=self.read_pointer):
+            with self.assertRaises(gdb.GdbError):
+                list(walk_links(0x1000, 4))
+
+    def test_walk_null_terminated(self):
+        memory = {0x1004: 0x2000, 0x2004: 0}
+        with patch("nuttxgdb.utils.read_pointer", side_effect=memory.get):
+            nodes = [entry.node for entry in walk_links(0x1000, 4)]
+
+        self.assertEqual(nodes, [0x1000, 0x2000])
+
+    def test_walk_back_link(self):
+        # Back link at offset 0, node 0x2000 links back to 0x3000
+        memory = {0x1000: 0, 0x1004: 0x2000, 0x2000: 0x3000, 0x2004: 0}
+        with patch("nuttxgdb.utils.read_pointer", side_effect=memory.get):
+            walk = walk_links(0x1000, 4, back=0)
+            self.assertEqual(next(walk).node, 0x1000)
+            with self.assertRaises(gdb.GdbError):
+                next(walk)
+
+
+# Field offsets of a 32bit target
+OFFSETS = {"prev": 0, "next": 4, "head": 0, "tail": 4, "flink": 0, "blink": 4}
+
+
+@patch("nuttxgdb.utils.offset_of", side_effect=lambda t, field: OFFSETS[field])
+class TestCheckRaw(unittest.TestCase):
+    def test_list_consistent(self, _):
+        # head 0x100 <-> 0x200 <-> 0x300 <-> head
+        memory = {0x100: 0x300, 0x104: 0x200, 0x200: 0x100, 0x204: 0x300}
+        memory.update({0x300: 0x200, 0x304: 0x100})
+        with patch("nuttxgdb.utils.read_pointer", side_effect=memory.get):
+            self.assertEqual(check_list_raw(0x100), (2, None))
+
+    def test_list_broken_prev(self, _):
+        memory = {0x100: 0x300, 0x104: 0x200, 0x200: 0x100, 0x204: 0x300}
+        memory.update({0x300: 0x100, 0x304: 0x100})
+        with patch("nuttxgdb.utils.read_pointer", side_effect=memory.get):
+            nb, error = check_list_raw(0x100)
+
+        self.assertEqual(nb, 1)
+        self.assertIn("0x300", error)
+
+    def test_dq_consistent(self, _):
+        # queue 0x100: head 0x200, tail 0x300
+        memory = {0x100: 0x200, 0x104: 0x300, 0x200: 0x300, 0x204: 0}
+        memory.update({0x300: 0, 0x304: 0x200})
+        with patch("nuttxgdb.utils.read_pointer", side_effect=memory.get):
+            self.assertEqual(check_queue_raw(0x100, doubly=True), (2, None))
+
+    def test_sq_bad_tail(self, _):
+        memory = {0x100: 0x200, 0x104: 0x200, 0x200: 0x300, 0x300: 0}
+        with patch("nuttxgdb.utils.read_pointer", side_effect=memory.get):
+            nb, error = check_queue_raw(0x100)
+
+        self.assertEqual(nb, 2)
+        self.assertIn("tail", error)
@@ -22,7 +22,8 @@ import unittest
 from unittest.mock import MagicMock, patch
 
 import gdb
-from nuttxgdb.stack import Stack, fetch_stacks
+from nuttxgdb import utils
+from nuttxgdb.stack import Stack, fetch_stacks, stack_spare
 
 
 class TestStack(unittest.TestCase):
@@ -31,6 +32,13 @@ class TestStack(unittest.TestCase):
     correctness of the Stack Class
     """
 
+    def setUp(self):
+        # Max usage is cached by stack address, don't share it across tests
+        utils.invalidate_stop_caches()
+
+    def tearDown(self):
+        utils.invalidate_stop_caches()
+
     def test_stack_init_badsize(self):
         with self.assertRaises(gdb.GdbError):
             name = "test_thread"
@@ -137,6 +145,37 @@ class TestStack(unittest.TestCase):
 
         self.assertEqual(stack.max_usage(), 0)
 
+    @patch("nuttxgdb.utils.get_target_endianness")
+    def test_stack_check_max_usage_buffer(self, mock_get_target_endianness):
+        name = "test_thread"
+        entry = hex(0xABCD)
+        base = 0x3000
+        alloc = 0x2F00
+        size = 0x1000
+        cursp = 0x3F00
+        align = 4
+        stack = Stack(name, entry, base, alloc, size, cursp, align)
+        stack._pattern = 0xDEADBEEF
+
+        mock_get_target_endianness.return_value = utils.LITTLE_ENDIAN
+        pattern = (0xDEADBEEF).to_bytes(4, "little")
+        buf = pattern * (0x600 // align) + b"\x11" * 0xA00
+
+        self.assertEqual(stack.check_max_usage(buf), 0xA00)
+
+        # The result is cached until the target resumes
+        self.assertEqual(stack.check_max_usage(b""), 0xA00)
+
+
+class TestStackSpare(unittest.TestCase):
+    def test_stack_spare(self):
+        pattern = (0xDEADBEEF).to_bytes(4, "little")
+
+        self.assertEqual(stack_spare(pattern * 2000 + b"\x00" * 16, pattern), 8000)
+        self.assertEqual(stack_spare(pattern * 3 + b"\x00" * 4, pattern, 8), 12)
+        self.assertEqual(stack_spare(b"\x00" * 4 + pattern * 16, pattern), 0)
+        self.assertEqual(stack_spare(pattern * 16, pattern), 0)
+
 
 class TestFetchStacks(unittest.TestCase):
     @patch("nuttxgdb.utils.is_target_arch")
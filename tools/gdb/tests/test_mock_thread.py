@@ -19,6 +19,20 @@
 ############################################################################
 
 import unittest
+from types import SimpleNamespace
+from unittest.mock import MagicMock, patch
+
+import gdb
+from nuttxgdb import utils
+from nuttxgdb.thread import (
+    NxBacktraceAll,
+    Nxthread,
+    Registers,
+    WaitGraph,
+    g_context_cache,
+    g_registers,
+    g_unwind_cache,
+)
 
 
 class TestSaveRegs(unittest.TestCase):
@@ -37,6 +51,49 @@ class TestRestoreRegs(unittest.TestCase):
     pass
 
 
+class TestDecodeRegs(unittest.TestCase):
+    @patch("nuttxgdb.utils.get_target_endianness")
+    @patch("nuttxgdb.utils.lookup_type")
+    @patch("nuttxgdb.utils.read_memoryview")
+    def test_decode_regs(self, *args):
+        mock_read_memoryview, mock_lookup_type, mock_get_target_endianness = args
+
+        mock_get_target_endianness.return_value = utils.LITTLE_ENDIAN
+        mock_lookup_type.return_value = MagicMock(sizeof=4)
+        mock_read_memoryview.return_value = memoryview(
+            b"".join(i.to_bytes(4, "little") for i in range(0x10, 0x20))
+        )
+
+        with patch.multiple(
+            Registers,
+            reginfo={
+                "r0": {"rmt_nr": 0, "tcb_reg_off": 8},
+                "pc": {"rmt_nr": 15, "tcb_reg_off": 60},
+            },
+            context_size=64,
+        ):
+            registers = Registers.decode(Registers, 0x1000)
+            self.assertEqual(registers, {"r0": 0x12, "pc": 0x1F})
+
+            # The whole context is read once and cached
+            Registers.decode(Registers, 0x1000)
+            mock_read_memoryview.assert_called_once()
+
+        g_context_cache.clear()
+
+
+class TestLoadRegs(unittest.TestCase):
+    @patch("gdb.write")
+    @patch.object(Registers, "apply")
+    @patch.object(Registers, "decode")
+    def test_load_null_regs(self, mock_decode, mock_apply, mock_write):
+        # A NULL context is never read, registers are left unchanged
+        self.assertFalse(g_registers.load(0))
+        mock_decode.assert_not_called()
+        mock_apply.assert_not_called()
+        mock_write.assert_called_once_with("regs is NULL\n")
+
+
 class TestSetRegs(unittest.TestCase):
     """
     TODO
@@ -54,11 +111,61 @@ class TestNxinfothreads(unittest.TestCase):
 
 
 class TestNxthread(unittest.TestCase):
-    """
-    TODO
-    """
-
-    pass
+    @patch("gdb.execute")
+    @patch("gdb.write")
+    @patch.object(Registers, "restore")
+    @patch.object(Registers, "save")
+    @patch.object(Registers, "decode")
+    def test_apply_command_null_regs(self, *args):
+        mock_decode, mock_save, mock_restore, mock_write, mock_execute = args
+
+        Nxthread.apply_command({"xcp": {"regs": 0}}, "bt")
+        mock_decode.assert_not_called()
+        mock_write.assert_called_once_with("regs is NULL\n")
+        mock_execute.assert_called_once_with("bt\n")
+        mock_restore.assert_called_once()
+
+        # Registers are restored even if the command fails
+        mock_restore.reset_mock()
+        mock_execute.side_effect = gdb.error
+        with self.assertRaises(gdb.error):
+            Nxthread.apply_command({"xcp": {"regs": 0}}, "bt")
+        mock_restore.assert_called_once()
+
+
+class TestNxBacktraceAll(unittest.TestCase):
+    def tearDown(self):
+        g_unwind_cache.clear()
+
+    @patch("nuttxgdb.thread.TSTATE_TASK_RUNNING", 3)
+    @patch("nuttxgdb.utils.is_target_smp")
+    @patch.object(Registers, "restore")
+    @patch.object(Registers, "save")
+    @patch.object(Registers, "load")
+    def test_collect_smp_running(self, *args):
+        mock_load, mock_save, mock_restore, mock_is_target_smp = args
+        mock_is_target_smp.return_value = True
+
+        running = MagicMock(name="running")
+        running.__int__.return_value = 0x1000
+        running.__getitem__.side_effect = {"task_state": 3, "cpu": 1}.get
+        waiting = MagicMock(name="waiting")
+        waiting.__int__.return_value = 0x2000
+        waiting.__getitem__.side_effect = {
+            "task_state": 4,
+            "xcp": {"regs": 0x3000},
+        }.get
+
+        # Registers of the running task's CPU are not available
+        command = NxBacktraceAll.__new__(NxBacktraceAll)
+        with patch.object(command, "cpu_thread", return_value=None), patch.object(
+            command, "unwind", return_value=(0x10, 0x20)
+        ):
+            signatures = command.collect([running, waiting], 8)
+
+        self.assertEqual(signatures, {None: [running], (0x10, 0x20): [waiting]})
+        mock_load.assert_called_once_with(0x3000)
+        mock_restore.assert_called_once()
 
 
 class TestNxcontinue(unittest.TestCase):
@@ -99,3 +206,38 @@ class TestRegisterCommand(unittest.TestCase):
     """
 
     pass
+
+
+class TestWaitGraph(unittest.TestCase):
+    def build(self, tasks):
+        """tasks: pid -> holders of the object it waits for, None if not waiting"""
+        tcbs = []
+        for pid, holders in tasks.items():
+            tcb = MagicMock()
+            tcb.__getitem__.return_value = holders
+            tcb.view = SimpleNamespace(
+                pid=pid,
+                sched_priority=100,
+                task_state=5 if holders is not None else 3,
+                waitobj=holders is not None,
+            )
+            tcbs.append(tcb)
+
+        view = patch("nuttxgdb.utils.get_view", side_effect=lambda tcb, _: tcb.view)
+        name = patch("nuttxgdb.utils.get_task_name", return_value="task")
+        get_holders = patch.object(WaitGraph, "get_holders", side_effect=list)
+        with patch("nuttxgdb.thread.TSTATE_WAIT_SEM", 5), view, name, get_holders:
+            return WaitGraph(tcbs)
+
+    def test_mutex_cycle(self):
+        graph = self.build({1: [2], 2: [1]})
+        self.assertEqual(graph.cycles(), [(1, [2, 1])])
+
+    def test_semaphore_two_holders(self):
+        # Task 1 waits a semaphore held by 2 and 3, task 2 waits a mutex held
+        # by 1, task 3 is not blocked and can post the semaphore.
+        graph = self.build({1: [2, 3], 2: [1], 3: None})
+
+        self.assertEqual(graph.cycles(), [])
+        self.assertEqual(graph.edges, {2: [1]})
+        self.assertEqual(graph.possible(), [(1, [2, 3])])
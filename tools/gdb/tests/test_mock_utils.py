@@ -157,3 +157,61 @@ class TestGetTcbs(unittest.TestCase):
     """
 
     pass
+
+
+class TestStopCache(unittest.TestCase):
+    def test_invalidate_clears_and_bumps_generation(self):
+        cache = utils.stop_cache()
+        cache["key"] = "value"
+        generation = utils.stop_generation()
+
+        utils.invalidate_stop_caches()
+
+        self.assertEqual(cache, {})
+        self.assertEqual(utils.stop_generation(), generation + 1)
+
+    def test_target_change_invalidates(self):
+        cache = utils.stop_cache()
+        utils.check_target_identity()
+        cache["key"] = "value"
+
+        with patch("nuttxgdb.utils.target_identity", return_value=("another core",)):
+            utils.check_target_identity()
+
+        self.assertEqual(cache, {})
+
+    def test_keep_on_register_switch(self):
+        cache = utils.stop_cache()
+        cache["key"] = "value"
+
+        with utils.keep_stop_caches():
+            utils.on_register_changed(None)
+        self.assertEqual(cache, {"key": "value"})
+
+        utils.on_register_changed(None)
+        self.assertEqual(cache, {})
+
+
+class TestLayoutCache(unittest.TestCase):
+    def setUp(self):
+        field = MagicMock(bitpos=64, type="int")
+        field.name = "member"
+        self.typeobj = MagicMock(code=gdb.TYPE_CODE_STRUCT)
+        self.typeobj.fields.return_value = [field]
+        utils.invalidate_type_caches()
+
+    def tearDown(self):
+        utils.invalidate_type_caches()
+
+    def test_offset_of_memoized(self):
+        with patch("gdb.lookup_type", return_value=self.typeobj) as lookup:
+            self.assertEqual(utils.offset_of("struct foo", "member"), 8)
+            self.assertEqual(utils.offset_of("struct foo", "member"), 8)
+            lookup.assert_called_once()
+
+    def test_invalidate_type_caches(self):
+        with patch("gdb.lookup_type", return_value=self.typeobj) as lookup:
+            utils.offset_of("struct foo", "member")
+            utils.invalidate_type_caches()
+            utils.offset_of("struct foo", "member")
+            self.assertEqual(lookup.call_count, 2)
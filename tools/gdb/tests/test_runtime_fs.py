@@ -43,6 +43,10 @@ class TestFs(unittest.TestCase):
         out = gdb.execute("fdinfo -p 1", to_string=True)
         self.check_output(out, expect="PID: 1")
 
+    def test_fdstat(self):
+        out = gdb.execute("fdstat", to_string=True)
+        self.check_output(out, expect="descriptors in")
+
     def test_mount(self):
         out = gdb.execute("mount", to_string=True)
         self.check_output(out, expect="/proc type procfs")
@@ -56,6 +56,16 @@ class TestMemory(unittest.TestCase):
         out = gdb.execute("memleak", to_string=True)
         self.check_output(out, expect="total leak memory is")
 
+    def test_memfind(self):
+        heap = gdb.parse_and_eval("g_mmheap")
+        out = gdb.execute(f"memfind -p {hex(heap)} -d 16", to_string=True)
+        self.check_output(out, expect="hits")
+
+    def test_memref(self):
+        # g_pidhash is allocated from heap and referenced by the global itself
+        out = gdb.execute("memref g_pidhash -b", to_string=True)
+        self.check_output(out, expect="g_pidhash")
+
     # memmap may stuck because of huge 2GB memory qemu provides.
     # def test_memmap(self):
     #     out = gdb.execute("memmap", to_string=True)
@@ -46,6 +46,10 @@ class TestNet(unittest.TestCase):
             "rxbuf+ofo           local_address        remote_address",
         )
 
+    def test_netstat_json(self):
+        out = gdb.execute("netstats -j -s rxsz -n 1 tcp", to_string=True)
+        self.check_output(out, expect='"tcp"')
+
     def test_netcheck(self):
         out = gdb.execute("netcheck", to_string=True)
         self.check_output(out, expect="IOB check: PASS")
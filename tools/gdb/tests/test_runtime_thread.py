@@ -58,6 +58,25 @@ class TestThread(unittest.TestCase):
         out = gdb.execute("thread apply all bt", to_string=True)
         self.assertTrue("#0" in out and "Thread" in out, msg=f"Got: {out}")
 
+    def test_nxbt_all(self):
+        out = gdb.execute("nxbt-all", to_string=True)
+        self.assertTrue(
+            "Backtrace #0" in out and "unique backtraces" in out, msg=f"Got: {out}"
+        )
+
+    def test_deadlock(self):
+        out = gdb.execute("deadlock", to_string=True)
+        self.assertTrue(
+            "No deadlock detected" in out or "has deadlocked" in out, msg=f"Got: {out}"
+        )
+
+    def test_tcb_view(self):
+        for tcb in utils.get_tcbs():
+            view = utils.get_view(tcb, "struct tcb_s")
+            self.assertEqual(view.pid, int(tcb["pid"]))
+            self.assertEqual(view["sched_priority"], int(tcb["sched_priority"]))
+            self.assertEqual(int(view.xcp.address), int(tcb["xcp"].address))
+
     def test_thread_apply_with_ids(self):
         out = gdb.execute("thread apply 0 bt", to_string=True)
         self.assertTrue("#0" in out and "Thread 0" in out, msg=f"Got: {out}")
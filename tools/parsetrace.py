@@ -22,29 +22,46 @@
 ############################################################################
 
 import argparse
+import array
 import bisect
+import collections
+import json
 import logging
+import mmap
+import multiprocessing
 import os
 import re
 import struct
 import subprocess
+import threading
+import time
 from typing import Union
 
 try:
     import colorlog
     import cxxfilt
-    import parse
     import serial
     from elftools.elf.elffile import ELFFile
     from elftools.elf.sections import SymbolTableSection
     from pycstruct import pycstruct
-    from pydantic import BaseModel
 
 except ModuleNotFoundError:
     print("Please execute the following command to install dependencies:")
-    print("pip install pyelftools cxxfilt pydantic parse pycstruct colorlog serial")
+    print("pip install pyelftools cxxfilt pycstruct colorlog serial")
     exit(1)
 
+try:
+    # Only needed by the validated model API, not by the parser itself
+    from pydantic import BaseModel
+except ModuleNotFoundError:
+    BaseModel = None
+
+try:
+    # Only needed by the columnar trace store
+    import numpy as np
+except ModuleNotFoundError:
+    np = None
+
 logger = logging.getLogger(__name__)
 logger.setLevel(logging.INFO)
 
@@ -62,6 +79,22 @@ formatter = colorlog.ColoredFormatter(
 stream_handler.setFormatter(formatter)
 logger.addHandler(stream_handler)
 
+WRITE_BUFFER_SIZE = 1 << 20
+CHUNK_SIZE = 8 << 20  # Max bytes of binary log decoded by one job
+RING_BUFFER_SIZE = 64 << 20  # Max bytes of serial data waiting for decoding
+SERIAL_TIMEOUT = 0.5  # Seconds a serial read blocks, to notice stopping
+STATS_INTERVAL = 5  # Seconds between serial throughput reports
+
+# Note types of the binary trace, as numbered by the target
+
+NOTE_START = 0
+NOTE_SUSPEND = 2
+NOTE_RESUME = 3
+NOTE_IRQ_ENTER = 20
+NOTE_IRQ_LEAVE = 21
+NOTE_DUMP_STRING = 22
+NOTE_DUMP_PRINTF = 24
+
 
 class SymbolTables(object):
     def __init__(self, file):
@@ -71,6 +104,10 @@ class SymbolTables(object):
         self.typeinfo = dict()
         self.symbol_dict = dict()
         self.addr_list = list()
+        self.image = None  # Mapped ELF file, see load_image()
+        self.strings = dict()  # String read at each address
+        self.typesizes = None  # Size of each typedef, see get_typesize()
+        self.typesizes_path = file + ".typesizes.json"
         self.__parse_header()
         self.parse_symbol()
 
@@ -121,50 +158,183 @@ class SymbolTables(object):
                 self.symbol_dict[symbol["st_value"] & ~0x01] = symbol_name
         self.addr_list = sorted(self.symbol_dict)
 
+    def get_build_id(self):
+        section = self.elffile.get_section_by_name(".note.gnu.build-id")
+        if section is None:
+            return None
+
+        for note in section.iter_notes():
+            if note["n_type"] == "NT_GNU_BUILD_ID":
+                return note["n_desc"]
+        return None
+
+    def load_typesizes(self):
+        """Return the typedef sizes saved next to the ELF, or None if they
+        are missing or saved for another build"""
+        build_id = self.get_build_id()
+        if build_id is None:
+            return None
+
+        try:
+            with open(self.typesizes_path) as f:
+                index = json.load(f)
+        except (OSError, ValueError):
+            return None
+
+        if index.get("build_id") != build_id:
+            return None
+        return index["typesizes"]
+
+    def save_typesizes(self):
+        build_id = self.get_build_id()
+        if build_id is None:
+            return
+
+        try:
+            with open(self.typesizes_path, "w") as f:
+                json.dump({"build_id": build_id, "typesizes": self.typesizes}, f)
+        except OSError as e:
+            logger.debug(f"can't save type sizes: {e}")
+
+    @staticmethod
+    def type_offset(CU, DIE):
+        """Return the offset of the DIE referred by DW_AT_type of DIE"""
+        type_attr = DIE.attributes["DW_AT_type"]
+        if type_attr.form == "DW_FORM_ref_addr":
+            return type_attr.value
+        return type_attr.value + CU.cu_offset
+
+    def resolve_typedef(self, dwarfinfo, DIE):
+        """Return the size of typedef DIE, following the chain of typedefs
+        to its base type, or None if it's not a base type"""
+        while DIE.tag == "DW_TAG_typedef":
+            if "DW_AT_type" not in DIE.attributes:
+                attr = DIE.attributes.get("DW_AT_byte_size")
+                return None if attr is None else attr.value
+            DIE = dwarfinfo.get_DIE_from_refaddr(self.type_offset(DIE.cu, DIE))
+
+        if DIE.tag == "DW_TAG_base_type":
+            return DIE.attributes["DW_AT_byte_size"].value
+        return None
+
+    def lookup_pubtypes(self, dwarfinfo, type_name):
+        """Return the size of typedef type_name from .debug_pubtypes"""
+        pubtypes = dwarfinfo.get_pubtypes()
+        if pubtypes is None or type_name not in pubtypes:
+            return None
+
+        DIE = dwarfinfo.get_DIE_from_refaddr(pubtypes[type_name].die_ofs)
+        if DIE.tag != "DW_TAG_typedef":
+            return None
+        return self.resolve_typedef(dwarfinfo, DIE)
+
+    def scan_typesizes(self, dwarfinfo):
+        """Return the size of all the typedefs of base types, by name, with
+        a single pass over the DIEs"""
+        names = dict()  # Offset of the first typedef of each name
+        targets = dict()  # Offset of the type of each typedef
+        sizes = dict()  # Size of each base type, or typedef without type
+        for CU in dwarfinfo.iter_CUs():
+            for DIE in CU.iter_DIEs():
+                if DIE.tag == "DW_TAG_base_type":
+                    attr = DIE.attributes.get("DW_AT_byte_size")
+                    if attr is not None:
+                        sizes[DIE.offset] = attr.value
+                elif DIE.tag == "DW_TAG_typedef":
+                    if "DW_AT_type" in DIE.attributes:
+                        targets[DIE.offset] = self.type_offset(CU, DIE)
+                    elif "DW_AT_byte_size" in DIE.attributes:
+                        sizes[DIE.offset] = DIE.attributes["DW_AT_byte_size"].value
+                    else:
+                        continue
+
+                    attr = DIE.attributes.get("DW_AT_name")
+                    if attr is not None:
+                        names.setdefault(attr.value.decode("utf-8"), DIE.offset)
+
+        typesizes = dict()
+        for name, offset in names.items():
+            for _ in range(len(targets)):  # Bounded, in case of a cycle
+                if offset not in targets:
+                    break
+                offset = targets[offset]
+
+            if offset in sizes:
+                typesizes[name] = sizes[offset]
+        return typesizes
+
     def get_typesize(self, type_name):
         if not self.elffile.has_dwarf_info():
             raise ValueError("not found dwarf info!")
 
-        dwarfinfo = self.elffile.get_dwarf_info()
-        for CU in dwarfinfo.iter_CUs():
-            for DIE in CU.iter_DIEs():
-                if DIE.tag == "DW_TAG_typedef":
-                    name = DIE.attributes["DW_AT_name"].value.decode("utf-8")
-                    if name == type_name:
-                        if "DW_AT_type" in DIE.attributes:
-                            type_attr = DIE.attributes["DW_AT_type"]
-                            base_type_die = dwarfinfo.get_DIE_from_refaddr(
-                                type_attr.value + CU.cu_offset
-                            )
-                            if base_type_die.tag == "DW_TAG_base_type":
-                                size = base_type_die.attributes["DW_AT_byte_size"].value
-                            elif base_type_die.tag == "DW_TAG_typedef":
-                                type_name = base_type_die.attributes[
-                                    "DW_AT_name"
-                                ].value.decode("utf-8")
-                                continue
-                        else:
-                            size = DIE.attributes["DW_AT_byte_size"].value
-                        return size
-        raise ValueError("not found type")
+        if self.typesizes is None:
+            self.typesizes = self.load_typesizes()
+
+        if self.typesizes is None:
+            dwarfinfo = self.elffile.get_dwarf_info()
+            size = self.lookup_pubtypes(dwarfinfo, type_name)
+            if size is not None:
+                return size
+
+            self.typesizes = self.scan_typesizes(dwarfinfo)
+            self.save_typesizes()
+
+        if type_name not in self.typesizes:
+            raise ValueError("not found type")
+        return self.typesizes[type_name]
+
+    def load_image(self):
+        """Map the ELF file and index its loadable segments by address.
+        Each entry of self.segments is (start, end, file offset), sorted by
+        start, end is limited to the bytes present in the file.
+        """
+        stream = self.elffile.stream
+        self.image = mmap.mmap(stream.fileno(), 0, access=mmap.ACCESS_READ)
+        self.segments = sorted(
+            (
+                segment["p_paddr"],
+                segment["p_paddr"] + min(segment["p_memsz"], segment["p_filesz"]),
+                segment["p_offset"],
+            )
+            for segment in self.elffile.iter_segments()
+            if segment["p_type"] == "PT_LOAD" and segment["p_filesz"]
+        )
+        self.segment_starts = [segment[0] for segment in self.segments]
+
+    def find_segment(self, addr, size=1):
+        """Return (start, end, file offset) of the segment holding size
+        bytes at addr, or None"""
+        if self.image is None:
+            self.load_image()
+
+        index = bisect.bisect_right(self.segment_starts, addr) - 1
+        if index >= 0:
+            segment = self.segments[index]
+            if addr + size <= segment[1]:
+                return segment
+        return None
 
     def readstring(self, addr):
-        data = b""
-        while True:
-            data += self.read(addr, 256)
-            data = data.split(b"\x00")[0]
-            if len(data) < 256:
-                break
-        return data.decode("utf-8")
+        string = self.strings.get(addr)
+        if string is not None:
+            return string
+
+        segment = self.find_segment(addr)
+        if segment is None:
+            raise ValueError(f"address {addr:#x} not in elf image")
+
+        start = segment[2] + addr - segment[0]
+        end = segment[2] + segment[1] - segment[0]
+        stop = self.image.find(b"\x00", start, end)
+        string = self.image[start : end if stop < 0 else stop].decode("utf-8")
+        self.strings[addr] = string
+        return string
 
     def read(self, addr, size):
-        for segment in self.elffile.iter_segments():
-            seg_addr = segment["p_paddr"]
-            seg_size = min(segment["p_memsz"], segment["p_filesz"])
-            if addr >= seg_addr and addr + size <= seg_addr + seg_size:
-                data = segment.data()
-                start = addr - seg_addr
-                return data[start : start + size]
+        segment = self.find_segment(addr, size)
+        if segment is not None:
+            start = segment[2] + addr - segment[0]
+            return self.image[start : start + size]
 
     def addr2symbol(self, addr: int):
         index = bisect.bisect(self.addr_list, addr)
@@ -173,96 +343,409 @@ class SymbolTables(object):
         return "<%#x>: unknow function" % addr
 
 
-class OtherModel(BaseModel):
-    payload: str
+OTHER_PATTERN = re.compile(
+    r"[sched_switch|sched_wakeup_new|"
+    r"sched_waking|irq_handler_entry|irq_handler_exit]"
+)
+
+ATRACE_PATTERN = re.compile(
+    r"(?i:tracing_mark_write): *(?P<sign>.)\|(?P<pid>[-+ ]?\d+)\|(?P<func>.+)",
+    re.DOTALL,
+)
+
+# One trace line of systrace format, the payload is tried as atrace first
+TRACE_PATTERN = re.compile(
+    r"(?P<name>.+?)-(?P<tid>[-+ ]?\d+)\s+\[(?P<cpu>[-+ ]?\d+)\]\s+"
+    r"(?P<time>[-+ ]?\d*\.\d+): (?P<payload>.+)",
+    re.DOTALL,
+)
+
+
+class Other:
+    __slots__ = ("payload",)
+
+    def __init__(self, payload):
+        self.payload = payload
 
     def dump(self):
         return self.payload
 
-    def parse(self, string):
-        pattern = re.compile(
-            r"[sched_switch|sched_wakeup_new|"
-            r"sched_waking|irq_handler_entry|irq_handler_exit]"
-        )
-        ret = pattern.match(string)
-        if ret is not None:
-            return OtherModel(payload=string)
+    @staticmethod
+    def parse(string):
+        if OTHER_PATTERN.match(string):
+            return Other(string)
+
 
+class ATrace:
+    __slots__ = ("sign", "pid", "func")
 
-class ATraceModel(BaseModel):
-    sign: str
-    pid: int
-    func: str
+    def __init__(self, sign, pid, func):
+        self.sign = sign
+        self.pid = pid
+        self.func = func
 
-    def parse(self, string):
-        pattern = parse.compile("tracing_mark_write: {sign:>.1}|{pid:d}|{func}")
+    def dump(self):
+        return f"tracing_mark_write: {self.sign}|{self.pid}|{self.func}"
 
-        ret = pattern.parse(string)
+    @staticmethod
+    def parse(string):
+        ret = ATRACE_PATTERN.fullmatch(string)
         if ret is not None:
-            return ATraceModel(**ret.named)
+            return ATrace(ret["sign"], int(ret["pid"]), ret["func"])
 
-    def dump(self):
-        return "tracing_mark_write: %c|%d|%s" % (
-            self.sign,
-            self.pid,
-            self.func,
-        )
 
+class TraceRecord:
+    __slots__ = ("name", "tid", "cpu", "time", "payload")
 
-class TraceModel(BaseModel):
-    name: str
-    tid: int
-    cpu: int
-    time: float
-    payload: Union[ATraceModel, OtherModel]
+    def __init__(self, name, tid, cpu, time, payload):
+        self.name = name
+        self.tid = tid
+        self.cpu = cpu
+        self.time = time
+        self.payload = payload
 
     def dump_one_trace(self):
-        header = "%16s-%-5d [%03d] %12.6f: %s" % (
-            self.name,
-            self.tid,
-            self.cpu,
-            self.time,
-            self.payload.dump(),
+        return (
+            f"{self.name:>16}-{self.tid:<5d} [{self.cpu:03d}] {self.time:12.6f}: "
+            f"{self.payload.dump()}"
         )
-        return header
 
+    def model(self):
+        """Return the validated pydantic TraceModel of this record"""
+        if BaseModel is None:
+            raise RuntimeError("Please pip install pydantic")
+
+        if isinstance(self.payload, ATrace):
+            payload = ATraceModel(
+                sign=self.payload.sign, pid=self.payload.pid, func=self.payload.func
+            )
+        else:
+            payload = OtherModel(payload=self.payload.payload)
+
+        return TraceModel(
+            name=self.name,
+            tid=self.tid,
+            cpu=self.cpu,
+            time=self.time,
+            payload=payload,
+        )
+
+
+if BaseModel is not None:
+
+    class OtherModel(BaseModel):
+        payload: str
+
+        def dump(self):
+            return self.payload
+
+        def parse(self, string):
+            if OTHER_PATTERN.match(string):
+                return OtherModel(payload=string)
+
+    class ATraceModel(BaseModel):
+        sign: str
+        pid: int
+        func: str
+
+        def parse(self, string):
+            ret = ATRACE_PATTERN.fullmatch(string)
+            if ret is not None:
+                return ATraceModel(**ret.groupdict())
+
+        def dump(self):
+            return "tracing_mark_write: %c|%d|%s" % (
+                self.sign,
+                self.pid,
+                self.func,
+            )
+
+    class TraceModel(BaseModel):
+        name: str
+        tid: int
+        cpu: int
+        time: float
+        payload: Union[ATraceModel, OtherModel]
+
+        def dump_one_trace(self):
+            header = "%16s-%-5d [%03d] %12.6f: %s" % (
+                self.name,
+                self.tid,
+                self.cpu,
+                self.time,
+                self.payload.dump(),
+            )
+            return header
 
-class Trace(object):
-    def __payloadParse(self, string):
-        trace = ATraceModel.parse(ATraceModel, string)
-        if trace is not None:
-            return trace
-        trace = OtherModel.parse(OtherModel, string)
-        if trace is not None:
-            return trace
 
+class Trace(object):
     def __init__(self, file):
-        with open(file, "rb+") as tracefile:
-            self.lines = tracefile.read()
-        self.lines = self.lines.split(b"\n")
-        self.all_trace = list()
-        self.parse()
+        self.file = file
 
     def parse(self):
-        header_pattern = parse.compile(
-            "{name}-{tid:d}{:s}[{cpu:d}]{:s}{time:f}: {payload:payload}",
-            dict(payload=self.__payloadParse),
-        )
+        """Yield the trace of each line, the file is read line by line"""
+        with open(self.file, "rb") as tracefile:
+            for line in tracefile:
+                try:
+                    ret = TRACE_PATTERN.fullmatch(line.decode("utf-8").strip())
+                    if not ret:
+                        continue
+                    payload = ATrace.parse(ret["payload"]) or Other.parse(
+                        ret["payload"]
+                    )
+                    if not payload:
+                        continue
+                    trace = TraceRecord(
+                        ret["name"],
+                        int(ret["tid"]),
+                        int(ret["cpu"]),
+                        float(ret["time"]),
+                        payload,
+                    )
+                except Exception:
+                    continue
 
-        for line in self.lines:
-            try:
-                line = line.decode("utf-8")
-                ret = header_pattern.parse(line.strip())
-                if ret and ret.named["payload"]:
-                    self.all_trace.append(TraceModel(**ret.named))
-            except Exception:
-                continue
+                yield trace
+
+    def dump_trace(self, traces=None):
+        """Yield the systrace lines of traces, all the traces in file by default"""
+        yield "# tracer: nop"
+        yield "#"
+        for trace in self.parse() if traces is None else traces:
+            yield trace.dump_one_trace()
+
+
+EVENT_PATTERN = re.compile(r"(?P<event>\w+): *(?P<args>.*)", re.DOTALL)
+EVENT_ARG_PATTERN = re.compile(r"(\w+)=(\S*)")
+
+CHROME_CPU_PID = 0x7FFFFFFF  # Process holding a track of each CPU
+
+
+class ChromeTrace:
+    """Convert traces to the Chrome trace-event JSON format.
+
+    The traces are consumed in order, pairing tracing_mark_write B/E of a
+    thread and irq_handler_entry/exit of a CPU into complete ("X") slices
+    while streaming. Tasks switched in by sched_switch, or resumed as the
+    sched_waking notes of the binary log, become running slices on the
+    track of their CPU. Slices still open at the end are left as "B"
+    events, which the viewer extends to the end of the trace.
+    """
+
+    def __init__(self):
+        self.threads = dict()  # Name of each known tid
+        self.cpus = set()
+        self.marks = dict()  # Stack of (ts, func) of each tid
+        self.irqs = dict()  # Stack of (ts, irq) of each cpu
+        self.running = dict()  # (ts, tid, name) running on each cpu
+
+    @staticmethod
+    def event(**kwargs):
+        return json.dumps(kwargs, separators=(",", ":"))
+
+    def metadata(self, trace):
+        if self.threads.get(trace.tid) != trace.name:
+            self.threads[trace.tid] = trace.name
+            yield self.event(
+                name="thread_name",
+                ph="M",
+                pid=trace.tid,
+                tid=trace.tid,
+                args={"name": trace.name.strip(" \x00")},
+            )
 
-    def dump_trace(self):
-        formatted = ["# tracer: nop", "#"]
-        for trace in self.all_trace:
-            formatted.append(trace.dump_one_trace())
-        return formatted
+        if trace.cpu not in self.cpus:
+            if not self.cpus:
+                yield self.event(
+                    name="process_name",
+                    ph="M",
+                    pid=CHROME_CPU_PID,
+                    args={"name": "CPUs"},
+                )
+            self.cpus.add(trace.cpu)
+            yield self.event(
+                name="thread_name",
+                ph="M",
+                pid=CHROME_CPU_PID,
+                tid=trace.cpu,
+                args={"name": f"CPU {trace.cpu}"},
+            )
+
+    def switch(self, cpu, ts, tid=None, name=None):
+        """Close the running slice of cpu and start the one of tid"""
+        prev = self.running.pop(cpu, None)
+        if prev is not None:
+            start, prev_tid, prev_name = prev
+            yield self.event(
+                name=prev_name,
+                ph="X",
+                ts=start,
+                dur=round(max(ts - start, 0), 3),
+                pid=CHROME_CPU_PID,
+                tid=cpu,
+                args={"pid": prev_tid},
+            )
+
+        if tid is not None:
+            self.running[cpu] = (ts, tid, name)
+
+    def convert(self, trace):
+        """Yield the events of one trace"""
+        yield from self.metadata(trace)
+        ts = round(trace.time * 1000000, 3)
+        payload = trace.payload
+
+        if isinstance(payload, ATrace):
+            stack = self.marks.setdefault(trace.tid, [])
+            if payload.sign == "B":
+                stack.append((ts, payload.func))
+            elif payload.sign == "E" and stack:
+                start, func = stack.pop()
+                yield self.event(
+                    name=func,
+                    ph="X",
+                    ts=start,
+                    dur=round(max(ts - start, 0), 3),
+                    pid=trace.tid,
+                    tid=trace.tid,
+                )
+            return
+
+        ret = EVENT_PATTERN.match(payload.dump())
+        if ret is None:
+            return
+
+        event = ret["event"]
+        args = dict(EVENT_ARG_PATTERN.findall(ret["args"]))
+        if event == "irq_handler_entry":
+            self.irqs.setdefault(trace.cpu, []).append((ts, args.get("irq")))
+        elif event == "irq_handler_exit":
+            stack = self.irqs.get(trace.cpu)
+            if stack:
+                start, irq = stack.pop()
+                yield self.event(
+                    name=f"irq {irq}",
+                    ph="X",
+                    ts=start,
+                    dur=round(max(ts - start, 0), 3),
+                    pid=CHROME_CPU_PID,
+                    tid=trace.cpu,
+                    args={"irq": irq},
+                )
+        elif event == "sched_switch" and "next_pid" in args:
+            yield from self.switch(
+                trace.cpu,
+                ts,
+                int(args["next_pid"]),
+                args.get("next_comm", args["next_pid"]),
+            )
+        elif event == "sched_waking" and args.get("pid") == str(trace.tid):
+            # The binary log notes the resumed task itself as sched_waking
+            yield from self.switch(trace.cpu, ts, trace.tid, trace.name.strip(" \x00"))
+        else:
+            yield self.event(
+                name=event,
+                ph="i",
+                s="t",
+                ts=ts,
+                pid=trace.tid,
+                tid=trace.tid,
+                args=args,
+            )
+
+    def finish(self):
+        """Yield the slices still open, as B events"""
+        for tid, stack in self.marks.items():
+            for start, func in stack:
+                yield self.event(name=func, ph="B", ts=start, pid=tid, tid=tid)
+
+        for cpu, stack in self.irqs.items():
+            for start, irq in stack:
+                yield self.event(
+                    name=f"irq {irq}",
+                    ph="B",
+                    ts=start,
+                    pid=CHROME_CPU_PID,
+                    tid=cpu,
+                    args={"irq": irq},
+                )
+
+        for cpu, (start, tid, name) in self.running.items():
+            yield self.event(
+                name=name,
+                ph="B",
+                ts=start,
+                pid=CHROME_CPU_PID,
+                tid=cpu,
+                args={"pid": tid},
+            )
+
+    def dump_trace(self, traces):
+        """Yield the lines of a JSON array holding the events of traces"""
+        yield "["
+        sep = ""
+        for trace in traces:
+            for event in self.convert(trace):
+                yield sep + event
+                sep = ","
+        for event in self.finish():
+            yield sep + event
+            sep = ","
+        yield "]"
+
+
+class NoteDecoder:
+    """Decode binary notes with struct formats compiled once per note type.
+
+    Each note is unpacked straight from a memoryview of the log, producing
+    the same fields as the pycstruct definitions used before: pid and
+    systime are unsigned of size_long bytes, nst_ip is kept as a zero
+    padded hex string and nst_data as a character.
+    """
+
+    def __init__(self, size_long=4, config_endian_big=False):
+        order = ">" if config_endian_big else "<"
+        word = {2: "H", 4: "I", 8: "Q"}[size_long]
+        self.size_long = size_long
+        self.common = struct.Struct(f"{order}4B3{word}")
+        self.dump_string = struct.Struct(f"{order}{word}B")
+        self.irq = struct.Struct("B")
+
+    def decode(self, data, st: int):
+        (
+            nc_length,
+            nc_type,
+            nc_priority,
+            nc_cpu,
+            nc_pid,
+            nc_systime_sec,
+            nc_systime_nsec,
+        ) = self.common.unpack_from(data, st)
+        res = {
+            "nc_length": nc_length,
+            "nc_type": nc_type,
+            "nc_priority": nc_priority,
+            "nc_cpu": nc_cpu,
+            "nc_pid": nc_pid,
+            "nc_systime_sec": nc_systime_sec,
+            "nc_systime_nsec": nc_systime_nsec,
+        }
+
+        end = st + nc_length
+        st += self.common.size
+        if nc_type == NOTE_START:
+            # The name takes the rest of note, terminator included
+            res["nsa_name"] = bytes(data[st:end]).decode("latin-1")
+        elif nc_type == NOTE_DUMP_STRING:
+            ip, sign = self.dump_string.unpack_from(data, st)
+            res["nst_ip"] = "0x%0*x" % (self.size_long * 2, ip)
+            res["nst_data"] = chr(sign)
+        elif nc_type == NOTE_IRQ_ENTER or nc_type == NOTE_IRQ_LEAVE:
+            res["nih_irq"] = self.irq.unpack_from(data, st)[0]
+        else:
+            print(f"skipped note, nc_type={nc_type}")
+
+        return res
 
 
 class ParseBinaryLogTool:
@@ -280,66 +763,77 @@ class ParseBinaryLogTool:
         self.symbol_tables = SymbolTables(self.elf_nuttx_path)
         self.symbol_tables.parse_symbol()
         with open(self.binary_log_path, "rb") as f:
-            self.in_bytes = f.read()
-        self.parsed = list()
+            try:
+                self.in_bytes = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+            except ValueError:  # Empty file can't be mapped
+                self.in_bytes = b""
         self.task_name_dict = dict()
         self.size_long = size_long
         self.size_note_common = 3 + size_long * 3
         self.config_endian_big = config_endian_big
-
-    def parse_by_endian(self, lis):
-        res = [hex(e)[2:] for e in lis]  # strip prefix "0x"
-        res = [e if len(e) == 2 else "0" + e if len(e) == 1 else "00" for e in res]
-        if not self.config_endian_big:
-            res.reverse()
-        res = "0x" + "".join(res)
-        return int(res, 16), res
+        self.decoder = NoteDecoder(size_long, config_endian_big)
+        self.in_view = memoryview(self.in_bytes)
 
     def parse_one(self, st: int):
         if st >= len(self.in_bytes):
             print("error, index break bound")
-        one = pycstruct.StructDef()
-        one.add("uint8", "nc_length")
-        one.add("uint8", "nc_type")
-        one.add("uint8", "nc_priority")
-        one.add("uint8", "nc_cpu")
-        one.add("uint8", "nc_pid", self.size_long)
-        one.add("uint8", "nc_systime_sec", self.size_long)
-        one.add("uint8", "nc_systime_nsec", self.size_long)
-        res = one.deserialize(self.in_bytes, st)
-
-        # case type
-        if res["nc_type"] == 0:
-            one.add("uint8", "nsa_name", res["nc_length"] - self.size_note_common)
-        elif res["nc_type"] == 22:
-            one.add("uint8", "nst_ip", self.size_long)  # pointer of func
-            one.add("uint8", "nst_data")  # B|E
-        elif res["nc_type"] == 20:  # case: NOTE_IRQ_ENTER
-            one.add("uint8", "nih_irq")
-        elif res["nc_type"] == 21:  # case: NOTE_IRQ_LEAVE
-            one.add("uint8", "nih_irq")
-        else:
-            print(f'skipped note, nc_type={res["nc_type"]}')
-
-        res = one.deserialize(self.in_bytes, st)
-        # parse pid, systime ...
-        res["nc_pid"] = self.parse_by_endian(res["nc_pid"])[0]
-        res["nc_systime_sec"] = self.parse_by_endian(res["nc_systime_sec"])[0]
-        res["nc_systime_nsec"] = self.parse_by_endian(res["nc_systime_nsec"])[0]
-        if "nst_ip" in res:
-            res["nst_ip"] = self.parse_by_endian(res["nst_ip"])[1]
-
-        # parse cpu, name ...
-        if "nc_cpu" not in res:
-            res["nc_cpu"] = 0
+        res = self.decoder.decode(self.in_view, st)
         if "nsa_name" in res:
-            nsa_name = "".join(chr(i) for i in res["nsa_name"][:-1])
-            self.task_name_dict[res["nc_pid"]] = nsa_name
-        if "nst_data" in res:
-            res["nst_data"] = chr(res["nst_data"])
+            self.task_name_dict[res["nc_pid"]] = res["nsa_name"]
         return res
 
-    def track_one(self, one):  # print by case
+    def iter_notes(self, st=0, end=None):
+        """Yield the decoded notes in order, the log is mapped instead of read"""
+        end = len(self.in_bytes) if end is None else end
+        while st < end:
+            one = self.parse_one(st)
+            if one["nc_length"] == 0:
+                raise ValueError(f"invalid note length 0 at offset {st}")
+            yield one
+            st += one["nc_length"]
+
+    def iter_traces(self, st=0, end=None, columns=None):
+        """Yield the traces of notes, which are also added to columns if given"""
+        notes = self.iter_notes(st, end)
+        if columns is not None:
+            notes = columns.tee(notes)
+        for one in notes:
+            yield from self.track_one(one)
+
+    def split_chunks(self, count):
+        """Split the log at note boundaries into about count chunks.
+        Return (start, end, task_name_dict) of each chunk, with the task
+        names known at its start, as only the header of NOTE_START notes is
+        decoded while walking nc_length.
+        """
+        data = self.in_bytes
+        size = len(data)
+        step = max(min(-(-size // count), CHUNK_SIZE), 1)
+        names = dict(self.task_name_dict)
+        initial = dict(names)
+        chunks = []
+        start = st = 0
+        boundary = step
+        while st < size:
+            if st >= boundary:
+                chunks.append((start, st, initial))
+                initial = dict(names)
+                start = st
+                boundary = st + step
+
+            if data[st + 1] == NOTE_START:
+                one = self.decoder.decode(self.in_view, st)
+                names[one["nc_pid"]] = one["nsa_name"]
+
+            if data[st] == 0:
+                raise ValueError(f"invalid note length 0 at offset {st}")
+            st += data[st]
+
+        if start < size:
+            chunks.append((start, size, initial))
+        return chunks
+
+    def track_one(self, one):  # yield the trace of one note by case
         nc_type = one["nc_type"]
         nc_pid = one["nc_pid"]
         nc_cpu = one["nc_cpu"]
@@ -349,60 +843,334 @@ class ParseBinaryLogTool:
         )
 
         # case nc_type
-        a_model, other_model = None, None
-        if nc_type == 0:  # case: NOTE_START
-            payload = (
+        payload = None
+        if nc_type == NOTE_START:
+            payload = Other(
                 f"sched_wakeup_new: comm={nsa_name} pid={nc_pid} target_cpu={nc_cpu}"
             )
-            other_model = OtherModel(payload="").parse(payload)
-        if nc_type == 3:  # case: NOTE_RESUME
-            payload = f"sched_waking: comm={nsa_name} pid={nc_pid} target_cpu={nc_cpu}"
-            other_model = OtherModel(payload="").parse(payload)
-        if nc_type == 22:  # case: NOTE_DUMP_STRING
+        elif nc_type == NOTE_RESUME:
+            payload = Other(
+                f"sched_waking: comm={nsa_name} pid={nc_pid} target_cpu={nc_cpu}"
+            )
+        elif nc_type == NOTE_DUMP_STRING:
             func_name = self.symbol_tables.symbol_dict.get(
                 int(one["nst_ip"], 16), "no_func_name"
             )
-            payload = f'tracing_mark_write: {one["nst_data"]}|{nc_pid}|{func_name}'
-            a_model = ATraceModel(sign="", pid=-1, func="").parse(payload)
-        if nc_type == 20:  # case: NOTE_IRQ_ENTER
-            payload = f'irq_handler_entry: irq={one["nih_irq"]} name={one["nih_irq"]}'
-            other_model = OtherModel(payload="").parse(payload)
-        if nc_type == 21:  # case: NOTE_IRQ_LEAVE
-            payload = f'irq_handler_exit: irq={one["nih_irq"]} name={one["nih_irq"]}'
-            other_model = OtherModel(payload="").parse(payload)
-
-        for mod in [a_model, other_model]:
-            if mod is not None:
-                self.parsed.append(
-                    TraceModel(
-                        name=nsa_name,
-                        tid=nc_pid,
-                        cpu=nc_cpu,
-                        time=float_time,
-                        payload=mod,
-                    )
-                )
+            payload = ATrace(one["nst_data"], nc_pid, func_name)
+        elif nc_type == NOTE_IRQ_ENTER:
+            payload = Other(
+                f'irq_handler_entry: irq={one["nih_irq"]} name={one["nih_irq"]}'
+            )
+        elif nc_type == NOTE_IRQ_LEAVE:
+            payload = Other(
+                f'irq_handler_exit: irq={one["nih_irq"]} name={one["nih_irq"]}'
+            )
 
-    def parse_binary_log(self):
-        st = 0
-        while st < len(self.in_bytes):
-            one = self.parse_one(st)
-            self.track_one(one)
-            st += one["nc_length"]
+        if payload is not None:
+            yield TraceRecord(nsa_name, nc_pid, nc_cpu, float_time, payload)
+
+    def dump_lines(self, jobs=1, columns=None):
+        """Yield the trace lines in order, decoded by jobs processes. The
+        notes are also added to columns if given."""
+        if jobs <= 1:
+            for mod in self.iter_traces(columns=columns):
+                yield mod.dump_one_trace()
+            return
+
+        collect = columns is not None
+        chunks = [chunk + (collect,) for chunk in self.split_chunks(jobs * 4)]
+        with multiprocessing.Pool(
+            jobs,
+            initializer=init_decode_worker,
+            initargs=(
+                self.binary_log_path,
+                self.elf_nuttx_path,
+                self.size_long,
+                self.config_endian_big,
+            ),
+        ) as pool:
+            for lines, chunk_columns in pool.imap(decode_chunk, chunks):
+                if collect:
+                    columns.extend(chunk_columns)
+                yield from lines
+
+    def parse_binary_log(self, jobs=1, output_format="systrace", columns=None):
+        """Write the traces of the log, adding the notes to columns if given"""
+        if output_format == "json":
+            # Slices are paired in order, so decode in this process
+            lines = ChromeTrace().dump_trace(self.iter_traces(columns=columns))
+        else:
+            lines = self.dump_lines(jobs, columns)
         if self.out_path is not None:
-            with open(self.out_path, "wt") as f:
-                for mod in self.parsed:
-                    f.write(mod.dump_one_trace() + "\n")
+            with open(self.out_path, "wt", buffering=WRITE_BUFFER_SIZE) as f:
+                for line in lines:
+                    f.write(line + "\n")
         else:
-            for mod in self.parsed:
-                print(f"debug, dump one={mod.dump_one_trace()}")
+            for line in lines:
+                print(f"debug, dump one={line}")
+
+
+g_decode_tool = None  # ParseBinaryLogTool of a decoding worker process
+
+
+def init_decode_worker(binary_log_path, elf_nuttx_path, size_long, config_endian_big):
+    global g_decode_tool
+    g_decode_tool = ParseBinaryLogTool(
+        binary_log_path, elf_nuttx_path, None, size_long, config_endian_big
+    )
+
+
+def decode_chunk(chunk):
+    """Decode one chunk of binary log in worker, return its trace lines and
+    the TraceColumns of its notes if collect is set"""
+    start, end, task_name_dict, collect = chunk
+    g_decode_tool.task_name_dict = task_name_dict
+    columns = TraceColumns() if collect else None
+    traces = g_decode_tool.iter_traces(start, end, columns)
+    return [mod.dump_one_trace() for mod in traces], columns
+
+
+class TraceStore:
+    """Columnar store of binary trace notes, sorted by time.
+
+    Every note is one row of the columns: time in nanoseconds, cpu, pid,
+    note type and arg, which is the irq number of IRQ notes, the ip of
+    NOTE_DUMP_STRING notes and 0 otherwise. sign keeps the B/E character of
+    NOTE_DUMP_STRING and seq the position of the note in the log. Queries
+    are vectorized over the columns and time windows use binary search.
+
+    Usage:
+        columns = TraceColumns()  # Collected while writing the traces
+        tool.parse_binary_log(columns=columns)
+        store = columns.build()  # Or TraceStore.from_notes(tool.iter_notes())
+        store.save("trace.npz")
+        store = TraceStore.load("trace.npz")
+        rows = store.window(1.0, 2.0, cpu=1)  # Row indexes in time range
+        store.irq_histogram(bins=50)
+    """
+
+    COLUMNS = {
+        "time": "q",
+        "cpu": "H",
+        "pid": "q",
+        "type": "B",
+        "arg": "Q",
+        "sign": "B",
+    }
+
+    def __init__(self, columns, names=None):
+        if np is None:
+            raise RuntimeError("Please pip install numpy")
+
+        order = np.argsort(columns["time"], kind="stable")
+        self.columns = {name: column[order] for name, column in columns.items()}
+        self.columns.setdefault("seq", order)
+        self.names = names or {}  # pid -> task name
+        for name, column in self.columns.items():
+            setattr(self, name, column)
+
+    def __len__(self):
+        return len(self.time)
+
+    @classmethod
+    def from_notes(cls, notes):
+        """Build the store from the decoded notes of ParseBinaryLogTool"""
+        columns = TraceColumns()
+        for one in notes:
+            columns.add(one)
+        return columns.build()
+
+    def save(self, path):
+        pids = np.array(list(self.names), dtype=np.int64)
+        names = np.array(list(self.names.values()), dtype=str)
+        np.savez(path, names_pid=pids, names=names, **self.columns)
+
+    @classmethod
+    def load(cls, path):
+        with np.load(path) as data:
+            columns = {name: data[name] for name in data.files}
+        names = columns.pop("names").tolist()
+        names = dict(zip(columns.pop("names_pid").tolist(), names))
+        return cls(columns, names)
+
+    def window(self, start, end, cpu=None, pid=None, note_type=None):
+        """Return the row indexes with time in [start, end) seconds"""
+        lo, hi = np.searchsorted(self.time, [start * 1e9, end * 1e9])
+        rows = np.arange(lo, hi)
+        mask = np.ones(len(rows), dtype=bool)
+        for column, value in ((self.cpu, cpu), (self.pid, pid), (self.type, note_type)):
+            if value is not None:
+                mask &= column[lo:hi] == value
+        return rows[mask]
+
+    def pairs(self, begin, end, key):
+        """Pair each begin note with the next begin or end note on the same
+        cpu, return (rows of begin, durations in ns). Pairs are kept only when
+        the next note is an end note with the same key, if key is given.
+        """
+        rows = np.flatnonzero((self.type == begin) | (self.type == end))
+        order = np.lexsort((rows, self.cpu[rows]))  # By cpu, then by time
+        rows = rows[order]
+
+        first, second = rows[:-1], rows[1:]
+        mask = (self.type[first] == begin) & (self.cpu[first] == self.cpu[second])
+        if key is not None:
+            mask &= (self.type[second] == end) & (key[first] == key[second])
+        first, second = first[mask], second[mask]
+        return first, self.time[second] - self.time[first]
+
+    def run_slices(self):
+        """Return (rows of NOTE_RESUME, durations in ns) that each task ran
+        for, until the next NOTE_SUSPEND or NOTE_RESUME on that cpu.
+        """
+        return self.pairs(NOTE_RESUME, NOTE_SUSPEND, None)
+
+    def sched_latency(self):
+        """Return {pid: array of ns} a task waited from being suspended to
+        running again. The trace has no wakeup note, so the latency includes
+        the time the task was blocked.
+        """
+        rows = np.flatnonzero((self.type == NOTE_SUSPEND) | (self.type == NOTE_RESUME))
+        order = np.lexsort((rows, self.pid[rows]))  # By pid, then by time
+        rows = rows[order]
+
+        first, second = rows[:-1], rows[1:]
+        mask = (
+            (self.type[first] == NOTE_SUSPEND)
+            & (self.type[second] == NOTE_RESUME)
+            & (self.pid[first] == self.pid[second])
+        )
+        pids = self.pid[first[mask]]
+        latency = self.time[second[mask]] - self.time[first[mask]]
+        return {int(pid): latency[pids == pid] for pid in np.unique(pids)}
+
+    def irq_durations(self):
+        """Return (irq numbers, durations in ns) of IRQ enter/leave pairs.
+        Nested IRQs leave the outer one unpaired.
+        """
+        rows, durations = self.pairs(NOTE_IRQ_ENTER, NOTE_IRQ_LEAVE, self.arg)
+        return self.arg[rows], durations
+
+    def irq_histogram(self, irq=None, bins=20):
+        """Return numpy histogram (counts, edges) of IRQ durations in ns"""
+        irqs, durations = self.irq_durations()
+        if irq is not None:
+            durations = durations[irqs == irq]
+        return np.histogram(durations, bins=bins)
+
+    def cpu_utilization(self, start=None, end=None, idle_pids=(0,)):
+        """Return {cpu: busy ratio} in [start, end) seconds, the time spent in
+        tasks other than the idle ones.
+        """
+        if len(self) == 0:
+            return {}
+
+        rows, durations = self.run_slices()
+        begin = self.time[rows]
+        start = self.time[0] if start is None else int(start * 1e9)
+        end = self.time[-1] if end is None else int(end * 1e9)
+        busy = np.clip(begin + durations, start, end) - np.clip(begin, start, end)
+        busy[np.isin(self.pid[rows], idle_pids)] = 0
+
+        result = {}
+        for cpu in np.unique(self.cpu):
+            total = busy[self.cpu[rows] == cpu].sum()
+            result[int(cpu)] = float(total) / max(end - start, 1)
+        return result
+
+
+class TraceColumns:
+    """Columns of a TraceStore, collected note by note while decoding"""
+
+    def __init__(self):
+        if np is None:
+            raise RuntimeError("Please pip install numpy")
+
+        self.columns = {
+            name: array.array(code) for name, code in TraceStore.COLUMNS.items()
+        }
+        self.names = {}  # pid -> task name
+
+    def add(self, one):
+        columns = self.columns
+        nc_type = one["nc_type"]
+        columns["time"].append(
+            one["nc_systime_sec"] * 1000000000 + one["nc_systime_nsec"]
+        )
+        columns["cpu"].append(one["nc_cpu"])
+        columns["pid"].append(one["nc_pid"])
+        columns["type"].append(nc_type)
+        if nc_type == NOTE_DUMP_STRING:
+            columns["arg"].append(int(one["nst_ip"], 16))
+            columns["sign"].append(ord(one["nst_data"]))
+        else:
+            columns["arg"].append(one.get("nih_irq", 0))
+            columns["sign"].append(0)
+            if nc_type == NOTE_START:
+                self.names[one["nc_pid"]] = one["nsa_name"].rstrip("\0")
+
+    def tee(self, notes):
+        """Yield notes, adding each of them to the columns"""
+        for one in notes:
+            self.add(one)
+            yield one
+
+    def extend(self, other):
+        """Append the columns collected from the following part of the log"""
+        for name, column in self.columns.items():
+            column.extend(other.columns[name])
+        self.names.update(other.names)
+
+    def build(self):
+        return TraceStore(
+            {name: np.array(column) for name, column in self.columns.items()},
+            self.names,
+        )
+
+
+PRINTF_PATTERN = re.compile(
+    r"(%[-+#0\s]*[\d|\*]*(?:\.[\d|\*])?[lhjztL]?[diufFeEgGxXoscpn%])"
+)
+
+
+class PrintfFormat:
+    """A printf format string compiled for decoding its arguments.
+
+    steps keeps the (part, handler) of each conversion, called in order like
+    TraceDecoder.printf always did. When all the arguments have fixed size,
+    args is the struct unpacking them at once and converters turns each
+    unpacked value into its printf argument.
+    """
+
+    __slots__ = ("format", "string", "steps", "args", "converters")
+
+    def __init__(self, format, string, steps, args=None, converters=None):
+        self.format = format
+        self.string = string
+        self.steps = steps
+        self.args = args
+        self.converters = converters
 
 
 class TraceDecoder(SymbolTables):
     def __init__(self, elffile):
         super().__init__(elffile)
-        self.data = b""
+        self.data = bytearray()
+        self.formats = dict()  # PrintfFormat of each format string
+        self.format_addrs = dict()  # PrintfFormat of each npt_fmt address
         self.typeinfo["time_t"] = "int%d" % (self.get_typesize("time_t") * 8)
+        self.printf_struct = self.note_printf_define(0)
+        self.printf_type = bytes([NOTE_DUMP_PRINTF])
+
+        # State of live serial decoding, see tty_received()
+        self.ring = collections.deque()  # Chunks of data read from serial
+        self.ring_bytes = 0
+        self.ring_ready = threading.Condition()
+        self.stopped = threading.Event()
+        self.received = 0
+        self.decoded = 0
+        self.dropped = 0  # Bytes dropped by ring buffer overflow
+        self.skipped = 0  # Bytes skipped while resynchronizing
 
     def note_common_define(self):
         note_common = pycstruct.StructDef(alignment=4)
@@ -529,35 +1297,103 @@ class TraceDecoder(SymbolTables):
     }
 
     patterns = {re.compile(pattern): func for pattern, func in conversions.items()}
+    patterns_int = re.compile(
+        r"%([-+ #0]*)?(\d+|\*)?(\.)?(\d+|\*)?([hljzt]|ll|hh)?([diuxXop])"
+    )
+    patterns_float = re.compile(r"%([-+ #0]*)?(\d+|\*)?(\.)?(\d+|\*)?(L)?([fFeEgGaA])")
+
+    def compile_conversion(self, handler, part):
+        """Return (struct format, converter) of a fixed size conversion, the
+        same as handler would decode, or None if its size depends on data"""
+        if handler is TraceDecoder.extract_point:
+            length = 4 if self.typeinfo["size_t"] == "int32" else 8
+            return "I" if length == 4 else "Q", lambda value: f"{value:x}"
+
+        if handler is TraceDecoder.extract_float:
+            pattern = self.patterns_float.match(part).groups()
+            if pattern[4] == "L" or self.elfinfo["byteorder"] != "little":
+                return None
+            return "d", lambda value: part % value
+
+        if handler is TraceDecoder.extract_int:
+            pattern = self.patterns_int.match(part).groups()
+            if pattern[1] == "*" or pattern[5] not in "diuxXoO":
+                return None
+
+            format = "%" if pattern[0] is None else "%" + pattern[0]
+            if pattern[4] == "l" or pattern[4] == "z" or pattern[4] == "t":
+                length = 4 if self.typeinfo["size_t"] == "int32" else 8
+            elif pattern[4] == "ll":
+                length = 8
+            elif pattern[4] == "h":
+                length = 2
+            elif pattern[4] == "hh":
+                length = 1
+            else:
+                length = 4
+            if pattern[1] is not None:
+                format += pattern[1]
+            format += pattern[5]
+
+            code = {1: "b", 2: "h", 4: "i", 8: "q"}[length]
+            if pattern[5] not in "di":
+                code = code.upper()
+            return code, lambda value: format % value
+
+        if handler is self.conversions[r"%c"]:
+            return "B", chr
+
+        return None
+
+    def compile_format(self, format):
+        """Split format into conversions once, return its PrintfFormat"""
+        compiled = self.formats.get(format)
+        if compiled is not None:
+            return compiled
+
+        fmt = []
+        steps = []
+        for part in PRINTF_PATTERN.split(format):
+            if "%" not in part:
+                fmt.append(part)
+                continue
+
+            for pattern, handler in self.patterns.items():
+                if pattern.match(part):
+                    steps.append((part, handler))
+                    fmt.append("%c" if handler is self.conversions[r"%c"] else "%s")
+                    break
+            else:
+                fmt.append(part)
+
+        compiled = PrintfFormat(format, "".join(fmt), steps)
+        args = [self.compile_conversion(handler, part) for part, handler in steps]
+        if None not in args:
+            order = "<" if self.elfinfo["byteorder"] == "little" else ">"
+            compiled.args = struct.Struct(order + "".join(arg[0] for arg in args))
+            compiled.converters = [arg[1] for arg in args]
+
+        self.formats[format] = compiled
+        return compiled
 
     def printf(self, format, data):
         try:
-            fmt = []
-            values = []
-
-            parts = [
-                part
-                for part in re.split(
-                    r"(%[-+#0\s]*[\d|\*]*(?:\.[\d|\*])?[lhjztL]?[diufFeEgGxXoscpn%])",
-                    format,
-                )
-            ]
-            for part in parts:
-                if "%" not in part:
-                    fmt.append(part)
-                    continue
-
-                for pattern, handler in self.patterns.items():
-                    if pattern.match(part):
-                        part, length, value = handler(self, part, data)
-                        values.append(value)
-                        fmt.append(part)
-                        data = data[length:]
-                        break
-                else:
-                    fmt.append(part)
+            compiled = self.compile_format(format)
+            if compiled.args is not None and len(data) >= compiled.args.size:
+                values = [
+                    converter(value)
+                    for converter, value in zip(
+                        compiled.converters, compiled.args.unpack_from(data)
+                    )
+                ]
+            else:
+                values = []
+                for part, handler in compiled.steps:
+                    _, length, value = handler(self, part, data)
+                    values.append(value)
+                    data = data[length:]
 
-            return "".join(fmt) % tuple(values)
+            return compiled.string % tuple(values)
         except Exception as e:
             logger.error(f"format failed: {e}")
 
@@ -571,48 +1407,146 @@ class TraceDecoder(SymbolTables):
         payload["cpu"] = (
             0 if "nc_cpu" not in note["npt_cmn"] else note["npt_cmn"]["nc_cpu"]
         )
-        payload["format"] = self.readstring(note["npt_fmt"])
+        compiled = self.format_addrs.get(note["npt_fmt"])
+        if compiled is None:
+            compiled = self.compile_format(self.readstring(note["npt_fmt"]))
+            self.format_addrs[note["npt_fmt"]] = compiled
+        payload["format"] = compiled.format
         prefix = "[{time:.9f}] [{pid}] [CPU{cpu}]: ".format(**payload)
-        string = self.printf(payload["format"], note["npt_data"]).rstrip("\n")
+        string = self.printf(compiled.format, note["npt_data"]).rstrip("\n")
         logger.info(prefix + string)
 
+    def resync(self, data, pos):
+        """Return the offset of the next valid printf note header after pos,
+        counting the bytes skipped"""
+        start = index = pos
+        size = self.printf_struct.size()
+        while True:
+            # The type byte follows the length byte of the header
+            index = data.find(self.printf_type, index + 2)
+            if index < 0:
+                # Keep the last byte, it may be the length of a note to come
+                pos = max(len(data) - 1, start + 1)
+                break
+            if data[index - 1] >= size:
+                pos = index - 1
+                break
+            index -= 1
+
+        self.skipped += pos - start
+        return pos
+
     def parse_note(self, rawdata=None):
-        while len(self.data) > 0:
-            data = self.data if rawdata is None else rawdata
+        """Decode the complete notes buffered in self.data, the incomplete
+        note at the end is kept until more data arrives"""
+        if rawdata is not None:
+            self.data += rawdata
+
+        data = self.data
+        size = self.printf_struct.size()
+        pos = 0
+        while len(data) - pos >= 2:
+            nc_length = data[pos]
+            if data[pos + 1] != NOTE_DUMP_PRINTF or nc_length < size:
+                logger.debug(f"invalid note header at {pos}: {data[pos]:#x}")
+                pos = self.resync(data, pos)
+                continue
+
+            if len(data) - pos < nc_length:
+                break
+
             try:
-                common_struct = self.note_common_define()
-                if len(data) < common_struct.size():
-                    return
-                common_note = common_struct.deserialize(data)
-                nc_length = common_note["nc_length"]
-                if nc_length < common_struct.size():
-                    raise ValueError("Invalid note length")
-
-                if common_note["nc_type"] == 24:
-                    note_struct = self.note_printf_define(0)
-                    length = nc_length - note_struct.size()
-                    note = note_struct.deserialize(data)
-                    note["npt_data"] = data[
-                        note_struct.size() : note_struct.size() + length
-                    ]
-                    self.print_format(note)
-                else:
-                    raise ValueError("Invalid note type")
+                note = self.printf_struct.deserialize(bytes(data[pos : pos + size]))
+                note["npt_data"] = bytes(data[pos + size : pos + nc_length])
+                self.print_format(note)
             except Exception as e:
-                logger.debug(f"skip one byte, data: {hex(self.data[0])} {e}")
-                self.data = data[1:]
+                logger.debug(f"skip invalid note at {pos}: {e}")
+                pos = self.resync(data, pos)
                 continue
 
-            self.data = data[nc_length:]
+            pos += nc_length
+            self.decoded += 1
+
+        del data[:pos]
+
+    def read_serial(self, ser):
+        """Reader thread, queue the data of ser into the ring buffer"""
+        try:
+            while not self.stopped.is_set():
+                data = ser.read(ser.in_waiting or 1)
+                if not data:
+                    continue
 
-    def tty_received(self):
+                with self.ring_ready:
+                    self.ring.append(data)
+                    self.ring_bytes += len(data)
+                    self.received += len(data)
+                    while self.ring_bytes > RING_BUFFER_SIZE:
+                        # Decoder falls behind, drop the oldest data
+                        dropped = self.ring.popleft()
+                        self.ring_bytes -= len(dropped)
+                        self.dropped += len(dropped)
+                    self.ring_ready.notify()
+        except serial.SerialException as e:
+            logger.error(f"serial read failed: {e}")
+        finally:
+            self.stopped.set()
+            with self.ring_ready:
+                self.ring_ready.notify()
+
+    def decode_serial(self):
+        """Decoder thread, decode the data queued in the ring buffer"""
         while True:
-            data = ser.read(16384)
-            if len(data) == 0:
-                continue
-            self.data += data
-            logger.debug(f"serial buffer data: {self.data.hex()}")
-            decode.parse_note()
+            with self.ring_ready:
+                while not self.ring and not self.stopped.is_set():
+                    self.ring_ready.wait()
+                if not self.ring:
+                    break
+                chunks = list(self.ring)
+                self.ring.clear()
+                self.ring_bytes = 0
+
+            for chunk in chunks:
+                self.data += chunk
+            self.parse_note()
+
+    def tty_received(self, ser):
+        """Decode the notes received from serial ser until interrupted.
+        A reader thread blocks on ser and a decoder thread parses the data,
+        the throughput is logged every STATS_INTERVAL seconds in verbose mode.
+        """
+        ser.timeout = SERIAL_TIMEOUT
+        threads = [
+            threading.Thread(target=self.read_serial, args=(ser,), daemon=True),
+            threading.Thread(target=self.decode_serial, daemon=True),
+        ]
+        for thread in threads:
+            thread.start()
+
+        begin = last = time.monotonic()
+        received = 0
+        try:
+            while not self.stopped.wait(STATS_INTERVAL):
+                now = time.monotonic()
+                logger.debug(
+                    f"serial: {(self.received - received) / (now - last):.0f} B/s, "
+                    f"received {self.received}, decoded {self.decoded} notes, "
+                    f"dropped {self.dropped} bytes, skipped {self.skipped} bytes"
+                )
+                received = self.received
+                last = now
+        except KeyboardInterrupt:
+            self.stopped.set()
+
+        for thread in threads:
+            thread.join()
+
+        elapsed = time.monotonic() - begin
+        logger.info(
+            f"serial: received {self.received} bytes in {elapsed:.1f}s, "
+            f"decoded {self.decoded} notes, dropped {self.dropped} bytes, "
+            f"skipped {self.skipped} bytes"
+        )
 
 
 def parse_arguments():
@@ -624,6 +1558,25 @@ def parse_arguments():
         "-b", "--baudrate", help="Physical serial device baud rate", default=115200
     )
     parser.add_argument("-v", "--verbose", help="verbose output", action="store_true")
+    parser.add_argument(
+        "-s",
+        "--store",
+        help="also save binary trace notes to a columnar store (.npz)",
+    )
+    parser.add_argument(
+        "-j",
+        "--jobs",
+        help="number of processes decoding binary trace, default 1",
+        type=int,
+        default=1,
+    )
+    parser.add_argument(
+        "-f",
+        "--format",
+        help="output format, systrace text or Chrome trace-event json",
+        choices=("systrace", "json"),
+        default="systrace",
+    )
     parser.add_argument(
         "-o",
         "--output",
@@ -655,18 +1608,23 @@ if __name__ == "__main__":
                 symbol = SymbolTables(args.elf)
                 symbol.parse_symbol()
 
-                for onetrace in trace.all_trace:
-                    if isinstance(onetrace.payload, ATraceModel) and re.fullmatch(
-                        r"^0x[0-9a-fA-F]+$", onetrace.payload.func
-                    ):
-                        onetrace.payload.func = symbol.addr2symbol(
-                            int(onetrace.payload.func, 16)
-                        )
-
-                lines = trace.dump_trace()
-                with open(out_path, "w") as out:
-                    out.write("\n".join(lines))
-                    out.write("\n")
+                def symbolize(traces):
+                    for onetrace in traces:
+                        if isinstance(onetrace.payload, ATrace) and re.fullmatch(
+                            r"^0x[0-9a-fA-F]+$", onetrace.payload.func
+                        ):
+                            onetrace.payload.func = symbol.addr2symbol(
+                                int(onetrace.payload.func, 16)
+                            )
+                        yield onetrace
+
+                if args.format == "json":
+                    lines = ChromeTrace().dump_trace(symbolize(trace.parse()))
+                else:
+                    lines = trace.dump_trace(symbolize(trace.parse()))
+                with open(out_path, "w", buffering=WRITE_BUFFER_SIZE) as out:
+                    for line in lines:
+                        out.write(line + "\n")
                     print(os.path.abspath(out_path))
         else:
             print("trace log type is binary")
@@ -678,7 +1636,11 @@ if __name__ == "__main__":
                     args.trace, args.elf, out_path
                 )
                 parse_binary_log_tool.symbol_tables.parse_symbol()
-                parse_binary_log_tool.parse_binary_log()
+                columns = TraceColumns() if args.store else None
+                parse_binary_log_tool.parse_binary_log(args.jobs, args.format, columns)
+                if args.store:
+                    columns.build().save(args.store)
+                    print(os.path.abspath(args.store))
             else:
                 print("error, please add elf file path")
 
@@ -689,5 +1651,4 @@ if __name__ == "__main__":
 
         decode = TraceDecoder(args.elf)
         with serial.Serial(args.device, baudrate=args.baudrate) as ser:
-            ser.timeout = 0
-            decode.tty_received()
+            decode.tty_received(ser)